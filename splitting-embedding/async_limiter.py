@@ -0,0 +1,52 @@
+import asyncio
+import weakref
+from typing import Any, Awaitable, Optional
+
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_TIMEOUT = 30.0
+
+class AsyncLimiter:
+    """
+        Bounds the number of concurrent coroutines and applies a timeout.
+
+        One semaphore is kept per event loop, so a limiter can be shared by
+        module-level helpers that run on different loops.
+
+        Args:
+        max_concurrency (int): The maximum number of coroutines running at once.
+        timeout (Optional[float]): The default timeout in seconds, including the
+        time spent waiting for a slot. None means no timeout.
+    """
+
+    def __init__(self, max_concurrency:int=DEFAULT_MAX_CONCURRENCY, timeout:Optional[float]=DEFAULT_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def run(self, awaitable:Awaitable[Any], timeout:Optional[float]=None) -> Any:
+        """
+            Awaits an awaitable once a slot is free.
+
+            Args:
+            awaitable (Awaitable[Any]): The coroutine to run.
+            timeout (Optional[float]): The timeout in seconds. Defaults to the limiter timeout.
+
+            Returns:
+            Any: The result of the awaitable.
+
+            Raises:
+            asyncio.TimeoutError: If the slot wait plus the call exceed the timeout.
+        """
+        async def limited() -> Any:
+            async with self._semaphore():
+                return await awaitable
+
+        return await asyncio.wait_for(limited(), timeout if timeout is not None else self.timeout)
@@ -0,0 +1,268 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, List, Optional, Union
+
+from embedding_pipeline import DEFAULT_MAX_WORKERS
+from ingest_pipeline import DEFAULT_QUEUE_SIZE, DEFAULT_UPSERT_BATCH_SIZE, stream_records_to_vector_store
+
+# Vertex AI Vector Search reads every .json file under contents_delta_uri
+# Docs: https://cloud.google.com/vertex-ai/docs/vector-search/setup/format-structure
+DEFAULT_SHARD_SIZE = 100_000
+BATCH_UPDATE_PREFIX = "batch_updates"
+
+class LocalBucket:
+    """
+        A local filesystem stand-in for a GCS bucket, to run bulk loads offline.
+
+        Args:
+        root (str): The directory standing in for the bucket.
+    """
+
+    def __init__(self, root:str):
+        self.root = Path(root)
+
+    def open(self, blob_name:str) -> IO[str]:
+        path = self.root / blob_name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path.open("w", encoding="utf-8")
+
+    def uri(self, prefix:str) -> str:
+        return str(self.root / prefix)
+
+class GCSBucket:
+    """
+        A GCS bucket that shard files are streamed into.
+
+        Args:
+        bucket_name (str): The bucket name, without gs://.
+    """
+
+    def __init__(self, bucket_name:str):
+        from google.cloud import storage
+
+        self.bucket_name = bucket_name
+        self._bucket = storage.Client().bucket(bucket_name)
+
+    def open(self, blob_name:str) -> IO[str]:
+        return self._bucket.blob(blob_name).open("w", content_type="application/json")
+
+    def uri(self, prefix:str) -> str:
+        return f"gs://{self.bucket_name}/{prefix}"
+
+def to_datapoint(node:Any) -> Dict[str, Any]:
+    """
+        Converts an embedded node to a Vector Search batch update record.
+
+        The restricts are built the way VertexAIVectorStore builds them for
+        online upserts: from node_to_metadata_dict, so they include the
+        _node_content restrict the store rebuilds nodes from at query time,
+        with strings and lists of strings as restricts and numbers (ints
+        too) as value_float numeric restricts. Vectors loaded in bulk are
+        then returned and filtered exactly like ones added online.
+
+        Args:
+        node (Any): The node, with an embedding.
+
+        Returns:
+        Dict[str, Any]: The datapoint.
+    """
+    from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+    restricts = []
+    numeric_restricts = []
+    for key, value in node_to_metadata_dict(node, remove_text=False, flat_metadata=False).items():
+        if isinstance(value, str):
+            restricts.append({"namespace": key, "allow": [value]})
+        elif isinstance(value, list) and all(isinstance(v, str) for v in value):
+            restricts.append({"namespace": key, "allow": value})
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            numeric_restricts.append({"namespace": key, "value_float": float(value)})
+        else:
+            logging.warning(f"Skipping metadata {key} of node {node.node_id}: {type(value).__name__} is not a valid restrict")
+
+    datapoint = {
+        "id": node.node_id,
+        "embedding": list(node.embedding),
+        "embedding_metadata": {"text": node.get_content(), **node.metadata},
+    }
+    if restricts:
+        datapoint["restricts"] = restricts
+    if numeric_restricts:
+        datapoint["numeric_restricts"] = numeric_restricts
+    return datapoint
+
+class ShardedIndexWriter:
+    """
+        Writes embedded nodes to sharded JSONL files for a batch index update.
+
+        Has the add() method of a Vector Store, so it can be used as the sink
+        of stream_records_to_vector_store. A new shard is started every
+        shard_size datapoints.
+
+        Args:
+        bucket (Union[GCSBucket, LocalBucket]): The bucket to write to.
+        prefix (str): The directory the shards are written under.
+        shard_size (int): The maximum number of datapoints per shard.
+
+        Attributes:
+        shards (List[str]): The blob names written.
+        count (int): The number of datapoints written.
+    """
+
+    def __init__(self, bucket:Union[GCSBucket, LocalBucket], prefix:str, shard_size:int=DEFAULT_SHARD_SIZE):
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/")
+        self.shard_size = shard_size
+        self.shards: List[str] = []
+        self.count = 0
+        self._file: Optional[IO[str]] = None
+        self._in_shard = 0
+        self._lock = threading.Lock()
+
+    @property
+    def uri(self) -> str:
+        return self.bucket.uri(self.prefix)
+
+    def add(self, nodes:List[Any], **kwargs:Any) -> List[str]:
+        """
+            Appends nodes to the current shard.
+
+            Args:
+            nodes (List[Any]): The embedded nodes.
+
+            Returns:
+            List[str]: The node IDs.
+        """
+        lines = [json.dumps(to_datapoint(node)) + "\n" for node in nodes]
+        with self._lock:
+            for line in lines:
+                if self._file is None or self._in_shard >= self.shard_size:
+                    self._roll()
+                self._file.write(line)
+                self._in_shard += 1
+            self.count += len(lines)
+        return [node.node_id for node in nodes]
+
+    def _roll(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        blob_name = f"{self.prefix}/part-{len(self.shards):05d}.json"
+        self._file = self.bucket.open(blob_name)
+        self._in_shard = 0
+        self.shards.append(blob_name)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def bulk_load_records(
+    index:Any,
+    embed_model:Any,
+    source:Union[Iterable[Dict[str, Any]], str, Path],
+    embed_field:str,
+    bucket:Union[GCSBucket, LocalBucket],
+    prefix:Optional[str]=None,
+    shard_size:int=DEFAULT_SHARD_SIZE,
+    batch_size:int=DEFAULT_UPSERT_BATCH_SIZE,
+    queue_size:int=DEFAULT_QUEUE_SIZE,
+    max_workers:int=DEFAULT_MAX_WORKERS,
+    source_name:Optional[str]=None,
+    is_complete_overwrite:bool=False,
+    lexical_index:Any=None,
+    id_field:Optional[str]=None
+) -> Dict[str, Any]:
+    """
+        Embeds records into sharded files in a bucket and triggers one batch
+        index update from them.
+
+        Records are read and embedded by the same pipeline as the online
+        ingest, and node IDs are derived the same way, so vectors loaded in
+        bulk are upserted by later online adds of the same records.
+
+        If any batch fails to embed or write, the index is not updated and a
+        RuntimeError is raised, so a partial load never replaces the index.
+        The lexical_index is only saved once the update has succeeded, and
+        its changes are discarded otherwise.
+
+        Args:
+        index (Any): The aiplatform.MatchingEngineIndex to update.
+        embed_model (Any): The embedding model.
+        source (Union[Iterable[Dict[str, Any]], str, Path]): The records, or a .jsonl/.csv path.
+        embed_field (str): The field to embed; the other fields become restricts.
+        bucket (Union[GCSBucket, LocalBucket]): The bucket the shards are written to.
+        prefix (Optional[str]): The directory for this update. Defaults to a new timestamped directory.
+        shard_size (int): The maximum number of datapoints per shard.
+        batch_size (int): The number of records per embedding batch.
+        queue_size (int): The maximum number of batches buffered between stages.
+        max_workers (int): The maximum number of concurrent embedding requests.
+        source_name (Optional[str]): The name node IDs are derived from.
+        is_complete_overwrite (bool): Whether the update replaces the whole index.
+        lexical_index (Any): An index with add(nodes), save() and discard(), filled with the written nodes.
+        id_field (Optional[str]): A field that uniquely identifies each record. Node IDs are derived
+        from the whole record if None.
+
+        Returns:
+        Dict[str, Any]: The contents URI, shard names, datapoint count and per-stage stats.
+
+        Raises:
+        RuntimeError: If any batch failed to embed or write; the index is left unchanged.
+    """
+    prefix = prefix or f"{BATCH_UPDATE_PREFIX}/{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+    writer = ShardedIndexWriter(bucket, prefix, shard_size)
+    try:
+        stats = stream_records_to_vector_store(
+            writer,
+            embed_model,
+            source,
+            embed_field,
+            batch_size=batch_size,
+            queue_size=queue_size,
+            max_workers=max_workers,
+            source_name=source_name,
+            lexical_index=lexical_index,
+            id_field=id_field,
+            save_lexical_index=False,
+        )
+    finally:
+        writer.close()
+
+    failed_batches = stats["embed"]["failed_batches"] + stats["upsert"]["failed_batches"]
+    if failed_batches:
+        if lexical_index is not None:
+            lexical_index.discard()
+        # the shards are incomplete; updating from them would drop records, or with
+        # is_complete_overwrite the rest of the index
+        raise RuntimeError(
+            f"Not updating index {index.display_name}: {stats['embed']['failed_batches']} embed and "
+            f"{stats['upsert']['failed_batches']} write batches failed; the partial shards are at {writer.uri}"
+        )
+
+    if not writer.count:
+        logging.info("No records to load, skipping the batch index update")
+    else:
+        start = time.perf_counter()
+        logging.info(f"Updating index {index.display_name} from {len(writer.shards)} shards at {writer.uri} ...")
+        try:
+            index.update_embeddings(contents_delta_uri=writer.uri, is_complete_overwrite=is_complete_overwrite)
+        except Exception:
+            if lexical_index is not None:
+                lexical_index.discard()
+            raise
+        logging.info(
+            f"Updated index {index.display_name} with {writer.count} datapoints in {time.perf_counter() - start:.2f}s"
+        )
+    if lexical_index is not None:
+        lexical_index.save()
+
+    return {
+        "contents_delta_uri": writer.uri,
+        "shards": writer.shards,
+        "datapoints": writer.count,
+        "stages": stats,
+    }
@@ -0,0 +1,260 @@
+"""
+Offline ingest and retrieval benchmark for gcp_index_embed.py.
+
+Runs the ingest and similarity search functions against FakeEmbedding and
+LocalVectorStore, so no GCP resources are needed, and saves the results as
+JSON. Pass --compare with an earlier results file to print the change.
+
+    python benchmark.py --records 20000 --queries 500 --latency 0.05 --output bench.json
+    python benchmark.py --output bench_new.json --compare bench.json
+    python benchmark.py --metrics --output bench_spans.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from fake_embedding import FakeEmbedding
+from gcp_index_embed import (
+    add_nodes_to_vector_store,
+    add_records_to_vector_store_with_metadata,
+    setup_local_vector_store,
+    similarity_search_with_filters,
+    similarity_search_without_filters,
+)
+from instrumentation import enable_metrics, metrics
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilter
+
+WORDS = (
+    "denim cotton linen wool knit shirt jeans sweater jacket coat dress skirt "
+    "blue white green black red navy slim relaxed classic vintage warm light "
+    "breathable durable soft cozy crisp oversized tailored casual formal"
+).split()
+COLORS = ["blue", "white", "green", "black", "red"]
+SEASONS = ["spring", "summer", "fall", "winter"]
+
+def make_records(count:int, words_per_record:int=40, seed:int=0) -> List[Dict[str, Any]]:
+    """
+        Builds a synthetic product catalog.
+
+        Args:
+        count (int): The number of records.
+        words_per_record (int): The number of words per description.
+        seed (int): The random seed.
+
+        Returns:
+        List[Dict[str, Any]]: Records with description, price, color and season.
+    """
+    rng = random.Random(seed)
+    return [
+        {
+            "description": f"SKU-{i} " + " ".join(rng.choices(WORDS, k=words_per_record)),
+            "price": round(rng.uniform(5, 200), 2),
+            "color": rng.choice(COLORS),
+            "season": rng.sample(SEASONS, k=rng.randint(1, 3)),
+        }
+        for i in range(count)
+    ]
+
+def percentiles(samples:List[float]) -> Dict[str, float]:
+    """
+        Summarizes latency samples in milliseconds.
+
+        Args:
+        samples (List[float]): Latencies in seconds.
+
+        Returns:
+        Dict[str, float]: p50, p95, p99, mean and max in milliseconds.
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(fraction:float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        "p50_ms": round(at(0.50), 3),
+        "p95_ms": round(at(0.95), 3),
+        "p99_ms": round(at(0.99), 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+def peak_rss_mb() -> float:
+    """
+        Returns the peak resident set size of this process.
+
+        Returns:
+        float: The peak RSS in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return round(peak / (1 << 20) if sys.platform == "darwin" else peak / 1024, 1)
+
+def run_benchmark(
+    records:int=10000,
+    texts:int=10000,
+    queries:int=200,
+    dimensions:int=768,
+    latency:float=0.0,
+    index_type:str="exact",
+    max_workers:int=8
+) -> Dict[str, Any]:
+    """
+        Runs the ingest and query benchmarks.
+
+        Args:
+        records (int): The number of catalog records to ingest with metadata.
+        texts (int): The number of plain texts to ingest as nodes.
+        queries (int): The number of queries per search function.
+        dimensions (int): The embedding dimensions.
+        latency (float): Simulated seconds per embedding request.
+        index_type (str): The local vector store index type, "exact" or "ivf".
+        max_workers (int): The maximum number of concurrent embedding requests.
+
+        Returns:
+        Dict[str, Any]: The configuration and results.
+    """
+    embed_model = FakeEmbedding(dimensions=dimensions, latency=latency)
+    catalog = make_records(records)
+    results = {
+        "config": {
+            "records": records,
+            "texts": texts,
+            "queries": queries,
+            "dimensions": dimensions,
+            "latency": latency,
+            "index_type": index_type,
+            "max_workers": max_workers,
+            "python": platform.python_version(),
+        },
+    }
+
+    with tempfile.TemporaryDirectory() as persist_dir:
+        vector_store = setup_local_vector_store(persist_dir, dimensions, index_type=index_type)
+
+        start = time.perf_counter()
+        stages = add_records_to_vector_store_with_metadata(
+            vector_store, embed_model, catalog, "description", max_workers=max_workers
+        )
+        elapsed = time.perf_counter() - start
+        results["ingest_records"] = {
+            "docs": records,
+            "seconds": round(elapsed, 3),
+            "docs_per_second": round(records / elapsed, 1),
+            "stages": stages,
+        }
+
+        start = time.perf_counter()
+        add_nodes_to_vector_store(
+            vector_store, [f"{i} " + record["description"] for i, record in enumerate(make_records(texts, seed=1))],
+            embed_model, max_workers=max_workers,
+        )
+        elapsed = time.perf_counter() - start
+        results["ingest_nodes"] = {
+            "docs": texts,
+            "seconds": round(elapsed, 3),
+            "docs_per_second": round(texts / elapsed, 1),
+        }
+
+        rng = random.Random(2)
+        # distinct queries, so the result cache does not hide search latency
+        query_texts = [f"{i} " + " ".join(rng.choices(WORDS, k=3)) for i in range(queries)]
+        filters = [
+            MetadataFilter(key="color", value="blue"),
+            MetadataFilter(key="price", operator=FilterOperator.GT, value=70.0),
+        ]
+        for name, search in (
+            ("query_without_filters", lambda q: similarity_search_without_filters(vector_store, embed_model, q)),
+            ("query_with_filters", lambda q: similarity_search_with_filters(vector_store, embed_model, q, filters)),
+        ):
+            # the first query builds the retriever service, so it is reported on its own
+            start = time.perf_counter()
+            search("warm up " + " ".join(WORDS[:3]))
+            first_query = time.perf_counter() - start
+            latencies = []
+            for query in query_texts:
+                start = time.perf_counter()
+                search(query)
+                latencies.append(time.perf_counter() - start)
+            results[name] = {**percentiles(latencies), "first_query_ms": round(first_query * 1000, 3)}
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    if metrics.enabled:
+        results["metrics"] = metrics.to_dict()
+    return results
+
+def compare(current:Dict[str, Any], previous:Dict[str, Any]) -> List[str]:
+    """
+        Describes the change in headline metrics between two runs.
+
+        Args:
+        current (Dict[str, Any]): The new results.
+        previous (Dict[str, Any]): The earlier results.
+
+        Returns:
+        List[str]: One line per metric.
+    """
+    metrics = [
+        ("ingest_records", "docs_per_second"),
+        ("ingest_nodes", "docs_per_second"),
+        ("query_without_filters", "p50_ms"),
+        ("query_without_filters", "p99_ms"),
+        ("query_with_filters", "p50_ms"),
+        ("query_with_filters", "p99_ms"),
+    ]
+    lines = []
+    for section, metric in metrics:
+        new = current.get(section, {}).get(metric)
+        old = previous.get(section, {}).get(metric)
+        if new is None or not old:
+            continue
+        lines.append(f"{section}.{metric}: {old} -> {new} ({(new - old) / old:+.1%})")
+    old_rss, new_rss = previous.get("peak_rss_mb"), current.get("peak_rss_mb")
+    if old_rss and new_rss:
+        lines.append(f"peak_rss_mb: {old_rss} -> {new_rss} ({(new_rss - old_rss) / old_rss:+.1%})")
+    return lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--texts", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per embedding request")
+    parser.add_argument("--index-type", choices=["exact", "ivf"], default="exact")
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--metrics", action="store_true", help="record per-stage spans and include them in the results")
+    args = parser.parse_args()
+    if args.metrics:
+        enable_metrics()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run_benchmark(
+        records=args.records,
+        texts=args.texts,
+        queries=args.queries,
+        dimensions=args.dimensions,
+        latency=args.latency,
+        index_type=args.index_type,
+        max_workers=args.max_workers,
+    )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(results, json.load(f)):
+                print(line)
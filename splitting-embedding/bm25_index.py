@@ -0,0 +1,298 @@
+import heapq
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+
+from instrumentation import metrics
+
+DEFAULT_K1 = 1.5
+DEFAULT_B = 0.75
+# The constant from the original reciprocal rank fusion paper (Cormack et al., 2009)
+DEFAULT_RRF_K = 60
+
+# Documents read at first by a search with a metadata predicate
+PREDICATE_CANDIDATES = 256
+# Below SQLite's limit on the variables of one statement
+SQLITE_MAX_VARIABLES = 900
+
+# Words, and identifiers joined by - . / such as "SKU-1042" or "v2.1"
+TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+TOKEN_PART = re.compile(r"\w+")
+
+def tokenize(text:str) -> List[str]:
+    """
+        Splits a text into lowercase terms for lexical search.
+
+        Compound identifiers are kept whole and also split into their parts,
+        so "SKU-1042" matches both an exact "sku-1042" query and "1042".
+
+        Args:
+        text (str): The text.
+
+        Returns:
+        List[str]: The terms, in order.
+    """
+    terms = []
+    for match in TOKEN.finditer(text.lower()):
+        token = match.group()
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(TOKEN_PART.findall(token))
+    return terms
+
+class BM25Index:
+    """
+        An inverted index scored with Okapi BM25, stored in SQLite.
+
+        Has the add() method of a Vector Store, so it can be passed as the
+        lexical_index of stream_records_to_vector_store and filled from the
+        same batches as the vector upserts. Adding a node ID again replaces
+        its entry.
+
+        Documents and postings live in SQLite, and only the document count
+        and total length are kept in memory, so memory does not grow with
+        the corpus. A query reads only the postings of its own terms, and
+        the text and metadata of its best-scoring documents. Changes are
+        written as they are made and committed by save(), or dropped by
+        discard().
+
+        Args:
+        path (Optional[str]): The SQLite database path. Kept in memory only if None.
+        k1 (float): The term frequency saturation.
+        b (float): The document length normalization.
+    """
+
+    def __init__(self, path:Optional[str]=None, k1:float=DEFAULT_K1, b:float=DEFAULT_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        if path is not None and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "node_id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL, length INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, node_id TEXT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (term, node_id)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_node_id ON postings (node_id)")
+        self._conn.commit()
+        self._load_totals()
+
+    @classmethod
+    def load(cls, path:str, k1:float=DEFAULT_K1, b:float=DEFAULT_B) -> "BM25Index":
+        """
+            Opens an index saved with save(), or starts an empty one.
+
+            Args:
+            path (str): The SQLite database path.
+            k1 (float): The term frequency saturation.
+            b (float): The document length normalization.
+
+            Returns:
+            BM25Index: The index.
+        """
+        return cls(path, k1, b)
+
+    def _load_totals(self) -> None:
+        self._count, self._total_length = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents"
+        ).fetchone()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, nodes:List[Any], **kwargs:Any) -> List[str]:
+        """
+            Indexes nodes, replacing earlier entries with the same IDs.
+
+            Args:
+            nodes (List[Any]): The nodes.
+
+            Returns:
+            List[str]: The node IDs.
+        """
+        documents: Dict[str, Tuple[str, str, Counter]] = {}
+        for node in nodes:
+            text = node.get_content(metadata_mode=MetadataMode.NONE)
+            # the last copy of an ID wins, as with separate adds
+            documents[node.node_id] = (text, json.dumps(node.metadata, default=str), Counter(tokenize(text)))
+        with self._lock:
+            self._remove(list(documents))
+            self._conn.executemany(
+                "INSERT INTO documents (node_id, text, metadata, length) VALUES (?, ?, ?, ?)",
+                [(node_id, text, metadata, sum(terms.values())) for node_id, (text, metadata, terms) in documents.items()],
+            )
+            self._conn.executemany(
+                "INSERT INTO postings (term, node_id, count) VALUES (?, ?, ?)",
+                [
+                    (term, node_id, count)
+                    for node_id, (_, _, terms) in documents.items()
+                    for term, count in terms.items()
+                ],
+            )
+            self._count += len(documents)
+            self._total_length += sum(sum(terms.values()) for _, _, terms in documents.values())
+        return [node.node_id for node in nodes]
+
+    def delete(self, node_id:str) -> None:
+        self.delete_nodes([node_id])
+
+    def delete_nodes(self, node_ids:List[str], **kwargs:Any) -> None:
+        """
+            Removes nodes, like the delete_nodes() method of a Vector Store.
+
+            Args:
+            node_ids (List[str]): The node IDs. Unknown IDs are ignored.
+        """
+        with self._lock:
+            self._remove(list(node_ids))
+
+    def _remove(self, node_ids:List[str]) -> None:
+        found = []
+        for i in range(0, len(node_ids), SQLITE_MAX_VARIABLES):
+            chunk = node_ids[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            found.extend(self._conn.execute(
+                f"SELECT node_id, length FROM documents WHERE node_id IN ({placeholders})", chunk
+            ))
+        if not found:
+            return
+        self._conn.executemany("DELETE FROM postings WHERE node_id = ?", [(node_id,) for node_id, _ in found])
+        self._conn.executemany("DELETE FROM documents WHERE node_id = ?", [(node_id,) for node_id, _ in found])
+        self._count -= len(found)
+        self._total_length -= sum(length for _, length in found)
+
+    def search(
+        self,
+        query:str,
+        top_k:int,
+        predicate:Optional[Callable[[Dict[str, Any]], bool]]=None
+    ) -> List[NodeWithScore]:
+        """
+            Finds the nodes with the highest BM25 score for a query.
+
+            Args:
+            query (str): The query.
+            top_k (int): The number of results.
+            predicate (Optional[Callable[[Dict[str, Any]], bool]]): A metadata filter, e.g. from compile_filters.
+
+            Returns:
+            List[NodeWithScore]: The matching nodes, best first; only nodes sharing a term with the query.
+        """
+        with metrics.span("lexical_search"):
+            with self._lock:
+                scores = self._score(tokenize(query))
+                results = []
+                # documents are read best first: only the top_k without a
+                # predicate, and with one growing batches until top_k match
+                count = top_k if predicate is None else max(PREDICATE_CANDIDATES, top_k)
+                checked = 0
+                while len(results) < top_k and checked < len(scores):
+                    best = heapq.nlargest(count, scores.items(), key=lambda item: item[1])[checked:]
+                    checked += len(best)
+                    documents = self._read_documents([node_id for node_id, _ in best])
+                    for node_id, score in best:
+                        text, metadata = documents[node_id]
+                        metadata = json.loads(metadata)
+                        if predicate is not None and not predicate(metadata):
+                            continue
+                        results.append(NodeWithScore(node=TextNode(id_=node_id, text=text, metadata=metadata), score=score))
+                        if len(results) == top_k:
+                            break
+                    count *= 4
+                return results
+
+    def _score(self, terms:Iterable[str]) -> Dict[str, float]:
+        if not self._count:
+            return {}
+        average_length = self._total_length / self._count
+        scores: Dict[str, float] = {}
+        for term, query_count in Counter(terms).items():
+            postings = self._conn.execute(
+                "SELECT p.node_id, p.count, d.length FROM postings p JOIN documents d ON d.node_id = p.node_id "
+                "WHERE p.term = ?",
+                (term,),
+            ).fetchall()
+            if not postings:
+                continue
+            idf = math.log(1 + (self._count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for node_id, frequency, length in postings:
+                length_norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[node_id] = scores.get(node_id, 0.0) + (
+                    query_count * idf * frequency * (self.k1 + 1) / (frequency + length_norm)
+                )
+        return scores
+
+    def _read_documents(self, node_ids:List[str]) -> Dict[str, Tuple[str, str]]:
+        documents = {}
+        for i in range(0, len(node_ids), SQLITE_MAX_VARIABLES):
+            chunk = node_ids[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            for node_id, text, metadata in self._conn.execute(
+                f"SELECT node_id, text, metadata FROM documents WHERE node_id IN ({placeholders})", chunk
+            ):
+                documents[node_id] = (text, metadata)
+        return documents
+
+    def save(self) -> None:
+        """
+            Commits the changes made since the last save.
+        """
+        with self._lock:
+            self._conn.commit()
+
+    def discard(self) -> None:
+        """
+            Drops the changes made since the last save, e.g. after a failed load.
+        """
+        with self._lock:
+            self._conn.rollback()
+            self._load_totals()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def reciprocal_rank_fusion(
+    rankings:Sequence[List[NodeWithScore]],
+    top_k:int,
+    k:int=DEFAULT_RRF_K
+) -> List[NodeWithScore]:
+    """
+        Merges ranked result lists by reciprocal rank fusion.
+
+        Each node scores the sum of 1 / (k + rank) over the lists it appears
+        in, so only ranks matter and BM25 and similarity scores need no
+        calibration against each other.
+
+        Args:
+        rankings (Sequence[List[NodeWithScore]]): The result lists, each best first.
+        top_k (int): The number of results.
+        k (int): The rank offset; larger values flatten the weight of the top ranks.
+
+        Returns:
+        List[NodeWithScore]: The fused results, best first, scored by fused score.
+    """
+    fused: Dict[str, float] = {}
+    nodes: Dict[str, Any] = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, start=1):
+            node_id = result.node.node_id
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+            # keep the first copy, from the earlier list
+            nodes.setdefault(node_id, result.node)
+    best: List[Tuple[str, float]] = heapq.nlargest(top_k, fused.items(), key=lambda item: item[1])
+    return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in best]
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable
+
+# Fixed namespace so node IDs are stable across machines and runs
+NODE_ID_NAMESPACE = uuid.UUID("6f1c1f4e-8f0a-4b7e-9a51-3f6b2f0c2d11")
+
+def content_digest(content:Any) -> str:
+    """
+        Computes the SHA-256 digest of a chunk text or a record.
+
+        Args:
+        content (Any): The chunk text, or a record dictionary.
+
+        Returns:
+        str: The hex digest.
+    """
+    if not isinstance(content, str):
+        content = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def make_node_id(source:str, key:Any) -> str:
+    """
+        Derives a deterministic node ID from a source and a key within it.
+
+        Re-ingesting an item with the same key yields the same ID, so the
+        vector store upserts the existing datapoint instead of adding a
+        duplicate. With a record key supplied by the caller, a record whose
+        metadata changed keeps its ID; with the whole record as the key, no
+        two distinct records share an ID.
+
+        Args:
+        source (str): The source name, e.g. a file path or catalog name.
+        key (Any): A record key, a chunk text, or a whole record dictionary.
+
+        Returns:
+        str: A UUID string.
+    """
+    return str(uuid.uuid5(NODE_ID_NAMESPACE, f"{source}\x00{content_digest(key)}"))
+
+def make_batch_key(entries:Iterable[str]) -> str:
+    """
+        Derives a key identifying a batch by the entries it contains.
+
+        Args:
+        entries (Iterable[str]): One string per item in the batch, e.g. its
+        node ID and content digest, so a batch whose content changed gets a new key.
+
+        Returns:
+        str: The hex SHA-256 digest of the sorted entries.
+    """
+    return hashlib.sha256("\n".join(sorted(entries)).encode("utf-8")).hexdigest()
+
+class CheckpointJournal:
+    """
+        An append-only local journal of committed ingest batches.
+
+        Each committed batch is written as one JSON line and flushed to disk,
+        so after a crash a restarted ingest can skip every batch recorded here.
+
+        Args:
+        path (str): The journal file path.
+    """
+
+    def __init__(self, path:str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._committed: Dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a torn last line from a crash mid-write
+                        continue
+                    self._committed[entry["batch"]] = entry["count"]
+            logging.info(
+                f"Loaded {len(self._committed)} committed batches from checkpoint journal {path}"
+            )
+
+    def is_committed(self, batch_key:str) -> bool:
+        with self._lock:
+            return batch_key in self._committed
+
+    def record(self, batch_key:str, count:int) -> None:
+        """
+            Records a batch as committed.
+
+            Args:
+            batch_key (str): The batch key.
+            count (int): The number of nodes in the batch.
+        """
+        entry = json.dumps({"batch": batch_key, "count": count, "committed_at": time.time()})
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(entry + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._committed[batch_key] = count
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._committed)
@@ -0,0 +1,321 @@
+import hashlib
+import logging
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from embedding_cache import normalize_text
+from embedding_pipeline import batch_texts, estimate_tokens
+
+DEDUP_METHODS = ("exact", "minhash", "simhash")
+DEFAULT_MINHASH_THRESHOLD = 0.85
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32
+DEFAULT_SIMHASH_DISTANCE = 3
+DEFAULT_SHINGLE_SIZE = 3
+
+# The Mersenne prime 2**61 - 1, the modulus of the MinHash permutations
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+@dataclass
+class DedupReport:
+    """
+        Counts of the texts a Deduplicator dropped.
+
+        Attributes:
+        texts (int): The number of texts checked.
+        exact_duplicates (int): The number of texts identical to an earlier one after normalization.
+        near_duplicates (int): The number of texts within the near-duplicate threshold of an earlier one.
+        tokens_saved (int): The estimated tokens not sent for embedding.
+        requests_saved (int): The embedding requests saved, when the caller computes them.
+    """
+    texts: int = 0
+    exact_duplicates: int = 0
+    near_duplicates: int = 0
+    tokens_saved: int = 0
+    requests_saved: int = 0
+
+    @property
+    def kept(self) -> int:
+        return self.texts - self.vectors_saved
+
+    @property
+    def vectors_saved(self) -> int:
+        return self.exact_duplicates + self.near_duplicates
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "texts": self.texts,
+            "kept": self.kept,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+            "vectors_saved": self.vectors_saved,
+            "tokens_saved": self.tokens_saved,
+            "requests_saved": self.requests_saved,
+        }
+
+def shingles(text:str, size:int=DEFAULT_SHINGLE_SIZE) -> List[str]:
+    """
+        Splits a text into overlapping word n-grams.
+
+        Args:
+        text (str): The text.
+        size (int): The number of words per shingle.
+
+        Returns:
+        List[str]: The distinct shingles; the whole text if it has fewer words than size.
+    """
+    words = normalize_text(text).lower().split()
+    if len(words) <= size:
+        return [" ".join(words)]
+    return list({" ".join(words[i:i + size]) for i in range(len(words) - size + 1)})
+
+class Deduplicator:
+    """
+        Detects exact and near-duplicate texts, keeping the first of each group.
+
+        Exact duplicates are found by hashing the normalized text. Near
+        duplicates are found with MinHash signatures over word shingles and
+        LSH banding, confirmed by estimated Jaccard similarity, or with 64-bit
+        SimHash fingerprints within a Hamming distance. State is kept across
+        calls, so texts can be checked batch by batch while streaming.
+
+        Every kept text is remembered: about 0.1 KB each with "exact", 0.7 KB
+        with "simhash" and 7 KB with "minhash" at the default num_perm and
+        bands, or a few GB per million texts. With max_entries, the oldest
+        texts are forgotten beyond it, so later copies of them are kept;
+        reset() forgets every text.
+
+        Args:
+        method (str): "exact", "minhash" or "simhash".
+        threshold (float): The MinHash Jaccard similarity at or above which a text is a duplicate.
+        num_perm (int): The number of MinHash permutations.
+        bands (int): The number of LSH bands; num_perm must be divisible by it.
+        max_distance (int): The SimHash Hamming distance at or below which a text is a duplicate.
+        shingle_size (int): The number of words per shingle.
+        seed (int): The seed for the MinHash permutations.
+        max_entries (Optional[int]): The maximum number of kept texts remembered. Unbounded if None.
+
+        Attributes:
+        report (DedupReport): The counts so far.
+    """
+
+    def __init__(
+        self,
+        method:str="minhash",
+        threshold:float=DEFAULT_MINHASH_THRESHOLD,
+        num_perm:int=DEFAULT_NUM_PERM,
+        bands:int=DEFAULT_BANDS,
+        max_distance:int=DEFAULT_SIMHASH_DISTANCE,
+        shingle_size:int=DEFAULT_SHINGLE_SIZE,
+        seed:int=1,
+        max_entries:Optional[int]=None
+    ):
+        if method not in DEDUP_METHODS:
+            raise ValueError(f"Unsupported dedup method {method}, expected one of {list(DEDUP_METHODS)}")
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.method = method
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_distance = max_distance
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self.report = DedupReport()
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.reset()
+
+    def reset(self) -> None:
+        """
+            Forgets every text seen so far. The report keeps counting.
+        """
+        # the kept texts by digest, oldest first
+        self._exact: Dict[bytes, int] = {}
+        self._signatures: Dict[int, np.ndarray] = {}
+        self._fingerprints: Dict[int, int] = {}
+        # one bucket table per LSH band (MinHash) or fingerprint block (SimHash)
+        self._buckets: List[Dict[Any, List[int]]] = [
+            {} for _ in range(self.bands if self.method == "minhash" else self.max_distance + 1)
+        ]
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def check(self, text:str) -> Optional[int]:
+        """
+            Checks a text against the texts seen so far, and remembers it if new.
+
+            Args:
+            text (str): The text.
+
+            Returns:
+            Optional[int]: The position of the earlier text it duplicates, or None if it is kept.
+        """
+        position = self.report.texts
+        self.report.texts += 1
+
+        digest = hashlib.sha1(normalize_text(text).encode("utf-8")).digest()
+        original = self._exact.get(digest)
+        if original is not None:
+            self.report.exact_duplicates += 1
+            self.report.tokens_saved += estimate_tokens(text)
+            return original
+
+        if self.method == "minhash":
+            original = self._check_minhash(position, text)
+        elif self.method == "simhash":
+            original = self._check_simhash(position, text)
+        if original is not None:
+            self.report.near_duplicates += 1
+            self.report.tokens_saved += estimate_tokens(text)
+            return original
+
+        self._exact[digest] = position
+        if self.max_entries is not None and len(self._exact) > self.max_entries:
+            self._forget_oldest()
+        return None
+
+    def _forget_oldest(self) -> None:
+        digest = next(iter(self._exact))
+        position = self._exact.pop(digest)
+        if self.method == "minhash":
+            keys = self._minhash_keys(self._signatures.pop(position))
+        elif self.method == "simhash":
+            keys = self._simhash_keys(self._fingerprints.pop(position))
+        else:
+            return
+        for bucket, key in zip(self._buckets, keys):
+            bucket[key].remove(position)
+            if not bucket[key]:
+                del bucket[key]
+
+    def filter(self, texts:Iterable[str]) -> Iterator[str]:
+        """
+            Yields the texts that are not duplicates of earlier ones.
+
+            Args:
+            texts (Iterable[str]): The texts.
+
+            Yields:
+            str: The kept texts, in order.
+        """
+        for text in texts:
+            if self.check(text) is None:
+                yield text
+
+    def _shingle_hashes(self, text:str) -> np.ndarray:
+        return np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text, self.shingle_size)),
+            dtype=np.uint64,
+        )
+
+    def _check_minhash(self, position:int, text:str) -> Optional[int]:
+        hashes = self._shingle_hashes(text)
+        # one row per permutation; uint64 arithmetic wraps, which only reshuffles the hash
+        signature = ((np.outer(self._a, hashes) + self._b[:, None]) % MERSENNE_PRIME).min(axis=1)
+        keys = self._minhash_keys(signature)
+
+        candidates = {i for band, key in enumerate(keys) for i in self._buckets[band].get(key, ())}
+        for candidate in sorted(candidates):
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                return candidate
+
+        self._signatures[position] = signature
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, []).append(position)
+        return None
+
+    def _minhash_keys(self, signature:np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _check_simhash(self, position:int, text:str) -> Optional[int]:
+        features = np.array(
+            [
+                int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+                for shingle in shingles(text, self.shingle_size)
+            ],
+            dtype=np.uint64,
+        )
+        bits = np.unpackbits(features.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+        votes = bits.sum(axis=0) * 2 > len(features)
+        fingerprint = int(np.packbits(votes, bitorder="little").view("<u8")[0])
+
+        keys = self._simhash_keys(fingerprint)
+        candidates = {i for block, key in enumerate(keys) for i in self._buckets[block].get(key, ())}
+        for candidate in sorted(candidates):
+            if bin(self._fingerprints[candidate] ^ fingerprint).count("1") <= self.max_distance:
+                return candidate
+
+        self._fingerprints[position] = fingerprint
+        for block, key in enumerate(keys):
+            self._buckets[block].setdefault(key, []).append(position)
+        return None
+
+    def _simhash_keys(self, fingerprint:int) -> List[int]:
+        # by pigeonhole, fingerprints within max_distance share at least one of max_distance + 1 blocks
+        blocks = len(self._buckets)
+        width = 64 // blocks
+        return [(fingerprint >> (block * width)) & ((1 << width) - 1) for block in range(blocks)]
+
+class RequestCounter:
+    """
+        Counts the embedding requests the ingest pipeline would send for a
+        stream of texts, holding at most one upsert batch at a time.
+
+        Args:
+        batch_size (int): The number of records per upsert batch; each is embedded separately.
+
+        Attributes:
+        texts (int): The number of texts added.
+    """
+
+    def __init__(self, batch_size:int):
+        self.batch_size = batch_size
+        self.texts = 0
+        self._requests = 0
+        self._batch: List[str] = []
+
+    def add(self, text:str) -> None:
+        self.texts += 1
+        self._batch.append(text)
+        if len(self._batch) == self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._batch:
+            self._requests += len(list(batch_texts(self._batch)))
+            self._batch = []
+
+    @property
+    def requests(self) -> int:
+        self._flush()
+        return self._requests
+
+def estimate_requests(texts:Iterable[str], batch_size:int) -> int:
+    """
+        Counts the embedding requests the ingest pipeline would send for texts.
+
+        Args:
+        texts (Iterable[str]): The texts.
+        batch_size (int): The number of records per upsert batch; each is embedded separately.
+
+        Returns:
+        int: The number of requests.
+    """
+    counter = RequestCounter(batch_size)
+    for text in texts:
+        counter.add(text)
+    return counter.requests
+
+def log_report(report:DedupReport) -> None:
+    logging.info(
+        f"Dedup kept {report.kept} of {report.texts} texts: {report.exact_duplicates} exact and "
+        f"{report.near_duplicates} near duplicates, saving ~{report.requests_saved} embedding requests "
+        f"and ~{report.tokens_saved} tokens"
+    )
@@ -0,0 +1,267 @@
+"""
+Array-backed embedding storage with float16 / int8 scalar quantization.
+
+Run it to measure the recall impact of each storage type against float32:
+
+    python embedding_array.py --vectors 20000 --queries 200 --dimensions 768
+"""
+
+import argparse
+from typing import Any, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+INT8_MAX = 127
+
+class EmbeddingArray:
+    """
+        A contiguous 2-D array of embeddings, one row per text.
+
+        float32 holds full precision, float16 halves it, and int8 stores each
+        row scaled by its own max-abs value into [-127, 127], a quarter of
+        float32, with one float32 scale per row. A Python list of floats takes
+        about 8x the memory of the same vector in float32.
+
+        Args:
+        data (np.ndarray): The (count, dimensions) array in the storage type.
+        dtype (str): The storage type, "float32", "float16" or "int8".
+        scales (Optional[np.ndarray]): The per-row float32 scales, for int8.
+    """
+
+    def __init__(self, data:np.ndarray, dtype:str="float32", scales:Optional[np.ndarray]=None):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported dtype {dtype}, expected one of {list(STORAGE_DTYPES)}")
+        if dtype == "int8" and scales is None:
+            raise ValueError("int8 embeddings need per-row scales")
+        self.data = data
+        self.dtype = dtype
+        self.scales = scales
+
+    @classmethod
+    def from_vectors(cls, vectors:Any, dtype:str="float32") -> "EmbeddingArray":
+        """
+            Builds an array from embeddings, quantizing them to the storage type.
+
+            Args:
+            vectors (Any): A list of embeddings or a 2-D array.
+            dtype (str): The storage type.
+
+            Returns:
+            EmbeddingArray: The embeddings.
+        """
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1) if matrix.size else matrix.reshape(0, 0)
+        return cls(matrix, "float32").quantize(dtype)
+
+    @classmethod
+    def empty(cls, count:int, dimensions:int) -> "EmbeddingArray":
+        return cls(np.zeros((count, dimensions), dtype=np.float32))
+
+    @classmethod
+    def concatenate(cls, arrays:Sequence["EmbeddingArray"]) -> "EmbeddingArray":
+        """
+            Joins arrays of the same storage type.
+
+            Args:
+            arrays (Sequence[EmbeddingArray]): The arrays.
+
+            Returns:
+            EmbeddingArray: The rows of all arrays, in order.
+        """
+        dtype = arrays[0].dtype
+        if any(array.dtype != dtype for array in arrays):
+            raise ValueError("Cannot concatenate embeddings with different storage types")
+        scales = np.concatenate([array.scales for array in arrays]) if dtype == "int8" else None
+        return cls(np.concatenate([array.data for array in arrays]), dtype, scales)
+
+    @property
+    def dimensions(self) -> int:
+        return self.data.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def quantize(self, dtype:str) -> "EmbeddingArray":
+        """
+            Converts to another storage type.
+
+            Args:
+            dtype (str): The storage type.
+
+            Returns:
+            EmbeddingArray: The converted array, or self if the type is unchanged.
+        """
+        if dtype == self.dtype:
+            return self
+        matrix = self.to_float32()
+        if dtype == "float32":
+            return EmbeddingArray(matrix, "float32")
+        if dtype == "float16":
+            return EmbeddingArray(matrix.astype(np.float16), "float16")
+        if dtype == "int8":
+            scales = np.abs(matrix).max(axis=1) / INT8_MAX if len(matrix) else np.zeros(0, dtype=np.float32)
+            scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+            data = np.clip(np.rint(matrix / scales[:, None]), -INT8_MAX, INT8_MAX).astype(np.int8)
+            return EmbeddingArray(data, "int8", scales)
+        raise ValueError(f"Unsupported dtype {dtype}, expected one of {list(STORAGE_DTYPES)}")
+
+    def to_float32(self) -> np.ndarray:
+        """
+            Returns the embeddings as a float32 array, dequantizing if needed.
+
+            Returns:
+            np.ndarray: The (count, dimensions) float32 array.
+        """
+        if self.dtype == "int8":
+            return self.data.astype(np.float32) * self.scales[:, None]
+        return self.data.astype(np.float32, copy=False)
+
+    def row(self, i:int) -> List[float]:
+        """
+            Returns one embedding as a list, e.g. for TextNode.embedding.
+
+            Args:
+            i (int): The row.
+
+            Returns:
+            List[float]: The embedding.
+        """
+        vector = self.data[i].astype(np.float32)
+        if self.dtype == "int8":
+            vector *= self.scales[i]
+        return vector.tolist()
+
+    def tolist(self) -> List[List[float]]:
+        return self.to_float32().tolist()
+
+    def row_bytes(self, i:int) -> bytes:
+        """
+            Encodes one row as a little-endian blob, with the scale first for int8.
+
+            Args:
+            i (int): The row.
+
+            Returns:
+            bytes: The blob.
+        """
+        blob = self.data[i].astype(self.data.dtype.newbyteorder("<"), copy=False).tobytes()
+        if self.dtype == "int8":
+            return np.float32(self.scales[i]).astype("<f4").tobytes() + blob
+        return blob
+
+    @classmethod
+    def from_row_bytes(cls, blobs:Iterable[bytes], dtype:str) -> "EmbeddingArray":
+        """
+            Decodes blobs written by row_bytes.
+
+            Args:
+            blobs (Iterable[bytes]): The blobs, all of the same dimensions.
+            dtype (str): The storage type they were written with.
+
+            Returns:
+            EmbeddingArray: The embeddings.
+        """
+        blobs = list(blobs)
+        if dtype == "int8":
+            scales = np.array([np.frombuffer(blob[:4], dtype="<f4")[0] for blob in blobs], dtype=np.float32)
+            data = np.array([np.frombuffer(blob[4:], dtype=np.int8) for blob in blobs], dtype=np.int8)
+            return cls(data, "int8", scales)
+        storage = {"float32": "<f4", "float16": "<f2"}[dtype]
+        return cls(np.array([np.frombuffer(blob, dtype=storage) for blob in blobs]), dtype)
+
+    def save(self, path:str) -> None:
+        """
+            Saves the embeddings to an .npz file.
+
+            Args:
+            path (str): The file path.
+        """
+        arrays = {"data": self.data, "dtype": np.array(self.dtype)}
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path:str) -> "EmbeddingArray":
+        """
+            Loads embeddings saved with save().
+
+            Args:
+            path (str): The file path.
+
+            Returns:
+            EmbeddingArray: The embeddings.
+        """
+        with np.load(path) as f:
+            return cls(f["data"], str(f["dtype"]), f["scales"] if "scales" in f else None)
+
+def measure_recall(
+    vectors:np.ndarray,
+    queries:np.ndarray,
+    dtype:str,
+    top_k:int=10
+) -> float:
+    """
+        Measures how many of the exact float32 top_k results a storage type keeps.
+
+        Args:
+        vectors (np.ndarray): The (count, dimensions) corpus.
+        queries (np.ndarray): The (count, dimensions) queries.
+        dtype (str): The storage type to compare against float32.
+        top_k (int): The number of results per query.
+
+        Returns:
+        float: The mean recall@top_k.
+    """
+    exact = vectors.astype(np.float32) @ queries.T.astype(np.float32)
+    approximate = EmbeddingArray.from_vectors(vectors, dtype).to_float32() @ queries.T.astype(np.float32)
+    top_k = min(top_k, len(vectors))
+    found = 0
+    for column in range(len(queries)):
+        expected = np.argpartition(-exact[:, column], top_k - 1)[:top_k]
+        actual = np.argpartition(-approximate[:, column], top_k - 1)[:top_k]
+        found += len(np.intersect1d(expected, actual))
+    return found / (top_k * len(queries))
+
+def make_clustered_vectors(count:int, dimensions:int, clusters:int=100, noise:float=0.5, seed:int=0) -> np.ndarray:
+    """
+        Builds unit vectors around random centers, a rough stand-in for text embeddings.
+
+        Args:
+        count (int): The number of vectors.
+        dimensions (int): The number of dimensions.
+        clusters (int): The number of centers.
+        noise (float): The spread around each center.
+        seed (int): The random seed.
+
+        Returns:
+        np.ndarray: The (count, dimensions) float32 vectors.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions))
+    vectors = centers[rng.integers(0, clusters, count)] + noise * rng.standard_normal((count, dimensions))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    data = make_clustered_vectors(args.vectors + args.queries, args.dimensions)
+    vectors, queries = data[:args.vectors], data[args.vectors:]
+    list_bytes = 8 * args.dimensions + 56 + 24 * args.dimensions  # list slots + float objects
+    print(f"list of floats: {list_bytes} bytes/vector")
+    for dtype in STORAGE_DTYPES:
+        array = EmbeddingArray.from_vectors(vectors, dtype)
+        recall = measure_recall(vectors, queries, dtype, args.top_k)
+        print(f"{dtype:>8}: {array.nbytes / len(array):7.0f} bytes/vector, recall@{args.top_k} {recall:.4f}")
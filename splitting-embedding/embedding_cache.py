@@ -0,0 +1,289 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from embedding_array import STORAGE_DTYPES, EmbeddingArray
+
+def normalize_text(text:str) -> str:
+    """
+        Normalizes a text so trivially different copies share a cache entry.
+
+        Args:
+        text (str): The text.
+
+        Returns:
+        str: The NFC-normalized text with runs of whitespace collapsed.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def make_cache_key(model_name:str, kind:str, text:str) -> str:
+    """
+        Builds a content-addressed cache key.
+
+        Args:
+        model_name (str): The embedding model name.
+        kind (str): "text" or "query"; Vertex embeds these with different task types.
+        text (str): The text.
+
+        Returns:
+        str: The hex SHA-256 digest of the model name, kind and normalized text.
+    """
+    payload = f"{model_name}\x00{kind}\x00{normalize_text(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+        A persistent, size-bound LRU cache of embeddings backed by SQLite.
+
+        Vectors are stored as packed float32, float16 or int8 blobs. When the
+        number of entries exceeds max_entries, the least recently used entries
+        are evicted. The number of entries is counted once when the cache is
+        opened and kept up to date in memory, so one process should write to
+        a cache file at a time.
+
+        Args:
+        path (str): The SQLite database path, or ":memory:".
+        max_entries (int): The maximum number of cached embeddings.
+        dtype (str): The storage type, "float32", "float16" or "int8".
+
+        Attributes:
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups not found in the cache.
+        evictions (int): The number of entries evicted.
+    """
+
+    def __init__(self, path:str, max_entries:int=1_000_000, dtype:str="float16"):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported dtype {dtype}, expected one of {list(STORAGE_DTYPES)}")
+        self.path = path
+        self.max_entries = max_entries
+        self.dtype = dtype
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, dtype TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def get_many(self, keys:List[str]) -> Dict[str, List[float]]:
+        """
+            Looks up several keys and refreshes their recency.
+
+            Args:
+            keys (List[str]): The cache keys.
+
+            Returns:
+            Dict[str, List[float]]: The cached embeddings, by key; missing keys are absent.
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLite limits the number of bound parameters, so query in chunks
+            for i in range(0, len(unique_keys), 500):
+                chunk = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, dtype, vector FROM embeddings WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                # entries written with a different dtype setting are still readable
+                by_dtype: Dict[str, List[Tuple[str, bytes]]] = {}
+                for key, dtype, blob in rows:
+                    by_dtype.setdefault(dtype, []).append((key, blob))
+                for dtype, entries in by_dtype.items():
+                    vectors = EmbeddingArray.from_row_bytes((blob for _, blob in entries), dtype)
+                    for i, (key, _) in enumerate(entries):
+                        found[key] = vectors.row(i)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            hit_count = sum(1 for key in keys if key in found)
+            self.hits += hit_count
+            self.misses += len(keys) - hit_count
+        return found
+
+    def put_many(self, items:Dict[str, List[float]]) -> None:
+        """
+            Stores several embeddings and evicts the least recently used
+            entries if the cache is over capacity.
+
+            Args:
+            items (Dict[str, List[float]]): The embeddings, by key.
+        """
+        if not items:
+            return
+        now = time.time()
+        vectors = EmbeddingArray.from_vectors(list(items.values()), self.dtype)
+        rows = [(key, self.dtype, vectors.row_bytes(i), now) for i, key in enumerate(items)]
+        keys = list(items)
+        with self._lock:
+            # replacing an entry does not change the count, so only new keys are counted
+            existing = 0
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                (found,) = self._conn.execute(
+                    f"SELECT COUNT(*) FROM embeddings WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchone()
+                existing += found
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dtype, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._count += len(keys) - existing
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                evicted = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,),
+                ).rowcount
+                self._count -= evicted
+                self.evictions += evicted
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def stats(self) -> Dict[str, Any]:
+        """
+            Returns the cache counters.
+
+            Returns:
+            Dict[str, Any]: Hits, misses, evictions, hit rate and entry count.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class CachedEmbedding(BaseEmbedding):
+    """
+        An embedding model that serves repeated texts from an EmbeddingCache
+        and only forwards misses to the wrapped model.
+
+        Args:
+        embed_model (BaseEmbedding): The wrapped embedding model, e.g. VertexTextEmbedding.
+        cache (EmbeddingCache): The embedding cache.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model:BaseEmbedding, cache:EmbeddingCache, **kwargs:Any):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _lookup(self, kind:str, texts:List[str]) -> tuple:
+        keys = [make_cache_key(self.model_name, kind, text) for text in texts]
+        found = self._cache.get_many(keys)
+        # embed each distinct missing key once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return keys, found, missing
+
+    def _get_text_embeddings(self, texts:List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup("text", texts)
+        if missing:
+            embeddings = self._embed_model.get_text_embedding_batch(list(missing.values()))
+            new_items = dict(zip(missing.keys(), embeddings))
+            self._cache.put_many(new_items)
+            found.update(new_items)
+        return [found[key] for key in keys]
+
+    async def _aget_text_embeddings(self, texts:List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup("text", texts)
+        if missing:
+            embeddings = await self._embed_model.aget_text_embedding_batch(list(missing.values()))
+            new_items = dict(zip(missing.keys(), embeddings))
+            self._cache.put_many(new_items)
+            found.update(new_items)
+        return [found[key] for key in keys]
+
+    def _get_text_embedding(self, text:str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text:str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query:str) -> List[float]:
+        keys, found, missing = self._lookup("query", [query])
+        if missing:
+            found[keys[0]] = self._embed_model.get_query_embedding(query)
+            self._cache.put_many({keys[0]: found[keys[0]]})
+        return found[keys[0]]
+
+    async def _aget_query_embedding(self, query:str) -> List[float]:
+        keys, found, missing = self._lookup("query", [query])
+        if missing:
+            found[keys[0]] = await self._embed_model.aget_query_embedding(query)
+            self._cache.put_many({keys[0]: found[keys[0]]})
+        return found[keys[0]]
+
+def wrap_with_cache(
+    embed_model:BaseEmbedding,
+    cache_path:str,
+    max_entries:int=1_000_000,
+    dtype:str="float16"
+) -> CachedEmbedding:
+    """
+        Wraps an embedding model with a persistent embedding cache.
+
+        Args:
+        embed_model (BaseEmbedding): The embedding model.
+        cache_path (str): The SQLite database path.
+        max_entries (int): The maximum number of cached embeddings.
+        dtype (str): The storage type, "float32", "float16" or "int8".
+
+        Returns:
+        CachedEmbedding: The cached embedding model.
+    """
+    cache = EmbeddingCache(cache_path, max_entries=max_entries, dtype=dtype)
+    logging.info(
+        f"Embedding cache at {cache_path} has {len(cache)} entries stored as {dtype}"
+    )
+    return CachedEmbedding(embed_model, cache)
@@ -0,0 +1,209 @@
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Iterator, List, Optional
+
+from instrumentation import metrics
+from rate_limit import RateLimiter, embedding_rate_limiter
+
+if TYPE_CHECKING:
+    from embedding_array import EmbeddingArray
+
+# textembedding-gecko@003 request limits
+# Docs: https://cloud.google.com/vertex-ai/generative-ai/docs/embeddings/get-text-embeddings
+MAX_INSTANCES_PER_REQUEST = 250
+MAX_TOKENS_PER_REQUEST = 20000
+MAX_TOKENS_PER_INSTANCE = 2048
+CHARS_PER_TOKEN = 4
+DEFAULT_MAX_WORKERS = 8
+
+def estimate_tokens(text:str) -> int:
+    """
+        Estimates the number of tokens in a text.
+
+        The gecko tokenizer is not published, so this uses a conservative
+        characters-per-token ratio.
+
+        Args:
+        text (str): The text.
+
+        Returns:
+        int: The estimated token count.
+    """
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+def batch_texts(
+    texts:List[str],
+    max_instances:int=MAX_INSTANCES_PER_REQUEST,
+    max_tokens:int=MAX_TOKENS_PER_REQUEST
+) -> Iterator[List[str]]:
+    """
+        Groups texts into request-sized batches.
+
+        A batch is closed when adding the next text would exceed either the
+        per-request instance limit or the per-request token limit. Texts longer
+        than the per-instance limit are counted at that limit, since the API
+        truncates them.
+
+        Args:
+        texts (List[str]): The list of texts.
+        max_instances (int): The maximum number of texts per request.
+        max_tokens (int): The maximum number of tokens per request.
+
+        Yields:
+        List[str]: A batch of texts, in input order.
+    """
+    batch = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = min(estimate_tokens(text), MAX_TOKENS_PER_INSTANCE)
+        if batch and (len(batch) >= max_instances or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+def _embed_batches(
+    embed_model:Any,
+    texts:List[str],
+    max_workers:int,
+    max_instances:int,
+    max_tokens:int,
+    rate_limiter:Optional[RateLimiter],
+    convert:Callable[[List[List[float]]], Any]
+) -> List[Any]:
+    # Embeds request-sized batches concurrently and returns convert(embeddings)
+    # for each batch, in input order; convert runs in the worker thread so a
+    # batch's lists can be packed and freed as soon as it arrives
+    batches = list(batch_texts(texts, max_instances, max_tokens))
+    if not batches:
+        return []
+    rate_limiter = rate_limiter or embedding_rate_limiter
+
+    def embed_batch(batch:List[str]) -> Any:
+        with metrics.span("embedding_request"):
+            embeddings = rate_limiter.call(embed_model.get_text_embedding_batch, batch)
+        metrics.incr("embedding_texts_total", len(batch))
+        return convert(embeddings)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+        # executor.map yields results in submission order, so output order is stable
+        results = list(executor.map(embed_batch, batches))
+    elapsed = time.perf_counter() - start
+
+    logging.info(
+        f"Embedded {len(texts)} texts in {len(batches)} batches in {elapsed:.2f}s"
+    )
+    return results
+
+def embed_texts(
+    embed_model:Any,
+    texts:List[str],
+    max_workers:int=DEFAULT_MAX_WORKERS,
+    max_instances:int=MAX_INSTANCES_PER_REQUEST,
+    max_tokens:int=MAX_TOKENS_PER_REQUEST,
+    rate_limiter:Optional[RateLimiter]=None
+) -> List[List[float]]:
+    """
+        Embeds texts in request-sized batches using a bounded thread pool.
+
+        Every request goes through a rate limiter, and a throttled request is
+        retried on its own without re-sending the other batches.
+
+        Args:
+        embed_model (Any): The embedding model, e.g. VertexTextEmbedding.
+        texts (List[str]): The list of texts.
+        max_workers (int): The maximum number of concurrent requests.
+        max_instances (int): The maximum number of texts per request.
+        max_tokens (int): The maximum number of tokens per request.
+        rate_limiter (Optional[RateLimiter]): The rate limiter. Defaults to the shared embedding limiter.
+
+        Returns:
+        List[List[float]]: The embeddings, in the same order as texts.
+    """
+    results = _embed_batches(
+        embed_model, texts, max_workers, max_instances, max_tokens, rate_limiter, lambda embeddings: embeddings
+    )
+    return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+def embed_texts_array(
+    embed_model:Any,
+    texts:List[str],
+    max_workers:int=DEFAULT_MAX_WORKERS,
+    max_instances:int=MAX_INSTANCES_PER_REQUEST,
+    max_tokens:int=MAX_TOKENS_PER_REQUEST,
+    rate_limiter:Optional[RateLimiter]=None,
+    dtype:str="float32"
+) -> "EmbeddingArray":
+    """
+        Embeds texts like embed_texts, packing each batch into a contiguous
+        array as it arrives.
+
+        Args:
+        embed_model (Any): The embedding model, e.g. VertexTextEmbedding.
+        texts (List[str]): The list of texts.
+        max_workers (int): The maximum number of concurrent requests.
+        max_instances (int): The maximum number of texts per request.
+        max_tokens (int): The maximum number of tokens per request.
+        rate_limiter (Optional[RateLimiter]): The rate limiter. Defaults to the shared embedding limiter.
+        dtype (str): The storage type, "float32", "float16" or "int8".
+
+        Returns:
+        EmbeddingArray: The embeddings, one row per text in the same order as texts.
+    """
+    # numpy is imported on first use, so importing this module stays cheap
+    from embedding_array import EmbeddingArray
+
+    results = _embed_batches(
+        embed_model, texts, max_workers, max_instances, max_tokens, rate_limiter,
+        lambda embeddings: EmbeddingArray.from_vectors(embeddings, dtype),
+    )
+    if not results:
+        return EmbeddingArray.from_vectors([], dtype)
+    return EmbeddingArray.concatenate(results)
+
+def benchmark_embed_texts(
+    num_texts:int=10000,
+    text_length:int=500,
+    max_workers:int=DEFAULT_MAX_WORKERS,
+    latency:float=0.1,
+    dimensions:int=768
+) -> dict:
+    """
+        Measures embedding throughput against FakeEmbedding.
+
+        Args:
+        num_texts (int): The number of synthetic texts to embed.
+        text_length (int): The length in characters of each text.
+        max_workers (int): The maximum number of concurrent requests.
+        latency (float): Simulated seconds per request.
+        dimensions (int): The number of dimensions per embedding.
+
+        Returns:
+        dict: The number of texts, requests, elapsed seconds and texts per second.
+    """
+    # llama_index is only needed by the fake, so it is imported here
+    from fake_embedding import FakeEmbedding
+
+    embed_model = FakeEmbedding(dimensions=dimensions, latency=latency)
+    texts = [f"{i} " + "x" * text_length for i in range(num_texts)]
+
+    start = time.perf_counter()
+    embed_texts(embed_model, texts, max_workers=max_workers)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "texts": num_texts,
+        "requests": embed_model.request_count,
+        "seconds": elapsed,
+        "texts_per_second": num_texts / elapsed if elapsed else float("inf"),
+    }
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(benchmark_embed_texts())
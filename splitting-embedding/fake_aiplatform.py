@@ -0,0 +1,136 @@
+import glob
+import itertools
+import json
+import os
+import threading
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+class NotFound(Exception):
+    """
+        Raised for unknown resource names, like google.api_core.exceptions.NotFound.
+    """
+
+class FakeAiplatform:
+    """
+        An in-memory stand-in for the google.cloud.aiplatform module.
+
+        Supports the index and endpoint calls used by create_index,
+        create_endpoint and deploy_index_at_endpoint, and batch updates from
+        LocalBucket shards, and counts every call in calls, so the
+        control-plane round trips of a startup can be checked offline. Pass it
+        as the client argument of those functions.
+
+        Attributes:
+        calls (Counter): The number of calls per method, e.g. calls["MatchingEngineIndex.list"].
+        MatchingEngineIndex (type): The fake index class.
+        MatchingEngineIndexEndpoint (type): The fake endpoint class.
+    """
+
+    def __init__(self, project:str="fake-project", location:str="us-central1"):
+        self.calls = Counter()
+        self.indexes: Dict[str, Dict[str, Any]] = {}
+        self.endpoints: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._parent = f"projects/{project}/locations/{location}"
+        self.MatchingEngineIndex = self._index_class()
+        self.MatchingEngineIndexEndpoint = self._endpoint_class()
+
+    def init(self, **kwargs:Any) -> None:
+        self.calls["init"] += 1
+
+    def _new_name(self, collection:str) -> str:
+        with self._lock:
+            return f"{self._parent}/{collection}/{next(self._ids)}"
+
+    def _index_class(self) -> type:
+        fake = self
+
+        class MatchingEngineIndex:
+            def __init__(self, index_name:str):
+                fake.calls["MatchingEngineIndex.get"] += 1
+                if index_name not in fake.indexes:
+                    raise NotFound(f"404 Index {index_name} not found")
+                self.resource_name = index_name
+                self.display_name = fake.indexes[index_name]["display_name"]
+
+            @property
+            def deployed_indexes(self) -> List[SimpleNamespace]:
+                fake.calls["MatchingEngineIndex.deployed_indexes"] += 1
+                return [
+                    SimpleNamespace(index_endpoint=endpoint_name, deployed_index_id=deployed_index_id)
+                    for endpoint_name, endpoint in fake.endpoints.items()
+                    for deployed_index_id, index_name in endpoint["deployed"].items()
+                    if index_name == self.resource_name
+                ]
+
+            def update_embeddings(
+                self,
+                contents_delta_uri:str,
+                is_complete_overwrite:Optional[bool]=None
+            ) -> "MatchingEngineIndex":
+                # reads local shard directories, as written by LocalBucket
+                fake.calls["MatchingEngineIndex.update_embeddings"] += 1
+                datapoints = fake.indexes[self.resource_name].setdefault("datapoints", {})
+                if is_complete_overwrite:
+                    datapoints.clear()
+                for path in sorted(glob.glob(os.path.join(contents_delta_uri, "*.json"))):
+                    with open(path, encoding="utf-8") as f:
+                        for line in f:
+                            datapoint = json.loads(line)
+                            datapoints[datapoint["id"]] = datapoint
+                return self
+
+            @classmethod
+            def list(cls, filter:Optional[str]=None) -> List["MatchingEngineIndex"]:
+                fake.calls["MatchingEngineIndex.list"] += 1
+                display_name = filter.split("=", 1)[1] if filter else None
+                return [
+                    cls(name) for name, index in list(fake.indexes.items())
+                    if display_name is None or index["display_name"] == display_name
+                ]
+
+            @classmethod
+            def create_tree_ah_index(cls, display_name:str, **kwargs:Any) -> "MatchingEngineIndex":
+                fake.calls["MatchingEngineIndex.create_tree_ah_index"] += 1
+                name = fake._new_name("indexes")
+                fake.indexes[name] = {"display_name": display_name, **kwargs}
+                return cls(name)
+
+        return MatchingEngineIndex
+
+    def _endpoint_class(self) -> type:
+        fake = self
+
+        class MatchingEngineIndexEndpoint:
+            def __init__(self, index_endpoint_name:str):
+                fake.calls["MatchingEngineIndexEndpoint.get"] += 1
+                if index_endpoint_name not in fake.endpoints:
+                    raise NotFound(f"404 IndexEndpoint {index_endpoint_name} not found")
+                self.resource_name = index_endpoint_name
+                self.display_name = fake.endpoints[index_endpoint_name]["display_name"]
+
+            @classmethod
+            def list(cls, filter:Optional[str]=None) -> List["MatchingEngineIndexEndpoint"]:
+                fake.calls["MatchingEngineIndexEndpoint.list"] += 1
+                display_name = filter.split("=", 1)[1] if filter else None
+                return [
+                    cls(name) for name, endpoint in list(fake.endpoints.items())
+                    if display_name is None or endpoint["display_name"] == display_name
+                ]
+
+            @classmethod
+            def create(cls, display_name:str, **kwargs:Any) -> "MatchingEngineIndexEndpoint":
+                fake.calls["MatchingEngineIndexEndpoint.create"] += 1
+                name = fake._new_name("indexEndpoints")
+                fake.endpoints[name] = {"display_name": display_name, "deployed": {}, **kwargs}
+                return cls(name)
+
+            def deploy_index(self, index:Any, deployed_index_id:str, **kwargs:Any) -> "MatchingEngineIndexEndpoint":
+                fake.calls["MatchingEngineIndexEndpoint.deploy_index"] += 1
+                fake.endpoints[self.resource_name]["deployed"][deployed_index_id] = index.resource_name
+                return self
+
+        return MatchingEngineIndexEndpoint
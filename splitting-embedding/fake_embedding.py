@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import math
+import random
+import threading
+import time
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+from embedding_pipeline import MAX_INSTANCES_PER_REQUEST
+
+class FakeEmbedding(BaseEmbedding):
+    """
+        A local stand-in for VertexTextEmbedding.
+
+        Returns deterministic unit vectors derived from a hash of the text and
+        can sleep per request to simulate network latency, so the embedding
+        pipeline can be benchmarked offline. It is a BaseEmbedding, so it can
+        be passed anywhere LlamaIndex validates embed_model, such as
+        VectorStoreIndex.from_vector_store.
+
+        Args:
+        dimensions (int): The number of dimensions per embedding.
+        latency (float): Seconds to sleep per request.
+        model_name (str): The model name reported by the fake.
+
+        Attributes:
+        request_count (int): The number of requests served.
+        text_count (int): The number of texts embedded.
+    """
+
+    dimensions: int = Field(default=768, gt=0, description="The number of dimensions per embedding.")
+    latency: float = Field(default=0.0, ge=0.0, description="Seconds to sleep per request.")
+
+    _request_count: int = PrivateAttr(default=0)
+    _text_count: int = PrivateAttr(default=0)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, dimensions:int=768, latency:float=0.0, model_name:str="fake-embedding", **kwargs:Any):
+        # one request per batch handed in by the pipeline, like VertexTextEmbedding
+        kwargs.setdefault("embed_batch_size", MAX_INSTANCES_PER_REQUEST)
+        super().__init__(dimensions=dimensions, latency=latency, model_name=model_name, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    @property
+    def request_count(self) -> int:
+        return self._request_count
+
+    @property
+    def text_count(self) -> int:
+        return self._text_count
+
+    def _embed(self, text:str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def _count(self, texts:List[str]) -> None:
+        with self._lock:
+            self._request_count += 1
+            self._text_count += len(texts)
+
+    def _get_text_embeddings(self, texts:List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        self._count(texts)
+        return [self._embed(text) for text in texts]
+
+    async def _aget_text_embeddings(self, texts:List[str]) -> List[List[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._count(texts)
+        return [self._embed(text) for text in texts]
+
+    def _get_text_embedding(self, text:str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text:str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query:str) -> List[float]:
+        return self._get_text_embedding(query)
+
+    async def _aget_query_embedding(self, query:str) -> List[float]:
+        return await self._aget_text_embedding(query)
@@ -1,36 +1,44 @@
 # Docs: https://docs.llamaindex.ai/en/stable/examples/vector_stores/VertexAIVectorSearchDemo/
 
-from google.cloud import aiplatform
+# aiplatform, llama_index and the Vertex clients are imported inside the
+# functions that use them, and aiplatform.init runs on first use, so importing
+# this module stays fast for code paths that never touch Vertex
+from __future__ import annotations
 
-from llama_index.core import (
-    StorageContext,
-    Settings,
-    VectorStoreIndex,
-    SimpleDirectoryReader,
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Union
+
+from dotenv import load_dotenv
+
+from async_limiter import DEFAULT_MAX_CONCURRENCY, DEFAULT_TIMEOUT, AsyncLimiter
+from embedding_pipeline import (
+    DEFAULT_MAX_WORKERS,
+    MAX_INSTANCES_PER_REQUEST,
 )
-from llama_index.core.schema import TextNode
-from llama_index.core.vector_stores.types import (
-    MetadataFilters,
-    MetadataFilter,
-    FilterOperator,
+from instrumentation import metrics
+from ingest_pipeline import (
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_UPSERT_BATCH_SIZE,
 )
-from llama_index.llms.vertex import Vertex
-from llama_index.embeddings.vertex import VertexTextEmbedding
-from llama_index.vector_stores.vertexaivectorsearch import VertexAIVectorStore
-from llama_index.core.retrievers import VectorIndexRetriever
-from llama_index.core.query_engine import QueryEngine
-from llama_index.data_structs.node import Node
-from llama_index.indices.service_context import ServiceContext
-from llama_index.indices.vector_store.base import VectorStoreIndex
-from llama_index.storage.docstore import DocumentStore, Document
-from llama_index.storage.index_store import IndexStore
-from llama_index.storage.storage_context import StorageContext
-from llama_index.vector_stores import VectorStore
+from resource_cache import DEFAULT_RESOURCE_CACHE_TTL, ResourceCache
+
+if TYPE_CHECKING:
+    from google.cloud import aiplatform
+    from llama_index.core import Document, StorageContext
+    from llama_index.core.base.response.schema import Response
+    from llama_index.core.node_parser import NodeParser
+    from llama_index.core.query_engine import QueryEngine
+    from llama_index.core.retrievers import VectorIndexRetriever
+    from llama_index.core.schema import NodeWithScore
+    from llama_index.core.vector_stores.types import MetadataFilter
+    from llama_index.embeddings.vertex import VertexTextEmbedding
+    from llama_index.vector_stores.vertexaivectorsearch import VertexAIVectorStore
+
+    from bm25_index import BM25Index
+    from local_vector_store import LocalVectorStore
 
-
-import logging
-from dotenv import load_dotenv
-import os
 load_dotenv()
 
 PROJECT_ID = os.getenv("PROJECT_ID")
@@ -42,10 +50,43 @@ APPROXIMATE_NEIGHBORS_COUNT = os.getenv("APPROXIMATE_NEIGHBORS_COUNT")
 VS_INDEX_NAME = os.getenv("VS_INDEX_NAME")
 VS_INDEX_ENDPOINT_NAME = os.getenv("VS_INDEX_ENDPOINT_NAME")
 DEPLOYED_INDEX_ID = os.getenv("DEPLOYED_INDEX_ID")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", DEFAULT_TIMEOUT))
+RESOURCE_CACHE_PATH = os.getenv("RESOURCE_CACHE_PATH", ".vertex_resources.json")
+RESOURCE_CACHE_TTL = float(os.getenv("RESOURCE_CACHE_TTL", DEFAULT_RESOURCE_CACHE_TTL))
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./data/bm25_index.sqlite")
+
+# Shared by the async search helpers so one event loop does not overload the backends
+search_limiter = AsyncLimiter(SEARCH_MAX_CONCURRENCY, SEARCH_TIMEOUT)
+
+# Display names resolved to resource names, so warm startups skip the list calls
+resource_cache = (
+    ResourceCache(RESOURCE_CACHE_PATH, RESOURCE_CACHE_TTL, project=PROJECT_ID, region=REGION)
+    if RESOURCE_CACHE_PATH else None
+)
 
-# GCP functions
+_aiplatform = None
+_aiplatform_lock = threading.Lock()
 
-aiplatform.init(project=PROJECT_ID, location=REGION)
+def get_aiplatform() -> Any:
+    """
+        Imports and initializes aiplatform on first use.
+
+        Returns:
+        Any: The google.cloud.aiplatform module, initialized with PROJECT_ID and REGION.
+    """
+    global _aiplatform
+    if _aiplatform is None:
+        with _aiplatform_lock:
+            if _aiplatform is None:
+                from google.cloud import aiplatform
+
+                aiplatform.init(project=PROJECT_ID, location=REGION)
+                _aiplatform = aiplatform
+    return _aiplatform
+
+# GCP functions
 
 def create_index(
     index_name:str, 
@@ -53,10 +94,15 @@ def create_index(
     distance_measure_type:str, 
     shard_size:str, 
     index_update_method:str, 
-    approximate_neighbors_count:int
+    approximate_neighbors_count:int,
+    client:Any=None,
+    cache:Optional[ResourceCache]=resource_cache
 ) -> aiplatform.MatchingEngineIndex:
     """
-        Creates a Vector Search index.
+        Creates a Vector Search index, or returns the existing one.
+
+        The resolved resource name is cached, so warm startups load the index
+        directly instead of listing indexes.
 
         Args:
         index_name (str): The name of the index to be created.
@@ -65,14 +111,31 @@ def create_index(
         shard_size (str): The size of the shard.
         index_update_method (str): The method to use for updating the index.
         approximate_neighbors_count (int): The approximate number of neighbors to consider.
+        client (Any): The aiplatform module, or a stand-in such as FakeAiplatform. Defaults to get_aiplatform().
+        cache (Optional[ResourceCache]): The resolved-resource cache. Lookups are not cached if None.
 
         Returns:
         aiplatform.MatchingEngineIndex: The created Vector Search index.
     """
+    client = client or get_aiplatform()
+    cached = cache.get("index", index_name) if cache else None
+    if cached:
+        try:
+            vs_index = client.MatchingEngineIndex(index_name=cached["resource_name"])
+            if vs_index.display_name == index_name:
+                logging.info(
+                    f"Vector Search index {vs_index.display_name} loaded from cache with resource name {vs_index.resource_name}"
+                )
+                return vs_index
+            logging.warning(f"Cached Vector Search index {cached['resource_name']} is not named {index_name}")
+        except Exception as e:
+            logging.warning(f"Cached Vector Search index {cached['resource_name']} could not be loaded: {e}")
+        cache.invalidate("index", index_name)
+
     # Check if the index exists
     index_names = [
         index.resource_name
-        for index in aiplatform.MatchingEngineIndex.list(
+        for index in client.MatchingEngineIndex.list(
             filter=f"display_name={index_name}"
         )
     ]
@@ -80,44 +143,73 @@ def create_index(
     if len(index_names) == 0:
         logging.info(f"Creating Vector Search index {index_name} ...")
         try:
-            vs_index = aiplatform.MatchingEngineIndex.create_tree_ah_index(
-                display_name=VS_INDEX_NAME,
-                dimensions=VS_DIMENSIONS,
-                distance_measure_type="DOT_PRODUCT_DISTANCE",
-                shard_size="SHARD_SIZE_SMALL",
-                index_update_method="STREAM_UPDATE",
-                approximate_neighbors_count=APPROXIMATE_NEIGHBORS_COUNT,
+            vs_index = client.MatchingEngineIndex.create_tree_ah_index(
+                display_name=index_name,
+                dimensions=dimensions,
+                distance_measure_type=distance_measure_type,
+                shard_size=shard_size,
+                index_update_method=index_update_method,
+                approximate_neighbors_count=approximate_neighbors_count,
             )
             logging.info(
                 f"Vector Search index {vs_index.display_name} created with resource name {vs_index.resource_name}"
             )
-            return vs_index
         except Exception as e:
             logging.error(f"Failed to create Vector Search index: {e}")
+            return None
     else:
-        vs_index = aiplatform.MatchingEngineIndex(index_name=index_names[0])
+        vs_index = client.MatchingEngineIndex(index_name=index_names[0])
         logging.info(
             f"Vector Search index {vs_index.display_name} exists with resource name {vs_index.resource_name}"
         )
-        return vs_index
+
+    if cache:
+        cache.set("index", index_name, {"resource_name": vs_index.resource_name})
+    return vs_index
 
 def create_endpoint(
     endpoint_name:str, 
     public_endpoint_enabled:bool=False,
-    enable_private_service_connect:bool=True
+    enable_private_service_connect:bool=True,
+    client:Any=None,
+    cache:Optional[ResourceCache]=resource_cache
 ) -> aiplatform.MatchingEngineIndexEndpoint:
     """
-        Creates a Vector Search index endpoint.
+        Creates a Vector Search index endpoint, or returns the existing one.
+
+        The resolved resource name is cached, so warm startups load the
+        endpoint directly instead of listing endpoints.
 
         Args:
         endpoint_name (str): The name of the index endpoint to be created.
+        public_endpoint_enabled (bool): Whether to create a public endpoint.
+        enable_private_service_connect (bool): Whether to enable Private Service Connect.
+        client (Any): The aiplatform module, or a stand-in such as FakeAiplatform. Defaults to get_aiplatform().
+        cache (Optional[ResourceCache]): The resolved-resource cache. Lookups are not cached if None.
 
         Returns:
         aiplatform.MatchingEngineIndexEndpoint: The created Vector Search index endpoint.
     """
+    client = client or get_aiplatform()
+    cached = cache.get("endpoint", endpoint_name) if cache else None
+    if cached:
+        try:
+            vs_endpoint = client.MatchingEngineIndexEndpoint(
+                index_endpoint_name=cached["resource_name"]
+            )
+            if vs_endpoint.display_name == endpoint_name:
+                logging.info(
+                    f"Vector Search index endpoint {vs_endpoint.display_name} loaded from cache with resource name {vs_endpoint.resource_name}"
+                )
+                return vs_endpoint
+            logging.warning(f"Cached Vector Search index endpoint {cached['resource_name']} is not named {endpoint_name}")
+        except Exception as e:
+            logging.warning(f"Cached Vector Search index endpoint {cached['resource_name']} could not be loaded: {e}")
+        cache.invalidate("endpoint", endpoint_name)
+
     endpoint_names = [
         endpoint.resource_name
-        for endpoint in aiplatform.MatchingEngineIndexEndpoint.list(
+        for endpoint in client.MatchingEngineIndexEndpoint.list(
             filter=f"display_name={endpoint_name}"
         )
     ]
@@ -126,7 +218,7 @@ def create_endpoint(
         logging.info(
             f"Creating Vector Search index endpoint {endpoint_name} ..."
         )
-        vs_endpoint = aiplatform.MatchingEngineIndexEndpoint.create(
+        vs_endpoint = client.MatchingEngineIndexEndpoint.create(
             display_name=endpoint_name, 
             public_endpoint_enabled=public_endpoint_enabled,
             enable_private_service_connect=enable_private_service_connect
@@ -134,15 +226,17 @@ def create_endpoint(
         logging.info(
             f"Vector Search index endpoint {vs_endpoint.display_name} created with resource name {vs_endpoint.resource_name}"
         )
-        return vs_endpoint
     else:
-        vs_endpoint = aiplatform.MatchingEngineIndexEndpoint(
+        vs_endpoint = client.MatchingEngineIndexEndpoint(
             index_endpoint_name=endpoint_names[0]
         )
         logging.info(
             f"Vector Search index endpoint {vs_endpoint.display_name} exists with resource name {vs_endpoint.resource_name}"
         )
-        return vs_endpoint
+
+    if cache:
+        cache.set("endpoint", endpoint_name, {"resource_name": vs_endpoint.resource_name})
+    return vs_endpoint
 
 def deploy_index_at_endpoint(
     index:aiplatform.MatchingEngineIndex, 
@@ -151,11 +245,18 @@ def deploy_index_at_endpoint(
     display_name:str, 
     machine_type:str="e2-standard-16", 
     min_replica_count:int=1, 
-    max_replica_count:int=1
+    max_replica_count:int=1,
+    client:Any=None,
+    cache:Optional[ResourceCache]=resource_cache
 ) -> None:
     """
         Deploys a Vector Search index at an endpoint.
 
+        A known deployment is cached, so warm startups skip reading the
+        index's deployed indexes. A cached deployment is only used if it is
+        at this endpoint with this deployed_index_id; otherwise it is dropped
+        and the deployment is looked up again.
+
         Args:
         index (aiplatform.MatchingEngineIndex): The index to be deployed.
         endpoint (aiplatform.MatchingEngineIndexEndpoint): The endpoint to deploy the index at.
@@ -164,7 +265,27 @@ def deploy_index_at_endpoint(
         machine_type (str): The machine type to deploy the index at.
         min_replica_count (int): The minimum number of replicas to deploy the index at.
         max_replica_count (int): The maximum number of replicas to deploy the index at.
+        client (Any): The aiplatform module, or a stand-in such as FakeAiplatform. Defaults to get_aiplatform().
+        cache (Optional[ResourceCache]): The resolved-resource cache. Lookups are not cached if None.
     """
+    client = client or get_aiplatform()
+    cache_key = index.resource_name
+    cached = cache.get("deployment", cache_key) if cache else None
+    if cached:
+        if (
+            cached["index_endpoint"] == endpoint.resource_name
+            and cached["deployed_index_id"] == deployed_index_id
+        ):
+            logging.info(
+                f"Vector Search index {index.display_name} is already deployed at endpoint {cached['index_endpoint']} (cached)"
+            )
+            return
+        logging.warning(
+            f"Cached deployment of Vector Search index {index.display_name} as {cached['deployed_index_id']} "
+            f"at {cached['index_endpoint']} does not match {deployed_index_id} at {endpoint.resource_name}"
+        )
+        cache.invalidate("deployment", cache_key)
+
     index_endpoints = [
         (deployed_index.index_endpoint, deployed_index.deployed_index_id)
         for deployed_index in index.deployed_indexes
@@ -185,15 +306,46 @@ def deploy_index_at_endpoint(
         logging.info(
             f"Vector Search index {index.display_name} is deployed at endpoint {endpoint.display_name}"
         )
-        pass
+        index_endpoints = [(endpoint.resource_name, deployed_index_id)]
     else:
-        vs_deployed_index = aiplatform.MatchingEngineIndexEndpoint(
+        vs_deployed_index = client.MatchingEngineIndexEndpoint(
             index_endpoint_name=index_endpoints[0][0]
         )
         logging.info(
             f"Vector Search index {index.display_name} is already deployed at endpoint {endpoint.display_name}"
         )
-        pass
+
+    if cache:
+        cache.set(
+            "deployment",
+            cache_key,
+            {"index_endpoint": index_endpoints[0][0], "deployed_index_id": index_endpoints[0][1]},
+        )
+
+def invalidate_resource_cache(
+    index_name:Optional[str]=None,
+    endpoint_name:Optional[str]=None,
+    index_resource_name:Optional[str]=None,
+    cache:Optional[ResourceCache]=resource_cache
+) -> None:
+    """
+        Drops cached lookups, e.g. after a query fails because a cached
+        index, endpoint or deployment no longer exists.
+
+        Args:
+        index_name (Optional[str]): The index display name.
+        endpoint_name (Optional[str]): The index endpoint display name.
+        index_resource_name (Optional[str]): The index resource name whose deployment to forget.
+        cache (Optional[ResourceCache]): The resolved-resource cache.
+    """
+    if cache is None:
+        return
+    if index_name:
+        cache.invalidate("index", index_name)
+    if endpoint_name:
+        cache.invalidate("endpoint", endpoint_name)
+    if index_resource_name:
+        cache.invalidate("deployment", index_resource_name)
 
 # LlamaIndex functions
 
@@ -217,6 +369,9 @@ def setup_vector_store(
         Returns:
         VertexAIVectorStore: The Vector Store.
     """
+    from llama_index.vector_stores.vertexaivectorsearch import VertexAIVectorStore
+
+    get_aiplatform()
     # setup storage
     vector_store = VertexAIVectorStore(
         project_id=project_id,
@@ -228,6 +383,55 @@ def setup_vector_store(
 
     return vector_store
 
+def setup_local_vector_store(
+    persist_dir:str,
+    dimensions:int,
+    index_type:str="exact",
+    nprobe:Optional[int]=None
+) -> LocalVectorStore:
+    """
+        Setups a local Vector Store, a drop-in for VertexAIVectorStore in
+        development, CI and for small corpora.
+
+        Args:
+        persist_dir (str): The directory holding the store's files.
+        dimensions (int): The number of dimensions per embedding.
+        index_type (str): "exact" for brute-force search, or "ivf" for approximate search over large sets.
+        nprobe (Optional[int]): The number of IVF clusters scored per query. Defaults to DEFAULT_NPROBE.
+
+        Returns:
+        LocalVectorStore: The Vector Store.
+    """
+    from local_vector_store import DEFAULT_NPROBE, LocalVectorStore
+
+    vector_store = LocalVectorStore(
+        persist_dir=persist_dir,
+        dimensions=dimensions,
+        index_type=index_type,
+        nprobe=nprobe or DEFAULT_NPROBE,
+    )
+
+    return vector_store
+
+def setup_lexical_index(
+    path:Optional[str]=LEXICAL_INDEX_PATH
+) -> BM25Index:
+    """
+        Setups a local BM25 index, filled during ingest alongside the Vector
+        Store and queried by hybrid_search.
+
+        Args:
+        path (Optional[str]): The SQLite database the index is stored in. Kept in memory only if None.
+
+        Returns:
+        BM25Index: The index.
+    """
+    from bm25_index import BM25Index
+
+    if path is None:
+        return BM25Index()
+    return BM25Index.load(path)
+
 def set_storage_context(
     vector_store:VertexAIVectorStore
 ) -> StorageContext:
@@ -240,6 +444,8 @@ def set_storage_context(
         Returns:
         StorageContext: The Storage Context.
     """
+    from llama_index.core import StorageContext
+
     # set storage context
     storage_context = StorageContext.from_defaults(vector_store=vector_store)
 
@@ -248,7 +454,10 @@ def set_storage_context(
 def set_embed_model(
     project_id:str, 
     region:str, 
-    model_name:str="textembedding-gecko@003"
+    model_name:str="textembedding-gecko@003",
+    cache_path:Optional[str]=EMBEDDING_CACHE_PATH,
+    cache_max_entries:int=1_000_000,
+    cache_dtype:str="float16"
 ) -> VertexTextEmbedding:
     """
         Setups an embedding model.
@@ -257,17 +466,33 @@ def set_embed_model(
         project_id (str): The project ID.
         region (str): The region.
         model_name (str): The model name.
+        cache_path (Optional[str]): The SQLite embedding cache path. No cache is used if None.
+        cache_max_entries (int): The maximum number of cached embeddings.
+        cache_dtype (str): The cache storage type, "float32", "float16" or "int8".
 
         Returns:
-        VertexTextEmbedding: The embedding model.
+        VertexTextEmbedding: The embedding model, wrapped in a CachedEmbedding if cache_path is set.
     """
+    from llama_index.core import Settings
+    from llama_index.embeddings.vertex import VertexTextEmbedding
+
     # configure embedding model
+    # embed_batch_size matches the per-request instance limit so each
+    # get_text_embedding_batch call issued by embed_texts is a single request
     embed_model = VertexTextEmbedding(
         model_name=model_name,
         project=project_id,
         location=region,
+        embed_batch_size=MAX_INSTANCES_PER_REQUEST,
     )
 
+    if cache_path:
+        from embedding_cache import wrap_with_cache
+
+        embed_model = wrap_with_cache(
+            embed_model, cache_path, max_entries=cache_max_entries, dtype=cache_dtype
+        )
+
     # setup the index/query process, ie the embedding model (and completion if used)
     Settings.embed_model = embed_model
 
@@ -275,28 +500,91 @@ def set_embed_model(
 
 def add_nodes_to_vector_store(
     vector_store:VertexAIVectorStore, 
-    text_list:List[str], 
-    embed_model:VertexTextEmbedding
-) -> None:
+    text_list:Iterable[str], 
+    embed_model:VertexTextEmbedding,
+    max_workers:int=DEFAULT_MAX_WORKERS,
+    source_name:str="text_list",
+    checkpoint_path:Optional[str]=None,
+    dedup:Optional[str]="exact",
+    dedup_threshold:Optional[float]=None,
+    dedup_max_distance:Optional[int]=None,
+    dedup_max_entries:Optional[int]=None,
+    lexical_index:Optional[BM25Index]=None
+) -> Dict[str, Dict[str, Any]]:
     """
         Adds nodes to a Vector Store.
 
+        Node IDs are derived from source_name and each text, so adding the
+        same texts again upserts the existing vectors. Duplicate texts are
+        dropped before embedding, keeping the first of each group.
+
         Args:
         vector_store (VertexAIVectorStore): The Vector Store.
-        text_list (List[str]): The list of texts.
+        text_list (Iterable[str]): The texts. They are read once, so a generator works.
         embed_model (VertexTextEmbedding): The embedding model.
-    """
-    nodes = [
-        TextNode(text=text, embedding=embed_model.get_text_embedding(text))
-        for text in text_list
-    ]
+        max_workers (int): The maximum number of concurrent embedding requests.
+        source_name (str): The name node IDs are derived from.
+        checkpoint_path (Optional[str]): The checkpoint journal path, to resume an interrupted load.
+        dedup (Optional[str]): "exact", "minhash" or "simhash" to drop duplicates, or None to keep every text.
+        dedup_threshold (Optional[float]): The MinHash Jaccard similarity at or above which texts are near duplicates. Defaults to 0.85.
+        dedup_max_distance (Optional[int]): The SimHash Hamming distance at or below which texts are near duplicates. Defaults to 3.
+        dedup_max_entries (Optional[int]): The maximum number of kept texts remembered for dedup, about 7 KB each with "minhash". Unbounded if None.
+        lexical_index (Optional[BM25Index]): A lexical index to fill with the same nodes, for hybrid_search.
 
-    try:
-        vector_store.add_nodes(nodes)
-        logging.info(f"Added {len(nodes)} nodes to vector store")
-    except Exception as e:
-        logging.error(f"Failed to add records to vector store: {e}")
-    pass
+        Returns:
+        Dict[str, Dict[str, Any]]: Per-stage counters and throughput, and the dedup report.
+    """
+    from ingest_pipeline import stream_records_to_vector_store
+    from retriever_service import invalidate_retriever_services
+
+    if dedup is None:
+        stats = stream_records_to_vector_store(
+            vector_store,
+            embed_model,
+            ({"text": text} for text in text_list),
+            "text",
+            max_workers=max_workers,
+            source_name=source_name,
+            checkpoint_path=checkpoint_path,
+            lexical_index=lexical_index,
+        )
+        invalidate_retriever_services(vector_store)
+        return stats
+
+    from dedup import Deduplicator, RequestCounter, log_report
+
+    options = {"threshold": dedup_threshold, "max_distance": dedup_max_distance, "max_entries": dedup_max_entries}
+    deduplicator = Deduplicator(dedup, **{key: value for key, value in options.items() if value is not None})
+    # requests are counted as the texts stream past, so text_list is read once
+    all_requests = RequestCounter(DEFAULT_UPSERT_BATCH_SIZE)
+    kept_requests = RequestCounter(DEFAULT_UPSERT_BATCH_SIZE)
+
+    def counted(texts:Iterable[str]) -> Iterable[str]:
+        for text in texts:
+            all_requests.add(text)
+            yield text
+
+    def unique_records() -> Iterable[Dict[str, Any]]:
+        for text in deduplicator.filter(counted(text_list)):
+            kept_requests.add(text)
+            yield {"text": text}
+
+    stats = stream_records_to_vector_store(
+        vector_store,
+        embed_model,
+        unique_records(),
+        "text",
+        max_workers=max_workers,
+        source_name=source_name,
+        checkpoint_path=checkpoint_path,
+        lexical_index=lexical_index,
+    )
+    invalidate_retriever_services(vector_store)
+    report = deduplicator.report
+    report.requests_saved = all_requests.requests - kept_requests.requests
+    log_report(report)
+    stats["dedup"] = report.to_dict()
+    return stats
 
 def create_retriever(
     vector_store:VertexAIVectorStore, 
@@ -312,6 +600,8 @@ def create_retriever(
         Returns:
         VectorIndexRetriever: The retriever.
     """
+    from llama_index.core import VectorStoreIndex
+
     index = VectorStoreIndex.from_vector_store(
         vector_store=vector_store, embed_model=embed_model
     )
@@ -328,31 +618,120 @@ def create_retriever(
 def add_records_to_vector_store_with_metadata(
     vector_store:VertexAIVectorStore, 
     embed_model:VertexTextEmbedding, 
-    dict_list:List[Dict[str, str]],
-    embed_field:str
-) -> None:
+    dict_list:Union[Iterable[Dict[str, Any]], str],
+    embed_field:str,
+    max_workers:int=DEFAULT_MAX_WORKERS,
+    batch_size:int=DEFAULT_UPSERT_BATCH_SIZE,
+    queue_size:int=DEFAULT_QUEUE_SIZE,
+    source_name:Optional[str]=None,
+    checkpoint_path:Optional[str]=None,
+    lexical_index:Optional[BM25Index]=None,
+    id_field:Optional[str]=None
+) -> Dict[str, Dict[str, Any]]:
     """
         Adds records to a Vector Store with metadata.
 
+        Records are streamed through read -> embed -> upsert stages and
+        upserted in fixed-size batches, so memory stays bounded and a failed
+        batch does not lose the others. Node IDs are derived from the id_field,
+        so changed metadata is upserted in place, or else from the whole
+        record, and with a checkpoint_path a restarted load skips batches
+        already committed.
+
         Args:
         vector_store (VertexAIVectorStore): The Vector Store.
         embed_model (VertexTextEmbedding): The embedding model.
-        dict_list (List[Dict[str, str]]): The list of dictionaries.
+        dict_list (Union[Iterable[Dict[str, Any]], str]): The dictionaries, or the path of a .jsonl or .csv file.
+        embed_field (str): The field to embed.
+        max_workers (int): The maximum number of concurrent embedding requests.
+        batch_size (int): The number of records per upsert.
+        queue_size (int): The maximum number of batches buffered between stages.
+        source_name (Optional[str]): The name node IDs are derived from. Defaults to the file path.
+        checkpoint_path (Optional[str]): The checkpoint journal path, to resume an interrupted load.
+        lexical_index (Optional[BM25Index]): A lexical index to fill with the same records, for hybrid_search.
+        id_field (Optional[str]): A field that uniquely identifies each record, e.g. a SKU.
+
+        Returns:
+        Dict[str, Dict[str, Any]]: Per-stage counters and throughput.
+    """
+    from ingest_pipeline import stream_records_to_vector_store
+    from retriever_service import invalidate_retriever_services
+
+    stats = stream_records_to_vector_store(
+        vector_store,
+        embed_model,
+        dict_list,
+        embed_field,
+        batch_size=batch_size,
+        queue_size=queue_size,
+        max_workers=max_workers,
+        source_name=source_name,
+        checkpoint_path=checkpoint_path,
+        lexical_index=lexical_index,
+        id_field=id_field,
+    )
+    invalidate_retriever_services(vector_store)
+    return stats
+
+def bulk_add_records_to_index(
+    index:aiplatform.MatchingEngineIndex,
+    embed_model:VertexTextEmbedding,
+    dict_list:Union[Iterable[Dict[str, Any]], str],
+    embed_field:str,
+    gcs_bucket_name:Optional[str]=GCS_BUCKET_NAME,
+    bucket:Optional[Any]=None,
+    prefix:Optional[str]=None,
+    max_workers:int=DEFAULT_MAX_WORKERS,
+    source_name:Optional[str]=None,
+    is_complete_overwrite:bool=False,
+    lexical_index:Optional[BM25Index]=None,
+    id_field:Optional[str]=None
+) -> Dict[str, Any]:
+    """
+        Adds records to an index with one batch update instead of online
+        upserts, for large initial loads.
+
+        The records are embedded and written with their restricts to
+        sharded JSONL files under a new directory in the bucket, then
+        index.update_embeddings is called on that directory.
+
+        Args:
+        index (aiplatform.MatchingEngineIndex): The index.
+        embed_model (VertexTextEmbedding): The embedding model.
+        dict_list (Union[Iterable[Dict[str, Any]], str]): The dictionaries, or the path of a .jsonl or .csv file.
         embed_field (str): The field to embed.
+        gcs_bucket_name (Optional[str]): The GCS bucket name.
+        bucket (Optional[Any]): A bucket to write to instead, e.g. a LocalBucket for offline runs.
+        prefix (Optional[str]): The directory for this update. Defaults to a new timestamped directory.
+        max_workers (int): The maximum number of concurrent embedding requests.
+        source_name (Optional[str]): The name node IDs are derived from. Defaults to the file path.
+        is_complete_overwrite (bool): Whether the update replaces the whole index.
+        lexical_index (Optional[BM25Index]): A lexical index to fill with the same records, for hybrid_search.
+        id_field (Optional[str]): A field that uniquely identifies each record, e.g. a SKU.
+
+        Returns:
+        Dict[str, Any]: The contents URI, shard names, datapoint count and per-stage stats.
     """
-    nodes = []
-    for d in dict_list:
-        text = d.pop(embed_field)
-        embedding = embed_model.get_text_embedding(text)
-        metadata = {**d}
-        nodes.append(TextNode(text=text, embedding=embedding, metadata=metadata))
-
-    try:
-        vector_store.add(nodes)
-        logging.info(f"Added {len(records)} records with metadata to vector store")
-    except Exception as e:
-        logging.error(f"Failed to add records to vector store: {e}")
-    pass
+    from batch_update import GCSBucket, bulk_load_records
+    from retriever_service import invalidate_retriever_services
+
+    result = bulk_load_records(
+        index,
+        embed_model,
+        dict_list,
+        embed_field,
+        bucket or GCSBucket(gcs_bucket_name),
+        prefix=prefix,
+        max_workers=max_workers,
+        source_name=source_name,
+        is_complete_overwrite=is_complete_overwrite,
+        lexical_index=lexical_index,
+        id_field=id_field,
+    )
+    # the index is not tied to one Vector Store object, so every service is invalidated
+    invalidate_retriever_services()
+    return result
+
 """
 records = [
      {
@@ -384,17 +763,36 @@ index = create_index(VS_INDEX_NAME, VS_DIMENSIONS, "DOT_PRODUCT_DISTANCE", "SHAR
 
 endpoint = create_endpoint(VS_INDEX_ENDPOINT_NAME)
 
+# the resource names are cached in RESOURCE_CACHE_PATH, so the next startup
+# skips the list calls; against an in-memory control plane instead:
+from fake_aiplatform import FakeAiplatform
+fake = FakeAiplatform()
+index = create_index(VS_INDEX_NAME, 768, "DOT_PRODUCT_DISTANCE", "SHARD_SIZE_SMALL", "STREAM_UPDATE", 150, client=fake, cache=None)
+
 vector_store = setup_vector_store(PROJECT_ID, REGION, index, endpoint, GCS_BUCKET_NAME)
+# or, without a deployed endpoint
+vector_store = setup_local_vector_store("./data/local_vector_store", 768)
 
 embed_model = set_embed_model(PROJECT_ID, REGION)
 
 add_records_to_vector_store_with_embedding(vector_store, embed_model, records, "description")
+
+# with a BM25 index filled from the same batches, for hybrid_search
+lexical_index = setup_lexical_index()
+add_records_to_vector_store_with_metadata(vector_store, embed_model, records, "description", lexical_index=lexical_index)
+
+# or, for a large initial load, one batch update from sharded files in GCS_BUCKET_NAME
+bulk_add_records_to_index(index, embed_model, "./data/catalog.jsonl", "description")
+# offline, with a local directory standing in for the bucket
+from batch_update import LocalBucket
+bulk_add_records_to_index(index, embed_model, records, "description", bucket=LocalBucket("./data/bucket"))
 """
 
 def similarity_search_without_filters(
     vector_store:VertexAIVectorStore, 
     embed_model:VertexTextEmbedding,
-    query:str
+    query:str,
+    similarity_top_k:Optional[int]=None
 ) -> List[Document]:
     """
         Performs a similarity search without filters.
@@ -403,12 +801,16 @@ def similarity_search_without_filters(
         vector_store (VertexAIVectorStore): The Vector Store.
         embed_model (VertexTextEmbedding): The embedding model.
         query (str): The query.
+        similarity_top_k (Optional[int]): The number of results.
 
         Returns:
         List[Document]: The list of documents.
     """
-    retriever = create_retriever(vector_store, embed_model)
-    response = retriever.retrieve(query)
+    from retriever_service import get_retriever_service
+
+    service = get_retriever_service(vector_store, embed_model)
+    with metrics.span("similarity_search", filtered=False):
+        response = service.retrieve(query, similarity_top_k=similarity_top_k)
 
     return response
 
@@ -418,24 +820,48 @@ for row in response:
     print(f"Text: {row.get_text()}")
     print(f"   Score: {row.get_score():.3f}")
     print(f"   Metadata: {row.metadata}")
+
+# with METRICS_ENABLED=1, time is split into query_embedding, retrieval and
+# vector_store_query spans; scrape them or log a JSON snapshot
+metrics.serve_prometheus(port=9464)  # http://127.0.0.1:9464/metrics
+metrics.log_json()
 """
 
 def similarity_search_with_filters(
     vector_store:VertexAIVectorStore, 
     embed_model:VertexTextEmbedding,
     query:str,
-    filters:List[MetadataFilter]
-) -> None:
-    retriever = create_retriever(vector_store, embed_model)
+    filters:List[MetadataFilter],
+    similarity_top_k:Optional[int]=None
+) -> List[Document]:
+    """
+        Performs a similarity search restricted by metadata filters.
 
-    response = retriever.retrieve(
-        query=query,
-        filters=filters
-    )
+        Args:
+        vector_store (VertexAIVectorStore): The Vector Store.
+        embed_model (VertexTextEmbedding): The embedding model.
+        query (str): The query.
+        filters (List[MetadataFilter]): The metadata filters.
+        similarity_top_k (Optional[int]): The number of results.
+
+        Returns:
+        List[Document]: The list of documents.
+    """
+    from retriever_service import get_retriever_service
+
+    service = get_retriever_service(vector_store, embed_model)
+    with metrics.span("similarity_search", filtered=True):
+        response = service.retrieve(
+            query,
+            similarity_top_k=similarity_top_k,
+            filters=filters
+        )
 
     return response
 
 """
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilter
+
 filters=[
      MetadataFilter(key="color", value="blue"),
      MetadataFilter(key="price", operator=FilterOperator.GT, value=70.0),
@@ -443,26 +869,264 @@ filters=[
  similarity_search_with_filters(vector_store, embed_model, "pants", filters)
  """
 
+async def async_similarity_search_without_filters(
+    vector_store:VertexAIVectorStore, 
+    embed_model:VertexTextEmbedding,
+    query:str,
+    similarity_top_k:Optional[int]=None,
+    timeout:Optional[float]=None
+) -> List[Document]:
+    """
+        Asynchronously performs a similarity search without filters.
+
+        Args:
+        vector_store (VertexAIVectorStore): The Vector Store.
+        embed_model (VertexTextEmbedding): The embedding model.
+        query (str): The query.
+        similarity_top_k (Optional[int]): The number of results.
+        timeout (Optional[float]): The timeout in seconds. Defaults to SEARCH_TIMEOUT.
+
+        Returns:
+        List[Document]: The list of documents.
+    """
+    from retriever_service import get_retriever_service
+
+    service = get_retriever_service(vector_store, embed_model)
+    return await search_limiter.run(
+        service.aretrieve(query, similarity_top_k=similarity_top_k),
+        timeout=timeout
+    )
+
+async def async_similarity_search_with_filters(
+    vector_store:VertexAIVectorStore, 
+    embed_model:VertexTextEmbedding,
+    query:str,
+    filters:List[MetadataFilter],
+    similarity_top_k:Optional[int]=None,
+    timeout:Optional[float]=None
+) -> List[Document]:
+    """
+        Asynchronously performs a similarity search restricted by metadata filters.
+
+        Args:
+        vector_store (VertexAIVectorStore): The Vector Store.
+        embed_model (VertexTextEmbedding): The embedding model.
+        query (str): The query.
+        filters (List[MetadataFilter]): The metadata filters.
+        similarity_top_k (Optional[int]): The number of results.
+        timeout (Optional[float]): The timeout in seconds. Defaults to SEARCH_TIMEOUT.
+
+        Returns:
+        List[Document]: The list of documents.
+    """
+    from retriever_service import get_retriever_service
+
+    service = get_retriever_service(vector_store, embed_model)
+    return await search_limiter.run(
+        service.aretrieve(query, similarity_top_k=similarity_top_k, filters=filters),
+        timeout=timeout
+    )
+
+"""
+responses = await asyncio.gather(*[
+    async_similarity_search_without_filters(vector_store, embed_model, query)
+    for query in ["pants", "blue jeans", "warm sweater"]
+])
+"""
+
+def hybrid_search(
+    vector_store:VertexAIVectorStore, 
+    embed_model:VertexTextEmbedding,
+    lexical_index:BM25Index,
+    query:str,
+    filters:Optional[List[MetadataFilter]]=None,
+    similarity_top_k:Optional[int]=None,
+    rrf_k:Optional[int]=None
+) -> List[NodeWithScore]:
+    """
+        Performs a similarity search and a BM25 search, fused by reciprocal
+        rank fusion.
+
+        The BM25 side runs locally, so exact terms such as SKUs are found
+        without raising the top_k of the remote vector search.
+
+        Args:
+        vector_store (VertexAIVectorStore): The Vector Store.
+        embed_model (VertexTextEmbedding): The embedding model.
+        lexical_index (BM25Index): The lexical index, filled during ingest.
+        query (str): The query.
+        filters (Optional[List[MetadataFilter]]): The metadata filters, applied to both searches.
+        similarity_top_k (Optional[int]): The number of results, and of candidates from each search.
+        rrf_k (Optional[int]): The reciprocal rank fusion offset. Defaults to DEFAULT_RRF_K (60).
+
+        Returns:
+        List[NodeWithScore]: The fused results, scored by fused score.
+    """
+    from bm25_index import DEFAULT_RRF_K, reciprocal_rank_fusion
+    from retriever_service import get_retriever_service
+
+    service = get_retriever_service(vector_store, embed_model)
+    top_k = similarity_top_k or service.similarity_top_k
+    with metrics.span("hybrid_search", filtered=bool(filters)):
+        vector_results = service.retrieve(query, similarity_top_k=top_k, filters=filters)
+        lexical_results = lexical_index.search(query, top_k, _lexical_predicate(filters))
+        return reciprocal_rank_fusion([vector_results, lexical_results], top_k, rrf_k or DEFAULT_RRF_K)
+
+async def async_hybrid_search(
+    vector_store:VertexAIVectorStore, 
+    embed_model:VertexTextEmbedding,
+    lexical_index:BM25Index,
+    query:str,
+    filters:Optional[List[MetadataFilter]]=None,
+    similarity_top_k:Optional[int]=None,
+    rrf_k:Optional[int]=None,
+    timeout:Optional[float]=None
+) -> List[NodeWithScore]:
+    """
+        Asynchronously performs a hybrid search; see hybrid_search.
+
+        Args:
+        vector_store (VertexAIVectorStore): The Vector Store.
+        embed_model (VertexTextEmbedding): The embedding model.
+        lexical_index (BM25Index): The lexical index, filled during ingest.
+        query (str): The query.
+        filters (Optional[List[MetadataFilter]]): The metadata filters, applied to both searches.
+        similarity_top_k (Optional[int]): The number of results, and of candidates from each search.
+        rrf_k (Optional[int]): The reciprocal rank fusion offset. Defaults to DEFAULT_RRF_K (60).
+        timeout (Optional[float]): The timeout in seconds of the vector search. Defaults to SEARCH_TIMEOUT.
+
+        Returns:
+        List[NodeWithScore]: The fused results, scored by fused score.
+    """
+    from bm25_index import DEFAULT_RRF_K, reciprocal_rank_fusion
+    from retriever_service import get_retriever_service
+
+    service = get_retriever_service(vector_store, embed_model)
+    top_k = similarity_top_k or service.similarity_top_k
+    vector_results = await search_limiter.run(
+        service.aretrieve(query, similarity_top_k=top_k, filters=filters),
+        timeout=timeout
+    )
+    lexical_results = lexical_index.search(query, top_k, _lexical_predicate(filters))
+    return reciprocal_rank_fusion([vector_results, lexical_results], top_k, rrf_k or DEFAULT_RRF_K)
+
+def _lexical_predicate(filters:Optional[List[MetadataFilter]]) -> Optional[Callable[[Dict[str, Any]], bool]]:
+    from local_vector_store import compile_filters
+    from retriever_service import to_metadata_filters
+
+    metadata_filters = to_metadata_filters(filters)
+    return compile_filters(metadata_filters) if metadata_filters is not None else None
+
+"""
+lexical_index = setup_lexical_index()
+for row in hybrid_search(vector_store, embed_model, lexical_index, "SKU-1042 denim", similarity_top_k=5):
+    print(f"{row.get_score():.4f} {row.node.node_id} {row.get_text()[:60]}")
+"""
+
 # Example 2: Parse, Index and Query PDFs using Vertex AI Vector Search and Gemini Pro¶
 
 def create_query_engine(
     documents:List[Document],
     vector_store:VertexAIVectorStore,
-    storage_context:StorageContext
+    storage_context:StorageContext,
+    node_parser:Optional[NodeParser]=None
 ) -> QueryEngine:
+    """
+        Creates a query engine over documents, chunking and indexing them.
+
+        Args:
+        documents (List[Document]): The documents, e.g. one per PDF page from SimpleDirectoryReader.
+        vector_store (VertexAIVectorStore): The Vector Store.
+        storage_context (StorageContext): The Storage Context.
+        node_parser (Optional[NodeParser]): The chunker. Defaults to a TokenBudgetChunker.
+
+        Returns:
+        QueryEngine: The query engine.
+    """
+    from llama_index.core import VectorStoreIndex
+
+    from token_chunker import TokenBudgetChunker
 
     index = VectorStoreIndex.from_documents(
-        documents, storage_context=storage_context
+        documents,
+        storage_context=storage_context,
+        transformations=[node_parser or TokenBudgetChunker()],
+    )
+    query_engine = index.as_query_engine()
+
+    return query_engine
+
+def create_incremental_query_engine(
+    data_path:str,
+    vector_store:VertexAIVectorStore,
+    embed_model:VertexTextEmbedding,
+    manifest_path:str,
+    lexical_index:Optional[BM25Index]=None
+) -> QueryEngine:
+    """
+        Creates a query engine after re-indexing only the changed documents.
+
+        Args:
+        data_path (str): The directory of documents.
+        vector_store (VertexAIVectorStore): The Vector Store.
+        embed_model (VertexTextEmbedding): The embedding model.
+        manifest_path (str): The manifest file tracking indexed files and chunks.
+        lexical_index (Optional[BM25Index]): A lexical index to keep in step with the same chunks, for hybrid_search.
+
+        Returns:
+        QueryEngine: The query engine.
+    """
+    from llama_index.core import VectorStoreIndex
+
+    from incremental_index import sync_directory
+
+    sync_directory(data_path, vector_store, embed_model, manifest_path, lexical_index=lexical_index)
+
+    index = VectorStoreIndex.from_vector_store(
+        vector_store=vector_store, embed_model=embed_model
     )
     query_engine = index.as_query_engine()
 
     return query_engine
 
+async def async_query(
+    query_engine:QueryEngine,
+    query:str,
+    timeout:Optional[float]=None
+) -> Response:
+    """
+        Asynchronously queries a query engine.
+
+        Args:
+        query_engine (QueryEngine): The query engine.
+        query (str): The query.
+        timeout (Optional[float]): The timeout in seconds. Defaults to SEARCH_TIMEOUT.
+
+        Returns:
+        Response: The synthesized response and its source nodes.
+    """
+    from llama_index.core.schema import QueryBundle
+
+    async def run() -> Response:
+        # retrieval and synthesis are awaited separately so each gets its own span
+        query_bundle = QueryBundle(query_str=query)
+        with metrics.span("retrieval", filtered=False):
+            nodes = await query_engine.aretrieve(query_bundle)
+        with metrics.span("llm_synthesis"):
+            return await query_engine.asynthesize(query_bundle, nodes)
+
+    with metrics.span("query"):
+        return await search_limiter.run(run(), timeout=timeout)
+
 """
 ! mkdir -p ./data/arxiv/
 ! wget 'https://arxiv.org/pdf/1706.03762.pdf' -O ./data/arxiv/test.pdf
 data_path = "./data/arxiv"
 
+from llama_index.core import Settings, SimpleDirectoryReader
+from llama_index.llms.vertex import Vertex
+from parallel_parsing import parse_directory
+
 vertex_gemini = Vertex(model="gemini-pro", temperature=0, additional_kwargs={})
 Settings.llm = vertex_gemini
 
@@ -479,6 +1143,17 @@ storage_context = set_storage_context(vector_store)
 documents = SimpleDirectoryReader(data_path).load_data()
 
 query_engine = create_query_engine(documents, vector_store, storage_context)
+# or, with a smaller token budget and the cl100k tokenizer
+from token_chunker import TokenBudgetChunker, tiktoken_token_offsets
+chunker = TokenBudgetChunker(chunk_size=512, chunk_overlap=64, token_offsets=tiktoken_token_offsets())
+query_engine = create_query_engine(documents, vector_store, storage_context, node_parser=chunker)
+
+# or, to parse and chunk the PDFs in parallel worker processes
+nodes = parse_directory(data_path, max_workers=8, chunk_size=1024, chunk_overlap=200)
+query_engine = VectorStoreIndex(nodes, storage_context=storage_context).as_query_engine()
+
+# or, to only re-parse and re-embed documents that changed since the last run
+query_engine = create_incremental_query_engine(data_path, vector_store, embed_model, "./data/arxiv.manifest.json")
 
 response = query_engine.query(
     "who are the authors of paper Attention is All you need?"
@@ -0,0 +1,103 @@
+"""
+Import-time budget check for gcp_index_embed.py.
+
+Imports the module in a fresh interpreter with `python -X importtime`, and
+exits non-zero if the cumulative import time exceeds the budget or if any
+of the heavy packages that should only load on first use were imported.
+test_import_budget.py runs the same check under pytest; run the script
+directly to see the slowest imports:
+
+    python import_budget.py --budget-ms 150
+    python import_budget.py --module gcp_index_embed --runs 5 --top 15
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 150))
+DEFAULT_FORBIDDEN = ("google.cloud.aiplatform", "llama_index", "numpy", "pypdf")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def measure_import(module:str, cwd:str) -> Dict[str, Tuple[int, int]]:
+    """
+        Imports a module in a fresh interpreter and collects -X importtime output.
+
+        Args:
+        module (str): The module to import.
+        cwd (str): The working directory, so sibling modules resolve.
+
+        Returns:
+        Dict[str, Tuple[int, int]]: Self and cumulative microseconds per imported module.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    timings = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            timings[name] = (int(self_us), int(cumulative_us))
+    return timings
+
+def check_budget(
+    module:str="gcp_index_embed",
+    budget_ms:float=DEFAULT_BUDGET_MS,
+    runs:int=3,
+    forbidden:Tuple[str, ...]=DEFAULT_FORBIDDEN,
+    top:int=10
+) -> List[str]:
+    """
+        Checks a module's cold import time and the packages it pulls in.
+
+        Args:
+        module (str): The module to import.
+        budget_ms (float): The maximum median cumulative import time in milliseconds.
+        runs (int): The number of fresh interpreters to measure.
+        forbidden (Tuple[str, ...]): Packages that must not be imported at import time.
+        top (int): The number of slowest imports to report.
+
+        Returns:
+        List[str]: The failures; empty if the module is within budget.
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    measurements = [measure_import(module, cwd) for _ in range(runs)]
+    cold_ms = statistics.median(timings[module][1] for timings in measurements) / 1000
+
+    print(f"import {module}: {cold_ms:.1f} ms (median of {runs}, budget {budget_ms:.0f} ms)")
+    slowest = sorted(measurements[0].items(), key=lambda item: item[1][0], reverse=True)[:top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"  {self_us / 1000:8.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+
+    failures = []
+    if cold_ms > budget_ms:
+        failures.append(f"import {module} took {cold_ms:.1f} ms, over the {budget_ms:.0f} ms budget")
+    for package in forbidden:
+        loaded = [name for name in measurements[0] if name == package or name.startswith(f"{package}.")]
+        if loaded:
+            failures.append(f"import {module} loaded {package} ({len(loaded)} modules); import it on first use instead")
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="gcp_index_embed")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    failures = check_budget(args.module, args.budget_ms, args.runs, top=args.top)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from checkpoint import content_digest, make_node_id
+from embedding_pipeline import DEFAULT_MAX_WORKERS, embed_texts
+from ingest_pipeline import DEFAULT_UPSERT_BATCH_SIZE
+from instrumentation import metrics
+from parallel_parsing import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE, iter_parsed_nodes
+from rate_limit import upsert_rate_limiter
+from retriever_service import invalidate_retriever_services
+
+MANIFEST_VERSION = 1
+
+# File stats that change whenever a file is saved; they do not make an
+# otherwise unchanged chunk worth re-upserting
+VOLATILE_METADATA_KEYS = ("file_size", "creation_date", "last_modified_date", "last_accessed_date")
+
+def hash_file(path:str) -> str:
+    """
+        Computes the SHA-256 digest of a file without loading it into memory.
+
+        Args:
+        path (str): The file path.
+
+        Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_digest(node:BaseNode) -> str:
+    """
+        Computes the digest of a chunk's text and filterable metadata.
+
+        Args:
+        node (BaseNode): The chunk.
+
+        Returns:
+        str: The hex digest.
+    """
+    metadata = {key: value for key, value in node.metadata.items() if key not in VOLATILE_METADATA_KEYS}
+    return content_digest({"text": node.get_content(), "metadata": metadata})
+
+def load_manifest(manifest_path:str) -> Dict[str, Any]:
+    """
+        Loads an index manifest, or returns an empty one if none exists.
+
+        Args:
+        manifest_path (str): The manifest file path.
+
+        Returns:
+        Dict[str, Any]: The manifest.
+    """
+    if not os.path.exists(manifest_path):
+        return {"version": MANIFEST_VERSION, "files": {}}
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        logging.warning(f"Ignoring manifest {manifest_path} with unknown version {manifest.get('version')}")
+        return {"version": MANIFEST_VERSION, "files": {}}
+    return manifest
+
+def save_manifest(manifest:Dict[str, Any], manifest_path:str) -> None:
+    """
+        Atomically writes an index manifest.
+
+        Args:
+        manifest (Dict[str, Any]): The manifest.
+        manifest_path (str): The manifest file path.
+    """
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+def list_files(data_path:str) -> List[str]:
+    """
+        Lists the non-hidden files under a directory, recursively.
+
+        Args:
+        data_path (str): The directory.
+
+        Returns:
+        List[str]: The sorted absolute file paths.
+    """
+    root = Path(data_path).resolve()
+    return sorted(
+        str(path)
+        for path in root.rglob("*")
+        if path.is_file() and not any(part.startswith(".") for part in path.relative_to(root).parts)
+    )
+
+def sync_directory(
+    data_path:str,
+    vector_store:Any,
+    embed_model:Any,
+    manifest_path:str,
+    node_parser:Optional[Any]=None,
+    max_workers:int=DEFAULT_MAX_WORKERS,
+    batch_size:int=DEFAULT_UPSERT_BATCH_SIZE,
+    parse_workers:Optional[int]=None,
+    chunk_size:int=DEFAULT_CHUNK_SIZE,
+    chunk_overlap:int=DEFAULT_CHUNK_OVERLAP,
+    lexical_index:Any=None
+) -> Dict[str, int]:
+    """
+        Brings a Vector Store in line with the files in a directory.
+
+        Files whose size and modification time match the manifest are not
+        read at all; files whose content hash matches are not parsed. Changed
+        files are parsed and chunked, and only chunks whose text or filterable
+        metadata changed are embedded and upserted; the manifest keeps a digest
+        of both per chunk, keyed by an ID derived from the chunk's file, page
+        and text. Vectors for chunks that disappeared, including all chunks
+        of deleted files, are removed. If anything changed, cached search
+        results for the store are invalidated.
+
+        If a file fails to parse, its old chunks are kept, the chunks parsed
+        from its other page ranges are added to them, and it is retried on
+        the next sync rather than recorded as synced.
+
+        With a lexical_index, such as a BM25Index, upserted chunks are also
+        indexed and removed chunks deleted from it, and it is saved at the
+        end, so hybrid search sees the same chunks as the Vector Store.
+
+        Args:
+        data_path (str): The directory of documents, e.g. file_directory/.
+        vector_store (Any): The Vector Store, e.g. VertexAIVectorStore.
+        embed_model (Any): The embedding model.
+        manifest_path (str): The manifest file path.
+        node_parser (Optional[Any]): A node parser to run in-process. By default
+        changed files are parsed and chunked on a process pool.
+        max_workers (int): The maximum number of concurrent embedding requests.
+        batch_size (int): The number of nodes per upsert.
+        parse_workers (Optional[int]): The number of parsing processes. Defaults to the CPU count.
+        chunk_size (int): The chunk size in tokens, for the default parser.
+        chunk_overlap (int): The chunk overlap in tokens, for the default parser.
+        lexical_index (Any): An index with add(nodes), delete_nodes(node_ids) and save(), kept in step with the Vector Store.
+
+        Returns:
+        Dict[str, int]: Counts of unchanged, changed, failed and removed files,
+        and of embedded and deleted chunks.
+    """
+    start = time.perf_counter()
+    manifest = load_manifest(manifest_path)
+    old_files = manifest["files"]
+    new_files = {}
+    changed_paths = []
+
+    for path in list_files(data_path):
+        stat = os.stat(path)
+        entry = old_files.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            new_files[path] = entry
+            continue
+        sha256 = hash_file(path)
+        if entry and entry["sha256"] == sha256:
+            new_files[path] = {**entry, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            continue
+        new_files[path] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": sha256,
+            "chunks": {},
+        }
+        changed_paths.append(path)
+
+    failed_paths = set()
+    if node_parser is not None:
+        documents = SimpleDirectoryReader(input_files=changed_paths).load_data() if changed_paths else []
+        parsed_batches = iter([node_parser.get_nodes_from_documents(documents)])
+    else:
+        parsed_batches = iter_parsed_nodes(
+            changed_paths,
+            parse_workers,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            failed_paths=failed_paths,
+        )
+
+    embedded_count = 0
+    pending = []
+
+    def flush(nodes:List[BaseNode]) -> None:
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        embeddings = embed_texts(embed_model, texts, max_workers=max_workers)
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+        with metrics.span("upsert_request"):
+            upsert_rate_limiter.call(vector_store.add, nodes)
+        metrics.incr("upserted_nodes_total", len(nodes))
+        if lexical_index is not None:
+            lexical_index.add(nodes)
+
+    # Parsed nodes arrive per file or page range; new chunks are embedded and
+    # upserted as soon as a full batch is pending, while parsing continues
+    for nodes in parsed_batches:
+        for node in nodes:
+            path = str(Path(node.metadata["file_path"]).resolve())
+            # the page is part of the key: the same text on two pages is two
+            # chunks, whichever page range finishes parsing first
+            node.id_ = make_node_id(path, {"page": node.metadata.get("page_label"), "text": node.get_content()})
+            chunks = new_files[path]["chunks"]
+            if node.id_ in chunks:
+                continue
+            chunks[node.id_] = chunk_digest(node)
+            if old_files.get(path, {}).get("chunks", {}).get(node.id_) != chunks[node.id_]:
+                pending.append(node)
+        while len(pending) >= batch_size:
+            flush(pending[:batch_size])
+            embedded_count += batch_size
+            pending = pending[batch_size:]
+    if pending:
+        flush(pending)
+        embedded_count += len(pending)
+
+    for path in failed_paths:
+        # Keep every chunk that may still be in the store, and force a retry:
+        # no real file has size -1, so the next sync re-hashes and re-parses it
+        new_files[path] = {
+            "size": -1,
+            "mtime_ns": -1,
+            "sha256": "",
+            "chunks": {**old_files.get(path, {}).get("chunks", {}), **new_files[path]["chunks"]},
+        }
+        logging.warning(f"Keeping the indexed chunks of {path}, which failed to parse; it is retried on the next sync")
+
+    stale_ids = []
+    for path in changed_paths:
+        if path in failed_paths:
+            continue
+        chunks = new_files[path]["chunks"]
+        stale_ids.extend(
+            node_id for node_id in old_files.get(path, {}).get("chunks", {}) if node_id not in chunks
+        )
+    removed_paths = [path for path in old_files if path not in new_files]
+    for path in removed_paths:
+        stale_ids.extend(old_files[path]["chunks"])
+
+    if stale_ids:
+        vector_store.delete_nodes(node_ids=stale_ids)
+        if lexical_index is not None:
+            lexical_index.delete_nodes(node_ids=stale_ids)
+    if lexical_index is not None:
+        lexical_index.save()
+    if embedded_count or stale_ids:
+        invalidate_retriever_services(vector_store)
+
+    manifest["files"] = new_files
+    save_manifest(manifest, manifest_path)
+
+    summary = {
+        "unchanged_files": len(new_files) - len(changed_paths),
+        "changed_files": len(changed_paths),
+        "failed_files": len(failed_paths),
+        "removed_files": len(removed_paths),
+        "embedded_chunks": embedded_count,
+        "deleted_chunks": len(stale_ids),
+    }
+    logging.info(f"Synced {data_path} in {time.perf_counter() - start:.2f}s: {summary}")
+    return summary
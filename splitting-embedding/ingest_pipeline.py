@@ -0,0 +1,306 @@
+import csv
+import json
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from checkpoint import CheckpointJournal, content_digest, make_batch_key, make_node_id
+from embedding_pipeline import DEFAULT_MAX_WORKERS, embed_texts_array
+from instrumentation import metrics
+from rate_limit import upsert_rate_limiter
+
+DEFAULT_UPSERT_BATCH_SIZE = 500
+DEFAULT_QUEUE_SIZE = 4
+
+# Marks the end of a stage's output
+_DONE = object()
+
+@dataclass
+class StageStats:
+    """
+        Throughput counters for one pipeline stage.
+
+        Attributes:
+        name (str): The stage name.
+        items (int): The number of records processed.
+        batches (int): The number of batches processed.
+        failed_batches (int): The number of batches that raised an error.
+        skipped_batches (int): The number of batches skipped as already committed.
+        busy_seconds (float): Time spent working, excluding waits on other stages.
+    """
+    name: str
+    items: int = 0
+    batches: int = 0
+    failed_batches: int = 0
+    skipped_batches: int = 0
+    busy_seconds: float = 0.0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "skipped_batches": self.skipped_batches,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_second": round(self.items_per_second, 1),
+        }
+
+def _coerce(value:str) -> Any:
+    # CSV cells are strings; numeric metadata needs to be numbers for numeric filters
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def read_records(source:Union[Iterable[Dict[str, Any]], str, Path]) -> Iterator[Dict[str, Any]]:
+    """
+        Lazily reads records from an iterable or a JSONL/CSV file.
+
+        Args:
+        source (Union[Iterable[Dict[str, Any]], str, Path]): An iterable of
+        dictionaries, or the path of a .jsonl or .csv file.
+
+        Yields:
+        Dict[str, Any]: One record at a time.
+    """
+    if not isinstance(source, (str, Path)):
+        yield from source
+        return
+
+    path = Path(source)
+    if path.suffix in (".jsonl", ".ndjson"):
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif path.suffix == ".csv":
+        with path.open(encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                yield {key: _coerce(value) for key, value in row.items()}
+    else:
+        raise ValueError(f"Unsupported record file type: {path}")
+
+def batched(iterable:Iterable[Any], batch_size:int) -> Iterator[List[Any]]:
+    """
+        Splits an iterable into lists of at most batch_size items.
+
+        Args:
+        iterable (Iterable[Any]): The items.
+        batch_size (int): The maximum batch size.
+
+        Yields:
+        List[Any]: The next batch.
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+def _run_stage(
+    stats:StageStats,
+    inbox:Iterable[Any],
+    outbox:queue.Queue,
+    work,
+    time_inbox:bool=False
+) -> None:
+    # Runs in a thread: applies work to each batch from inbox and puts the
+    # result on outbox. outbox is bounded, so put() blocks when the next
+    # stage falls behind, which is the backpressure between stages.
+    # time_inbox counts the time spent pulling from inbox as busy time, for
+    # the read stage whose work happens inside the iterator. A work result
+    # of None means the batch was skipped and nothing is passed on.
+    try:
+        inbox = iter(inbox)
+        while True:
+            start = time.perf_counter()
+            batch = next(inbox, _DONE)
+            if batch is _DONE:
+                break
+            if not time_inbox:
+                start = time.perf_counter()
+            try:
+                result = work(batch)
+            except Exception as e:
+                stats.failed_batches += 1
+                logging.error(f"{stats.name} stage failed on a batch of {len(batch)} records: {e}")
+                continue
+            finally:
+                stats.busy_seconds += time.perf_counter() - start
+            if result is None:
+                stats.skipped_batches += 1
+                continue
+            stats.items += len(batch)
+            stats.batches += 1
+            outbox.put(result)
+    except Exception as e:
+        outbox.put(e)
+    finally:
+        outbox.put(_DONE)
+
+def _drain(inbox:queue.Queue) -> Iterator[Any]:
+    while (item := inbox.get()) is not _DONE:
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+def stream_records_to_vector_store(
+    vector_store:Any,
+    embed_model:Any,
+    source:Union[Iterable[Dict[str, Any]], str, Path],
+    embed_field:str,
+    batch_size:int=DEFAULT_UPSERT_BATCH_SIZE,
+    queue_size:int=DEFAULT_QUEUE_SIZE,
+    max_workers:int=DEFAULT_MAX_WORKERS,
+    source_name:Optional[str]=None,
+    checkpoint_path:Optional[str]=None,
+    lexical_index:Any=None,
+    id_field:Optional[str]=None,
+    save_lexical_index:bool=True
+) -> Dict[str, Dict[str, Any]]:
+    """
+        Streams records through read -> embed -> upsert stages.
+
+        Each stage runs in its own thread and hands fixed-size batches to the
+        next through a bounded queue, so at most about queue_size batches per
+        stage are held in memory regardless of the size of the source.
+        Embedding requests and upserts are rate limited and retried per batch;
+        a batch that still fails is logged and skipped, and the others are
+        still committed.
+
+        Node IDs are derived from source_name and each record's id_field, so
+        re-running an ingest upserts rather than duplicates, also when only
+        metadata changed. Without an id_field they are derived from the whole
+        record, so records that share a text but differ in metadata are all
+        kept. With a checkpoint_path, committed batches are journaled by their
+        full record content and skipped before embedding on the next run.
+
+        With a lexical_index, such as a BM25Index, each batch is also indexed
+        there once its upsert succeeds and saved before the batch is journaled,
+        so batches skipped by the checkpoint are already in it.
+
+        Args:
+        vector_store (Any): The Vector Store, e.g. VertexAIVectorStore.
+        embed_model (Any): The embedding model.
+        source (Union[Iterable[Dict[str, Any]], str, Path]): The records, or a .jsonl/.csv path.
+        embed_field (str): The field to embed; the other fields become metadata.
+        batch_size (int): The number of records per upsert.
+        queue_size (int): The maximum number of batches buffered between stages.
+        max_workers (int): The maximum number of concurrent embedding requests.
+        source_name (Optional[str]): The name node IDs are derived from. Defaults to the
+        file path, or "records" for an iterable.
+        checkpoint_path (Optional[str]): The checkpoint journal path. No journal is kept if None.
+        lexical_index (Any): An index with add(nodes) and save(), filled with the upserted nodes.
+        id_field (Optional[str]): A field that uniquely identifies each record within the source.
+        Node IDs are derived from the whole record if None.
+        save_lexical_index (bool): Whether to save the lexical_index after each batch. The caller
+        saves or discards it otherwise, e.g. once a batch index update has succeeded.
+
+        Returns:
+        Dict[str, Dict[str, Any]]: Per-stage counters and throughput.
+    """
+    # imported here so the module's constants can be imported without llama_index or numpy
+    from llama_index.core.schema import TextNode
+
+    from embedding_array import EmbeddingArray
+
+    read_stats = StageStats("read")
+    embed_stats = StageStats("embed")
+    upsert_stats = StageStats("upsert")
+    read_queue = queue.Queue(maxsize=queue_size)
+    embed_queue = queue.Queue(maxsize=queue_size)
+    if source_name is None:
+        source_name = str(source) if isinstance(source, (str, Path)) else "records"
+    journal = CheckpointJournal(checkpoint_path) if checkpoint_path else None
+
+    def embed(records:List[Dict[str, Any]]) -> Optional[Tuple[str, List[str], List[Dict[str, Any]], EmbeddingArray]]:
+        node_ids = [
+            make_node_id(source_name, str(record[id_field]) if id_field else record)
+            for record in records
+        ]
+        batch_key = make_batch_key(
+            f"{node_id}:{content_digest(record)}" for node_id, record in zip(node_ids, records)
+        )
+        if journal is not None and journal.is_committed(batch_key):
+            return None
+
+        texts = [record[embed_field] for record in records]
+        # batches wait in embed_queue as packed float32 arrays, not lists of floats
+        embeddings = embed_texts_array(embed_model, texts, max_workers=max_workers)
+        return batch_key, node_ids, records, embeddings
+
+    def to_nodes(node_ids:List[str], records:List[Dict[str, Any]], embeddings:EmbeddingArray) -> List[TextNode]:
+        return [
+            TextNode(
+                id_=node_id,
+                text=record[embed_field],
+                embedding=embeddings.row(i),
+                metadata={k: v for k, v in record.items() if k != embed_field},
+            )
+            for i, (node_id, record) in enumerate(zip(node_ids, records))
+        ]
+
+    threads = [
+        threading.Thread(
+            target=_run_stage,
+            args=(read_stats, batched(read_records(source), batch_size), read_queue, lambda batch: batch, True),
+            daemon=True,
+        ),
+        threading.Thread(
+            target=_run_stage,
+            args=(embed_stats, _drain(read_queue), embed_queue, embed),
+            daemon=True,
+        ),
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    for batch_key, node_ids, records, embeddings in _drain(embed_queue):
+        batch_start = time.perf_counter()
+        nodes = to_nodes(node_ids, records, embeddings)
+        try:
+            with metrics.span("upsert_request"):
+                upsert_rate_limiter.call(vector_store.add, nodes)
+            metrics.incr("upserted_nodes_total", len(nodes))
+            if lexical_index is not None:
+                lexical_index.add(nodes)
+                if save_lexical_index:
+                    lexical_index.save()
+            if journal is not None:
+                journal.record(batch_key, len(nodes))
+            upsert_stats.items += len(nodes)
+            upsert_stats.batches += 1
+        except Exception as e:
+            upsert_stats.failed_batches += 1
+            metrics.incr("upsert_failed_batches_total")
+            logging.error(f"Failed to add a batch of {len(nodes)} records to vector store: {e}")
+        upsert_stats.busy_seconds += time.perf_counter() - batch_start
+
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stats = {s.name: s.to_dict() for s in (read_stats, embed_stats, upsert_stats)}
+    stats["total"] = {
+        "items": upsert_stats.items,
+        "seconds": round(elapsed, 3),
+        "items_per_second": round(upsert_stats.items / elapsed, 1) if elapsed else 0.0,
+    }
+    logging.info(
+        f"Added {upsert_stats.items} records with metadata to vector store in {elapsed:.2f}s "
+        f"({upsert_stats.failed_batches} upsert and {embed_stats.failed_batches} embed batches failed, "
+        f"{embed_stats.skipped_batches} already committed)"
+    )
+    return stats
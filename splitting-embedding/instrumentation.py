@@ -0,0 +1,276 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "").lower() in ("1", "true", "yes")
+
+# Prometheus client default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels:Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(labels:LabelKey, extra:Tuple[Tuple[str, str], ...]=()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{v}"'.replace("\n", "\\n") for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+class Histogram:
+    """
+        A cumulative histogram with fixed bucket bounds.
+
+        Args:
+        buckets (Tuple[float, ...]): The upper bounds of the buckets, ascending.
+    """
+
+    def __init__(self, buckets:Tuple[float, ...]=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value:float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q:float) -> float:
+        """
+            Estimates a quantile as the upper bound of the bucket it falls in.
+
+            Args:
+            q (float): The quantile, between 0 and 1.
+
+            Returns:
+            float: The estimate, or +Inf if it falls past the last bucket.
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+class _NoopSpan:
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info:Any) -> None:
+        return None
+
+_NOOP_SPAN = _NoopSpan()
+
+class _Span:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics:"Metrics", name:str, labels:Dict[str, Any]):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type:Any, exc:Any, tb:Any) -> None:
+        self.metrics.observe(f"{self.name}_seconds", time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            self.metrics.incr(f"{self.name}_errors_total", **self.labels)
+
+class Metrics:
+    """
+        An in-process registry of counters and latency histograms.
+
+        When disabled, span() returns a shared no-op context manager and
+        incr() and observe() return immediately, so instrumented hot paths
+        cost one attribute check.
+
+        Args:
+        enabled (bool): Whether to record metrics.
+    """
+
+    def __init__(self, enabled:bool=METRICS_ENABLED):
+        self.enabled = enabled
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name:str, **labels:Any) -> Any:
+        """
+            Times a block into the <name>_seconds histogram, counting
+            exceptions in <name>_errors_total.
+
+            Args:
+            name (str): The span name, e.g. "embedding_request".
+
+            Returns:
+            Any: A context manager.
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, labels)
+
+    def incr(self, name:str, value:float=1, **labels:Any) -> None:
+        """
+            Adds to a counter.
+
+            Args:
+            name (str): The counter name, e.g. "embedding_texts_total".
+            value (float): The amount to add.
+        """
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name:str, value:float, **labels:Any) -> None:
+        """
+            Records a value in a histogram.
+
+            Args:
+            name (str): The histogram name.
+            value (float): The value.
+        """
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+            Snapshots the metrics.
+
+            Returns:
+            Dict[str, Any]: Counters and histogram summaries, keyed by name and then by labels.
+        """
+        with self._lock:
+            return {
+                "counters": {
+                    name: {_format_labels(key) or "total": value for key, value in series.items()}
+                    for name, series in self.counters.items()
+                },
+                "histograms": {
+                    name: {_format_labels(key) or "all": histogram.to_dict() for key, histogram in series.items()}
+                    for name, series in self.histograms.items()
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        """
+            Renders the metrics in the Prometheus text exposition format.
+
+            Returns:
+            str: The exposition text.
+        """
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def log_json(self, level:int=logging.INFO) -> None:
+        """
+            Logs a JSON snapshot of the metrics.
+
+            Args:
+            level (int): The logging level.
+        """
+        logging.log(level, f"metrics {json.dumps(self.to_dict(), default=str)}")
+
+    def serve_prometheus(self, port:int=9464, host:str="127.0.0.1") -> "ThreadingHTTPServer":
+        """
+            Serves the metrics at http://host:port/metrics from a daemon thread.
+
+            Args:
+            port (int): The port.
+            host (str): The interface to bind.
+
+            Returns:
+            ThreadingHTTPServer: The server; call shutdown() to stop it.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format:str, *args:Any) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info(f"Serving metrics at http://{host}:{port}/metrics")
+        return server
+
+metrics = Metrics()
+
+def enable_metrics(enabled:bool=True) -> Metrics:
+    """
+        Turns metrics recording on or off for the shared registry.
+
+        Args:
+        enabled (bool): Whether to record metrics.
+
+        Returns:
+        Metrics: The shared registry.
+    """
+    metrics.enabled = enabled
+    return metrics
@@ -1,9 +1,11 @@
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
+from llama_index.core import VectorStoreIndex, Settings
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.llms.groq import Groq
 
 from dotenv import load_dotenv
 
+from parallel_parsing import iter_parsed_nodes
+
 load_dotenv()
 
 Settings.embed_model = HuggingFaceEmbedding(
@@ -12,12 +14,6 @@ Settings.embed_model = HuggingFaceEmbedding(
 
 Settings.llm = Groq(model="llama3-70b-8192")
 
-documents = SimpleDirectoryReader(
-        input_files=["./investing_in_unknown_and_unknowable.pdf"]
-    ).load_data()
-
-vector_index = VectorStoreIndex.from_documents(documents)
-
 def query_pdf(query, index):
 
     query_engine = index.as_query_engine()
@@ -28,6 +24,18 @@ def query_pdf(query, index):
     return response
 
 if __name__ == "__main__":
+    # Parsing runs on a process pool, so it must stay under the __main__ guard
+    nodes = [
+        node
+        for batch in iter_parsed_nodes(
+            ["./investing_in_unknown_and_unknowable.pdf"],
+            max_workers=4,
+            chunk_size=1024,
+        )
+        for node in batch
+    ]
+    vector_index = VectorStoreIndex(nodes)
+
     query_pdf("What is this about?", vector_index)
     query_pdf("What is the author?", vector_index)
     query_pdf("What are the main themes of this document?", vector_index)
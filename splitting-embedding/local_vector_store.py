@@ -0,0 +1,579 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, MetadataMode, TextNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+from instrumentation import metrics
+
+DEFAULT_NPROBE = 8
+DEFAULT_IVF_TRAIN_THRESHOLD = 10000
+DEFAULT_IVF_RETRAIN_GROWTH = 2.0
+DEFAULT_COMPACT_THRESHOLD = 0.5
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 50000
+# Candidate rows whose metadata is read at first by a filtered query
+FILTER_CANDIDATES = 256
+# Below SQLite's limit on the variables of one statement
+SQLITE_MAX_VARIABLES = 900
+
+def _compile_filter(metadata_filter:MetadataFilter) -> Callable[[Dict[str, Any]], bool]:
+    key = metadata_filter.key
+    value = metadata_filter.value
+    operator = getattr(metadata_filter.operator, "value", metadata_filter.operator)
+
+    def compare(compare_fn:Callable[[Any, Any], bool]) -> Callable[[Dict[str, Any]], bool]:
+        def check(metadata:Dict[str, Any]) -> bool:
+            if key not in metadata:
+                return False
+            try:
+                return compare_fn(metadata[key], value)
+            except TypeError:
+                return False
+        return check
+
+    def as_list(x:Any) -> List[Any]:
+        return x if isinstance(x, (list, tuple, set)) else [x]
+
+    if operator == "==":
+        # list-valued metadata (e.g. season) matches if it contains the value
+        return compare(lambda x, v: v in x if isinstance(x, list) and not isinstance(v, list) else x == v)
+    if operator == "!=":
+        return lambda metadata: key not in metadata or metadata[key] != value
+    if operator == ">":
+        return compare(lambda x, v: x > v)
+    if operator == ">=":
+        return compare(lambda x, v: x >= v)
+    if operator == "<":
+        return compare(lambda x, v: x < v)
+    if operator == "<=":
+        return compare(lambda x, v: x <= v)
+    if operator == "in":
+        return compare(lambda x, v: any(item in as_list(v) for item in as_list(x)))
+    if operator == "nin":
+        return lambda metadata: key not in metadata or not any(
+            item in as_list(value) for item in as_list(metadata[key])
+        )
+    if operator == "any":
+        return compare(lambda x, v: any(item in as_list(x) for item in as_list(v)))
+    if operator == "all":
+        return compare(lambda x, v: all(item in as_list(x) for item in as_list(v)))
+    if operator == "contains":
+        return compare(lambda x, v: v in as_list(x))
+    if operator == "text_match":
+        return compare(lambda x, v: str(v) in str(x))
+    if operator == "is_empty":
+        return lambda metadata: metadata.get(key) in (None, "", [])
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+def compile_filters(filters:MetadataFilters) -> Callable[[Dict[str, Any]], bool]:
+    """
+        Compiles MetadataFilters into a predicate over a metadata dictionary.
+
+        Supports the FilterOperator comparisons used with VertexAIVectorStore
+        (EQ, NE, GT, GTE, LT, LTE, IN, NIN, ANY, ALL, CONTAINS, TEXT_MATCH,
+        IS_EMPTY) and nested filters combined with AND or OR.
+
+        Args:
+        filters (MetadataFilters): The filters.
+
+        Returns:
+        Callable[[Dict[str, Any]], bool]: The predicate.
+    """
+    checks = [
+        compile_filters(f) if isinstance(f, MetadataFilters) else _compile_filter(f)
+        for f in filters.filters
+    ]
+    condition = getattr(filters.condition, "value", filters.condition) or "and"
+    if condition == "or":
+        return lambda metadata: any(check(metadata) for check in checks)
+    return lambda metadata: all(check(metadata) for check in checks)
+
+def kmeans(vectors:np.ndarray, k:int, iterations:int=KMEANS_ITERATIONS, seed:int=0) -> np.ndarray:
+    """
+        Clusters vectors with spherical k-means, for dot-product search.
+
+        Args:
+        vectors (np.ndarray): The vectors, shape (n, dimensions).
+        k (int): The number of clusters.
+        iterations (int): The number of refinement iterations.
+        seed (int): The random seed.
+
+        Returns:
+        np.ndarray: The unit-norm centroids, shape (k, dimensions).
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(k):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+            else:
+                # re-seed empty clusters with a random vector
+                centroids[cluster] = vectors[rng.integers(len(vectors))]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+class LocalVectorStore(BasePydanticVectorStore):
+    """
+        A local vector store for development, CI and small corpora.
+
+        Vectors live in a flat float32 file that is memory-mapped rather than
+        loaded, so opening a large store is fast and pages are read on demand.
+        Node text, metadata and IDs are kept in SQLite next to it and are only
+        read for the rows a query ranks, so opening a store does not read
+        them at all. Search is exact brute-force dot product, or with
+        index_type="ivf" an inverted file index: vectors are clustered with
+        k-means and a query only scores the nprobe clusters whose centroids
+        are closest.
+
+        Replaced and deleted nodes leave dead rows in the vector file. Once
+        they make up compact_threshold of it, the file is compacted. An "ivf"
+        store retrains its clusters once it has grown by ivf_retrain_growth
+        since the last training. compact() and build_ivf() can also be called
+        directly.
+
+        Args:
+        persist_dir (str): The directory holding the store's files.
+        dimensions (int): The number of dimensions per embedding.
+        index_type (str): "exact" or "ivf".
+        nlist (int): The number of IVF clusters. 0 picks about sqrt(n) at training time.
+        nprobe (int): The number of IVF clusters scored per query.
+        ivf_train_threshold (int): The number of vectors at which an "ivf" store trains itself.
+        ivf_retrain_growth (float): The growth since the last training, as a factor, at which an "ivf" store
+        retrains itself. 0 disables retraining.
+        compact_threshold (float): The fraction of dead rows at which the vector file is compacted. 0 disables it.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+
+    persist_dir: str
+    dimensions: int
+    index_type: str = "exact"
+    nlist: int = 0
+    nprobe: int = DEFAULT_NPROBE
+    ivf_train_threshold: int = DEFAULT_IVF_TRAIN_THRESHOLD
+    ivf_retrain_growth: float = DEFAULT_IVF_RETRAIN_GROWTH
+    compact_threshold: float = DEFAULT_COMPACT_THRESHOLD
+
+    _lock: threading.RLock = PrivateAttr()
+    _conn: sqlite3.Connection = PrivateAttr()
+    _vectors: np.ndarray = PrivateAttr()
+    _alive: np.ndarray = PrivateAttr()
+    _generation: int = PrivateAttr()
+    _trained_count: int = PrivateAttr()
+    _centroids: Optional[np.ndarray] = PrivateAttr()
+    _assignments: np.ndarray = PrivateAttr()
+
+    def __init__(
+        self,
+        persist_dir:str,
+        dimensions:int,
+        index_type:str="exact",
+        nlist:int=0,
+        nprobe:int=DEFAULT_NPROBE,
+        ivf_train_threshold:int=DEFAULT_IVF_TRAIN_THRESHOLD,
+        ivf_retrain_growth:float=DEFAULT_IVF_RETRAIN_GROWTH,
+        compact_threshold:float=DEFAULT_COMPACT_THRESHOLD,
+        **kwargs:Any
+    ):
+        if index_type not in ("exact", "ivf"):
+            raise ValueError(f"Unsupported index_type {index_type}, expected 'exact' or 'ivf'")
+        super().__init__(
+            persist_dir=persist_dir,
+            dimensions=dimensions,
+            index_type=index_type,
+            nlist=nlist,
+            nprobe=nprobe,
+            ivf_train_threshold=ivf_train_threshold,
+            ivf_retrain_growth=ivf_retrain_growth,
+            compact_threshold=compact_threshold,
+            **kwargs,
+        )
+        os.makedirs(persist_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(persist_dir, "nodes.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS nodes ("
+            "row INTEGER PRIMARY KEY, node_id TEXT NOT NULL, ref_doc_id TEXT, text TEXT, metadata TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS nodes_ref_doc_id ON nodes (ref_doc_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS nodes_node_id ON nodes (node_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS store_info (key TEXT PRIMARY KEY, value INTEGER)")
+        self._conn.commit()
+        self._load()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return self._conn
+
+    def _path(self, name:str) -> str:
+        return os.path.join(self.persist_dir, name)
+
+    # Each compaction writes a new generation of the row-numbered files;
+    # generation 0 keeps the original names
+    def _vectors_path(self, generation:Optional[int]=None) -> str:
+        generation = self._generation if generation is None else generation
+        return self._path(f"vectors.{generation}.f32" if generation else "vectors.f32")
+
+    def _assignments_path(self, generation:Optional[int]=None) -> str:
+        generation = self._generation if generation is None else generation
+        return self._path(f"assignments.{generation}.i32" if generation else "assignments.i32")
+
+    def _set_info(self, key:str, value:int) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO store_info (key, value) VALUES (?, ?)", (key, int(value)))
+
+    def _map_vectors(self) -> None:
+        path = self._vectors_path()
+        rows = os.path.getsize(path) // (4 * self.dimensions) if os.path.exists(path) else 0
+        if rows:
+            self._vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, self.dimensions))
+        else:
+            self._vectors = np.empty((0, self.dimensions), dtype=np.float32)
+
+    def _load(self) -> None:
+        info = dict(self._conn.execute("SELECT key, value FROM store_info"))
+        self._generation = info.get("generation", 0)
+        self._map_vectors()
+        rows = len(self._vectors)
+        # only the row numbers are read; text and metadata stay in SQLite
+        stored = np.fromiter((row for (row,) in self._conn.execute("SELECT row FROM nodes")), dtype=np.int64)
+        self._alive = np.zeros(rows, dtype=bool)
+        self._alive[stored[stored < rows]] = True
+
+        self._centroids = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        if os.path.exists(self._path("centroids.npy")):
+            self._centroids = np.load(self._path("centroids.npy"))
+            self._assignments = np.fromfile(self._assignments_path(), dtype=np.int32)
+            if len(self._assignments) < rows:
+                # vectors appended after the last assignment write, e.g. after a crash
+                missing = self._assign(np.asarray(self._vectors[len(self._assignments):]))
+                self._append_assignments(missing)
+        self._trained_count = info.get("trained_count", int(self._alive.sum()))
+
+        logging.info(
+            f"Opened local vector store {self.persist_dir} with {int(self._alive.sum())} vectors ({self.index_type})"
+        )
+
+    def _assign(self, vectors:np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _append_assignments(self, assignments:np.ndarray) -> None:
+        with open(self._assignments_path(), "ab") as f:
+            f.write(assignments.astype(np.int32).tobytes())
+        self._assignments = np.concatenate([self._assignments, assignments.astype(np.int32)])
+
+    def _rows_for_ids(self, node_ids:List[str]) -> Dict[str, int]:
+        rows = {}
+        for i in range(0, len(node_ids), SQLITE_MAX_VARIABLES):
+            chunk = node_ids[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            for node_id, row in self._conn.execute(
+                f"SELECT node_id, row FROM nodes WHERE node_id IN ({placeholders})", chunk
+            ):
+                if row < len(self._alive):
+                    rows[node_id] = row
+        return rows
+
+    def _read_rows(self, rows:List[int]) -> Dict[int, Tuple[str, Optional[str], Optional[str], Optional[str]]]:
+        records = {}
+        for i in range(0, len(rows), SQLITE_MAX_VARIABLES):
+            chunk = rows[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            for row, node_id, ref_doc_id, text, metadata in self._conn.execute(
+                f"SELECT row, node_id, ref_doc_id, text, metadata FROM nodes WHERE row IN ({placeholders})", chunk
+            ):
+                records[row] = (node_id, ref_doc_id, text, metadata)
+        return records
+
+    def _kill_rows(self, rows:List[int]) -> None:
+        if not rows:
+            return
+        self._alive[rows] = False
+        self._conn.executemany("DELETE FROM nodes WHERE row = ?", [(int(row),) for row in rows])
+
+    def add(self, nodes:List[BaseNode], **add_kwargs:Any) -> List[str]:
+        """
+            Adds nodes, replacing any existing node with the same ID.
+
+            Args:
+            nodes (List[BaseNode]): The nodes, with embeddings.
+
+            Returns:
+            List[str]: The node IDs.
+        """
+        if not nodes:
+            return []
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Expected {self.dimensions} dimensions, got {vectors.shape[1]}")
+
+        with self._lock:
+            start = len(self._alive)
+            with open(self._vectors_path(), "ab") as f:
+                f.write(vectors.tobytes())
+            self._alive = np.concatenate([self._alive, np.ones(len(nodes), dtype=bool)])
+
+            replaced = list(self._rows_for_ids([node.node_id for node in nodes]).values())
+            new_rows: Dict[str, int] = {}
+            rows = []
+            for offset, node in enumerate(nodes):
+                row = start + offset
+                if node.node_id in new_rows:
+                    # the same ID twice in one batch; the last one wins
+                    replaced.append(new_rows[node.node_id])
+                new_rows[node.node_id] = row
+                rows.append((
+                    row,
+                    node.node_id,
+                    node.ref_doc_id,
+                    node.get_content(metadata_mode=MetadataMode.NONE),
+                    json.dumps(node.metadata, default=str),
+                ))
+            self._conn.executemany(
+                "INSERT INTO nodes (row, node_id, ref_doc_id, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._kill_rows(replaced)
+            self._conn.commit()
+            self._map_vectors()
+
+            if self._centroids is not None:
+                self._append_assignments(self._assign(vectors))
+                if (
+                    self.index_type == "ivf"
+                    and self.ivf_retrain_growth
+                    and self._alive.sum() >= self.ivf_retrain_growth * max(self._trained_count, 1)
+                ):
+                    self.build_ivf()
+            elif self.index_type == "ivf" and self._alive.sum() >= self.ivf_train_threshold:
+                self.build_ivf()
+            self._compact_if_needed()
+
+        return [node.node_id for node in nodes]
+
+    def build_ivf(self, nlist:Optional[int]=None) -> None:
+        """
+            Trains the IVF clusters and assigns every stored vector.
+
+            Args:
+            nlist (Optional[int]): The number of clusters. Defaults to the store's nlist, or about sqrt(n).
+        """
+        with self._lock:
+            alive_rows = np.flatnonzero(self._alive)
+            if not len(alive_rows):
+                return
+            nlist = min(nlist or self.nlist or int(np.sqrt(len(alive_rows))) or 1, len(alive_rows))
+            rng = np.random.default_rng(0)
+            sample = rng.choice(alive_rows, size=min(KMEANS_SAMPLE_SIZE, len(alive_rows)), replace=False)
+            self._centroids = kmeans(np.asarray(self._vectors[np.sort(sample)]), nlist)
+            np.save(self._path("centroids.npy"), self._centroids)
+
+            assignments = np.empty(len(self._vectors), dtype=np.int32)
+            for i in range(0, len(self._vectors), 65536):
+                assignments[i:i + 65536] = self._assign(np.asarray(self._vectors[i:i + 65536]))
+            assignments.tofile(self._assignments_path())
+            self._assignments = assignments
+            self._trained_count = len(alive_rows)
+            self._set_info("trained_count", self._trained_count)
+            self._conn.commit()
+            logging.info(f"Trained IVF index with {nlist} clusters over {len(alive_rows)} vectors")
+
+    def compact(self) -> None:
+        """
+            Rewrites the vector file without the rows of replaced and deleted
+            nodes, and renumbers the remaining rows.
+
+            The compacted vectors and IVF assignments are written to new files
+            and switched to in one SQLite transaction, so a crash leaves either
+            the old or the new store intact.
+        """
+        with self._lock:
+            total = len(self._alive)
+            alive_rows = np.flatnonzero(self._alive)
+            if len(alive_rows) == total:
+                return
+            generation = self._generation + 1
+            with open(self._vectors_path(generation), "wb") as f:
+                for i in range(0, len(alive_rows), 65536):
+                    f.write(np.asarray(self._vectors[alive_rows[i:i + 65536]]).tobytes())
+            if self._centroids is not None:
+                self._assignments[alive_rows].tofile(self._assignments_path(generation))
+
+            old_paths = [self._vectors_path(), self._assignments_path()]
+            with self._conn:
+                # rows left over past the end of the vector file, e.g. after a crash
+                self._conn.execute("DELETE FROM nodes WHERE row >= ?", (total,))
+                # in ascending order, each row moves to a number already freed
+                self._conn.executemany(
+                    "UPDATE nodes SET row = ? WHERE row = ?",
+                    [(new, old) for new, old in enumerate(alive_rows.tolist()) if new != old],
+                )
+                self._set_info("generation", generation)
+
+            self._generation = generation
+            self._alive = np.ones(len(alive_rows), dtype=bool)
+            if self._centroids is not None:
+                self._assignments = self._assignments[alive_rows]
+            self._map_vectors()
+            for path in old_paths:
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except OSError as e:
+                    logging.warning(f"Could not remove {path} after compaction: {e}")
+            logging.info(f"Compacted local vector store {self.persist_dir} from {total} to {len(alive_rows)} rows")
+
+    def _compact_if_needed(self) -> None:
+        dead = len(self._alive) - int(self._alive.sum())
+        if self.compact_threshold and dead and dead >= self.compact_threshold * len(self._alive):
+            self.compact()
+
+    def delete(self, ref_doc_id:str, **delete_kwargs:Any) -> None:
+        """
+            Deletes all nodes of a source document.
+
+            Args:
+            ref_doc_id (str): The source document ID.
+        """
+        with self._lock:
+            rows = [
+                row
+                for (row,) in self._conn.execute("SELECT row FROM nodes WHERE ref_doc_id = ?", (ref_doc_id,))
+                if row < len(self._alive)
+            ]
+            self._kill_rows(rows)
+            self._conn.commit()
+            self._compact_if_needed()
+
+    def delete_nodes(
+        self,
+        node_ids:Optional[List[str]]=None,
+        filters:Optional[MetadataFilters]=None,
+        **delete_kwargs:Any
+    ) -> None:
+        """
+            Deletes nodes by ID and/or metadata filters.
+
+            Args:
+            node_ids (Optional[List[str]]): The node IDs.
+            filters (Optional[MetadataFilters]): The metadata filters.
+        """
+        with self._lock:
+            if node_ids is not None:
+                rows = list(self._rows_for_ids(list(node_ids)).values())
+            else:
+                rows = np.flatnonzero(self._alive).tolist()
+            if filters is not None:
+                predicate = compile_filters(filters)
+                if node_ids is not None:
+                    metadata_by_row = {row: record[3] for row, record in self._read_rows(rows).items()}
+                else:
+                    metadata_by_row = dict(self._conn.execute("SELECT row, metadata FROM nodes"))
+                rows = [
+                    row for row in rows
+                    if row in metadata_by_row and predicate(json.loads(metadata_by_row[row] or "{}"))
+                ]
+            self._kill_rows(rows)
+            self._conn.commit()
+            self._compact_if_needed()
+
+    def clear(self) -> None:
+        """
+            Deletes every node.
+        """
+        self.delete_nodes()
+
+    def query(self, query:VectorStoreQuery, **kwargs:Any) -> VectorStoreQueryResult:
+        """
+            Finds the nodes with the highest dot product with the query embedding.
+
+            Args:
+            query (VectorStoreQuery): The query, with query_embedding, similarity_top_k and optional filters.
+
+            Returns:
+            VectorStoreQueryResult: The nodes, similarities and IDs, best first.
+        """
+        with metrics.span("vector_store_query", store="local", index_type=self.index_type):
+            return self._query(query)
+
+    def _query(self, query:VectorStoreQuery) -> VectorStoreQueryResult:
+        if query.query_embedding is None:
+            raise ValueError("LocalVectorStore requires a query embedding")
+        query_vector = np.asarray(query.query_embedding, dtype=np.float32)
+
+        with self._lock:
+            generation = self._generation
+            mask = self._alive.copy()
+            if query.node_ids:
+                id_mask = np.zeros_like(mask)
+                id_mask[list(self._rows_for_ids(list(query.node_ids)).values())] = True
+                mask &= id_mask
+            if self.index_type == "ivf" and self._centroids is not None:
+                nprobe = min(self.nprobe, len(self._centroids))
+                probes = np.argpartition(-(self._centroids @ query_vector), nprobe - 1)[:nprobe]
+                mask &= np.isin(self._assignments[:len(mask)], probes)
+            rows = np.flatnonzero(mask)
+            vectors = self._vectors
+
+        if not len(rows):
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        scores = np.asarray(vectors[rows]) @ query_vector
+        predicate = compile_filters(query.filters) if query.filters is not None else None
+        top_k = query.similarity_top_k
+        checked = np.zeros(len(rows), dtype=bool)
+        nodes, similarities, ids = [], [], []
+
+        # Rows are read from SQLite best first: only the top_k without filters,
+        # and with filters growing batches until top_k of them match
+        count = top_k if predicate is None else max(FILTER_CANDIDATES, top_k)
+        while len(nodes) < top_k and not checked.all():
+            count = min(count, len(rows))
+            best = np.argpartition(-scores, count - 1)[:count]
+            best = best[~checked[best]]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            checked[best] = True
+
+            with self._lock:
+                if self._generation != generation:
+                    # compacted since the search, so the row numbers changed
+                    return self._query(query)
+                records = self._read_rows(rows[best].tolist())
+
+            for index in best.tolist():
+                row = int(rows[index])
+                if row not in records:
+                    # deleted between the search and the lookup
+                    continue
+                node_id, ref_doc_id, text, metadata = records[row]
+                metadata = json.loads(metadata) if metadata else {}
+                if predicate is not None and not predicate(metadata):
+                    continue
+                nodes.append(TextNode(id_=node_id, text=text or "", metadata=metadata))
+                similarities.append(float(scores[index]))
+                ids.append(node_id)
+                if len(nodes) == top_k:
+                    break
+            count *= 4
+        return VectorStoreQueryResult(nodes=nodes, similarities=similarities, ids=ids)
@@ -0,0 +1,177 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterator, List, Optional, Set, Tuple
+
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode
+from pypdf import PdfReader
+
+DEFAULT_CHUNK_SIZE = 1024
+DEFAULT_CHUNK_OVERLAP = 200
+DEFAULT_PAGES_PER_TASK = 20
+# The metadata SimpleDirectoryReader keeps out of embedding and LLM text; file_path stays in as context
+EXCLUDED_METADATA_KEYS = [
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+]
+
+# (path, first page, last page exclusive); pages are None for whole-file tasks
+ParseTask = Tuple[str, Optional[int], Optional[int]]
+
+def plan_parse_tasks(
+    input_files:List[str],
+    pages_per_task:int=DEFAULT_PAGES_PER_TASK
+) -> List[ParseTask]:
+    """
+        Splits files into parse tasks, breaking large PDFs into page ranges.
+
+        Args:
+        input_files (List[str]): The files to parse.
+        pages_per_task (int): The maximum number of PDF pages per task.
+
+        Returns:
+        List[ParseTask]: The tasks, in input and page order.
+    """
+    tasks = []
+    for path in input_files:
+        if Path(path).suffix.lower() != ".pdf":
+            tasks.append((path, None, None))
+            continue
+        num_pages = len(PdfReader(path).pages)
+        for first in range(0, num_pages, pages_per_task):
+            tasks.append((path, first, min(first + pages_per_task, num_pages)))
+    return tasks
+
+def _load_pdf_pages(path:str, first:int, last:int) -> List[Document]:
+    # Mirrors the metadata of llama_index's PDFReader and the exclusions of SimpleDirectoryReader: one Document per page
+    reader = PdfReader(path)
+    try:
+        labels = reader.page_labels
+    except Exception:
+        labels = []
+    documents = []
+    for page_number in range(first, last):
+        page_label = labels[page_number] if page_number < len(labels) else str(page_number + 1)
+        documents.append(
+            Document(
+                text=reader.pages[page_number].extract_text() or "",
+                metadata={
+                    "page_label": page_label,
+                    "file_name": Path(path).name,
+                    "file_path": str(path),
+                    "file_type": "application/pdf",
+                },
+                excluded_embed_metadata_keys=list(EXCLUDED_METADATA_KEYS),
+                excluded_llm_metadata_keys=list(EXCLUDED_METADATA_KEYS),
+            )
+        )
+    return documents
+
+def _parse_task(task:ParseTask, chunk_size:int, chunk_overlap:int) -> List[BaseNode]:
+    # Runs in a worker process
+    path, first, last = task
+    if first is None:
+        documents = SimpleDirectoryReader(input_files=[path]).load_data()
+    else:
+        documents = _load_pdf_pages(path, first, last)
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return splitter.get_nodes_from_documents(documents)
+
+def iter_parsed_nodes(
+    input_files:List[str],
+    max_workers:Optional[int]=None,
+    chunk_size:int=DEFAULT_CHUNK_SIZE,
+    chunk_overlap:int=DEFAULT_CHUNK_OVERLAP,
+    pages_per_task:int=DEFAULT_PAGES_PER_TASK,
+    failed_paths:Optional[Set[str]]=None
+) -> Iterator[List[BaseNode]]:
+    """
+        Parses and chunks files on a process pool, yielding nodes as each
+        file or page range finishes.
+
+        Results arrive in completion order, so the caller can start embedding
+        the first chunks while later files are still being parsed. A file or
+        page range that fails to parse is logged and skipped, and its path is
+        added to failed_paths, so the caller can tell a partly parsed file
+        from one whose chunks are really gone.
+
+        Args:
+        input_files (List[str]): The files to parse.
+        max_workers (Optional[int]): The number of worker processes. Defaults to the CPU count.
+        chunk_size (int): The chunk size in tokens.
+        chunk_overlap (int): The chunk overlap in tokens.
+        pages_per_task (int): The maximum number of PDF pages per task.
+        failed_paths (Optional[Set[str]]): A set the paths of failed files are added to.
+
+        Yields:
+        List[BaseNode]: The nodes of one file or page range.
+    """
+    tasks = plan_parse_tasks(input_files, pages_per_task)
+    if not tasks:
+        return
+
+    start = time.perf_counter()
+    node_count = 0
+    max_workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_parse_task, task, chunk_size, chunk_overlap): task
+            for task in tasks
+        }
+        for future in as_completed(futures):
+            path, first, last = futures[future]
+            try:
+                nodes = future.result()
+            except Exception as e:
+                pages = f" pages {first}-{last}" if first is not None else ""
+                logging.error(f"Failed to parse {path}{pages}: {e}")
+                if failed_paths is not None:
+                    failed_paths.add(path)
+                continue
+            node_count += len(nodes)
+            yield nodes
+
+    logging.info(
+        f"Parsed {len(input_files)} files in {len(tasks)} tasks into {node_count} nodes "
+        f"with {max_workers} workers in {time.perf_counter() - start:.2f}s"
+    )
+
+def parse_directory(
+    data_path:str,
+    max_workers:Optional[int]=None,
+    chunk_size:int=DEFAULT_CHUNK_SIZE,
+    chunk_overlap:int=DEFAULT_CHUNK_OVERLAP,
+    pages_per_task:int=DEFAULT_PAGES_PER_TASK
+) -> List[BaseNode]:
+    """
+        Parses and chunks every file in a directory in parallel.
+
+        Args:
+        data_path (str): The directory of documents.
+        max_workers (Optional[int]): The number of worker processes. Defaults to the CPU count.
+        chunk_size (int): The chunk size in tokens.
+        chunk_overlap (int): The chunk overlap in tokens.
+        pages_per_task (int): The maximum number of PDF pages per task.
+
+        Returns:
+        List[BaseNode]: The nodes, ordered by file path and page.
+    """
+    input_files = [str(path) for path in sorted(Path(data_path).iterdir()) if path.is_file()]
+    nodes = [
+        node
+        for batch in iter_parsed_nodes(input_files, max_workers, chunk_size, chunk_overlap, pages_per_task)
+        for node in batch
+    ]
+    return sorted(nodes, key=_node_order)
+
+def _node_order(node:BaseNode) -> Tuple[str, int]:
+    page_label = node.metadata.get("page_label", "0")
+    return node.metadata.get("file_path", ""), int(page_label) if str(page_label).isdigit() else 0
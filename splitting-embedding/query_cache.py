@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 300.0
+
+class TTLCache:
+    """
+        A thread-safe in-process LRU cache whose entries expire after a TTL.
+
+        Args:
+        maxsize (int): The maximum number of entries.
+        ttl (float): Seconds an entry stays valid.
+
+        Attributes:
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups not found or expired.
+    """
+
+    def __init__(self, maxsize:int=DEFAULT_CACHE_SIZE, ttl:float=DEFAULT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key:Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key:Hashable, value:Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+class SingleFlight:
+    """
+        Coalesces concurrent calls with the same key into one execution.
+
+        The first caller for a key runs the function; callers that arrive
+        while it is in flight wait for and share its result or exception.
+
+        Attributes:
+        coalesced (int): The number of calls that shared another call's result.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key:Hashable, fn:Callable[[], Any]) -> Any:
+        """
+            Runs fn, or waits for the in-flight call with the same key.
+
+            Args:
+            key (Hashable): The call key.
+            fn (Callable[[], Any]): The function to run.
+
+            Returns:
+            Any: The result of fn.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+class AsyncSingleFlight:
+    """
+        Coalesces concurrent coroutine calls with the same key on an event loop.
+
+        The first caller's coroutine runs as a task; callers that arrive while
+        it is pending await the same task. The task is shielded, so a caller
+        that times out or is cancelled does not cancel it for the others.
+
+        Attributes:
+        coalesced (int): The number of calls that shared another call's result.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key:Hashable, fn:Callable[[], Awaitable[Any]]) -> Any:
+        """
+            Awaits fn(), or the in-flight task with the same key.
+
+            Args:
+            key (Hashable): The call key.
+            fn (Callable[[], Awaitable[Any]]): The coroutine function to run.
+
+            Returns:
+            Any: The result of fn().
+        """
+        # tasks belong to one event loop, so the key is scoped to the running loop
+        task_key = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(task_key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[task_key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(task_key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
@@ -0,0 +1,237 @@
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from instrumentation import metrics
+
+# Exception class names and message fragments Vertex uses for quota errors
+QUOTA_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests"}
+QUOTA_ERROR_MARKERS = ("429", "RESOURCE_EXHAUSTED", "Quota exceeded")
+TRANSIENT_ERROR_NAMES = {"ServiceUnavailable", "DeadlineExceeded", "InternalServerError"}
+
+def is_quota_error(error:BaseException) -> bool:
+    """
+        Checks whether an error is a quota / rate limit rejection.
+
+        Args:
+        error (BaseException): The error.
+
+        Returns:
+        bool: True for 429 / RESOURCE_EXHAUSTED errors.
+    """
+    if type(error).__name__ in QUOTA_ERROR_NAMES:
+        return True
+    message = str(error)
+    return any(marker in message for marker in QUOTA_ERROR_MARKERS)
+
+def is_retryable(error:BaseException) -> bool:
+    """
+        Checks whether an error is worth retrying.
+
+        Args:
+        error (BaseException): The error.
+
+        Returns:
+        bool: True for quota errors and transient server errors.
+    """
+    return is_quota_error(error) or type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+class TokenBucket:
+    """
+        A thread-safe token bucket.
+
+        Args:
+        rate (float): Tokens added per second.
+        capacity (Optional[float]): The maximum burst. Defaults to one second of tokens.
+    """
+
+    def __init__(self, rate:float, capacity:Optional[float]=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens:float=1.0) -> None:
+        """
+            Blocks until the given number of tokens is available and takes them.
+
+            Args:
+            tokens (float): The number of tokens.
+        """
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveConcurrency:
+    """
+        An AIMD concurrency limit.
+
+        The limit grows by about one slot per limit's worth of successful
+        calls and is halved when a call is throttled, converging on the
+        highest concurrency the backend sustains.
+
+        Args:
+        initial (int): The starting limit.
+        minimum (int): The lowest limit.
+        maximum (int): The highest limit.
+    """
+
+    def __init__(self, initial:int=4, minimum:int=1, maximum:int=64):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(initial)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, throttled:bool=False) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self.limit = max(float(self.minimum), self.limit / 2)
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+class RetryBudget:
+    """
+        Caps retries to a fraction of calls so a sustained outage does not
+        multiply load.
+
+        Args:
+        ratio (float): Retries allowed per call.
+        minimum (int): Retries always allowed, for small loads.
+    """
+
+    def __init__(self, ratio:float=0.2, minimum:int=10):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.calls = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def record_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.retries >= self.minimum + self.ratio * self.calls:
+                return False
+            self.retries += 1
+            return True
+
+class RateLimiter:
+    """
+        Wraps calls to a quota-limited API with a token bucket, adaptive
+        concurrency and jittered retries.
+
+        Each call is retried on its own, so when one batch is throttled only
+        that batch is re-sent.
+
+        Args:
+        name (str): The name used in log messages.
+        requests_per_second (Optional[float]): The request rate. None means unlimited.
+        initial_concurrency (int): The starting concurrency limit.
+        max_concurrency (int): The highest concurrency limit.
+        max_attempts (int): The maximum attempts per call.
+        base_delay (float): The base retry delay in seconds.
+        max_delay (float): The maximum retry delay in seconds.
+        retry_ratio (float): Retries allowed per call across the limiter.
+    """
+
+    def __init__(
+        self,
+        name:str,
+        requests_per_second:Optional[float]=None,
+        initial_concurrency:int=4,
+        max_concurrency:int=64,
+        max_attempts:int=6,
+        base_delay:float=0.5,
+        max_delay:float=30.0,
+        retry_ratio:float=0.2
+    ):
+        self.name = name
+        self.bucket = TokenBucket(requests_per_second) if requests_per_second else None
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, maximum=max_concurrency)
+        self.budget = RetryBudget(retry_ratio)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttled = 0
+
+    @classmethod
+    def from_env(cls, name:str, prefix:str) -> "RateLimiter":
+        """
+            Builds a limiter from <prefix>_REQUESTS_PER_SECOND, <prefix>_MAX_CONCURRENCY
+            and <prefix>_MAX_ATTEMPTS environment variables.
+
+            Args:
+            name (str): The name used in log messages.
+            prefix (str): The environment variable prefix.
+
+            Returns:
+            RateLimiter: The limiter.
+        """
+        requests_per_second = os.getenv(f"{prefix}_REQUESTS_PER_SECOND")
+        return cls(
+            name,
+            requests_per_second=float(requests_per_second) if requests_per_second else None,
+            max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", 64)),
+            max_attempts=int(os.getenv(f"{prefix}_MAX_ATTEMPTS", 6)),
+        )
+
+    def call(self, fn:Callable[..., Any], *args:Any, **kwargs:Any) -> Any:
+        """
+            Calls fn within the rate and concurrency limits, retrying
+            retryable errors with full-jitter exponential backoff.
+
+            Args:
+            fn (Callable[..., Any]): The function to call.
+
+            Returns:
+            Any: The result of fn.
+        """
+        self.budget.record_call()
+        for attempt in range(1, self.max_attempts + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            self.concurrency.acquire()
+            throttled = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                throttled = is_quota_error(e)
+                if throttled:
+                    self.throttled += 1
+                    metrics.incr("rate_limit_throttled_total", limiter=self.name)
+                if not is_retryable(e) or attempt == self.max_attempts or not self.budget.try_spend():
+                    raise
+                metrics.incr("rate_limit_retries_total", limiter=self.name)
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                logging.warning(
+                    f"{self.name} call failed (attempt {attempt}/{self.max_attempts}), retrying in {delay:.2f}s: {e}"
+                )
+            finally:
+                self.concurrency.release(throttled)
+            time.sleep(delay)
+
+embedding_rate_limiter = RateLimiter.from_env("Embedding", "EMBED")
+upsert_rate_limiter = RateLimiter.from_env("Upsert", "UPSERT")
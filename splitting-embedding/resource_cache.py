@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+DEFAULT_RESOURCE_CACHE_TTL = 24 * 60 * 60.0
+
+class ResourceCache:
+    """
+        A local file cache of resolved Vertex AI resources.
+
+        Maps a kind and a display name (e.g. "index", "my-index") to what a
+        control-plane lookup found, such as the resource name or deployment
+        state, so warm startups can skip the list calls. Keys are scoped by
+        project and region, so one cache file can be shared between them.
+        Entries expire after a TTL and callers invalidate them when the cached
+        resource turns out not to match.
+
+        Args:
+        path (str): The cache file path.
+        ttl (float): Seconds an entry stays valid.
+        project (Optional[str]): The GCP project the cached resources belong to.
+        region (Optional[str]): The region the cached resources belong to.
+    """
+
+    def __init__(
+        self,
+        path:str,
+        ttl:float=DEFAULT_RESOURCE_CACHE_TTL,
+        project:Optional[str]=None,
+        region:Optional[str]=None
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.project = project
+        self.region = region
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"Ignoring unreadable resource cache {path}: {e}")
+
+    def _key(self, kind:str, name:str) -> str:
+        return f"{self.project}/{self.region}/{kind}:{name}"
+
+    def get(self, kind:str, name:str) -> Optional[Dict[str, Any]]:
+        """
+            Looks up a resource.
+
+            Args:
+            kind (str): The resource kind, e.g. "index".
+            name (str): The display name or other lookup key.
+
+            Returns:
+            Optional[Dict[str, Any]]: The cached value, or None if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(self._key(kind, name))
+        if entry is None or entry["expires_at"] < time.time():
+            return None
+        return entry["value"]
+
+    def set(self, kind:str, name:str, value:Dict[str, Any]) -> None:
+        """
+            Caches a resolved resource and saves the cache file.
+
+            Args:
+            kind (str): The resource kind.
+            name (str): The display name or other lookup key.
+            value (Dict[str, Any]): The resolved values, e.g. {"resource_name": ...}.
+        """
+        with self._lock:
+            self._entries[self._key(kind, name)] = {"value": value, "expires_at": time.time() + self.ttl}
+            self._save()
+
+    def invalidate(self, kind:str, name:str) -> None:
+        """
+            Drops a cached resource, e.g. after a NotFound or a mismatch.
+
+            Args:
+            kind (str): The resource kind.
+            name (str): The display name or other lookup key.
+        """
+        with self._lock:
+            if self._entries.pop(self._key(kind, name), None) is not None:
+                self._save()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._save()
+
+    def _save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
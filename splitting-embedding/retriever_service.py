@@ -0,0 +1,359 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.constants import DEFAULT_SIMILARITY_TOP_K
+from llama_index.core.retrievers import VectorIndexRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, MetadataFilter, MetadataFilters, VectorStore
+
+from embedding_cache import normalize_text
+from instrumentation import metrics
+from query_cache import (
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_CACHE_TTL,
+    AsyncSingleFlight,
+    SingleFlight,
+    TTLCache,
+)
+
+FiltersLike = Union[MetadataFilters, List[MetadataFilter], None]
+
+# Retrieves that aretrieve runs off the event loop, per service
+DEFAULT_RETRIEVE_WORKERS = 8
+
+def to_metadata_filters(filters:FiltersLike) -> Optional[MetadataFilters]:
+    """
+        Normalizes a list of MetadataFilter into MetadataFilters.
+
+        Args:
+        filters (FiltersLike): A MetadataFilters, a list of MetadataFilter, or None.
+
+        Returns:
+        Optional[MetadataFilters]: The filters, or None if there are none.
+    """
+    if not filters:
+        return None
+    if isinstance(filters, MetadataFilters):
+        return filters
+    return MetadataFilters(filters=list(filters))
+
+def has_native_aquery(vector_store:Any) -> bool:
+    """
+        Checks whether a Vector Store implements aquery() itself, rather than
+        inheriting the LlamaIndex default that calls query() synchronously.
+
+        Args:
+        vector_store (Any): The Vector Store.
+
+        Returns:
+        bool: True if aquery() does not block the event loop.
+    """
+    aquery = getattr(type(vector_store), "aquery", None)
+    return aquery is not None and aquery not in (BasePydanticVectorStore.aquery, VectorStore.aquery)
+
+def copy_results(results:List[NodeWithScore]) -> List[NodeWithScore]:
+    """
+        Copies retrieval results, so callers can change scores, nodes or
+        metadata without changing a cached result set.
+
+        Args:
+        results (List[NodeWithScore]): The results.
+
+        Returns:
+        List[NodeWithScore]: New results with copies of the nodes and their metadata.
+    """
+    return [
+        NodeWithScore(
+            node=result.node.model_copy(update={"metadata": dict(result.node.metadata)}),
+            score=result.score,
+        )
+        for result in results
+    ]
+
+class RetrieverService:
+    """
+        A long-lived retriever over a Vector Store.
+
+        The index is built once and shared; each call builds only a
+        lightweight VectorIndexRetriever for its own top_k and filters, so one
+        service can be used concurrently from several threads or tasks.
+
+        Query embeddings and retrieval results are kept in TTL/LRU caches, and
+        concurrent identical searches are coalesced so they share a single
+        embedding call and vector search. Every caller gets its own copy of
+        the results. The ingest functions drop the cached results of the
+        services for a store with invalidate_retriever_services.
+
+        If the Vector Store has no native aquery(), as with VertexAIVectorStore
+        and LocalVectorStore, aretrieve() runs the search on a bounded thread
+        pool so it does not block the event loop.
+
+        Args:
+        vector_store (Any): The Vector Store, e.g. VertexAIVectorStore.
+        embed_model (Any): The embedding model.
+        similarity_top_k (int): The default number of results.
+        cache_size (int): The maximum number of cached embeddings and result sets. 0 disables caching.
+        cache_ttl (float): Seconds a cached embedding or result set stays valid.
+        retrieve_workers (int): The maximum number of searches aretrieve() runs in threads at once.
+    """
+
+    def __init__(
+        self,
+        vector_store:Any,
+        embed_model:Any,
+        similarity_top_k:int=DEFAULT_SIMILARITY_TOP_K,
+        cache_size:int=DEFAULT_CACHE_SIZE,
+        cache_ttl:float=DEFAULT_CACHE_TTL,
+        retrieve_workers:int=DEFAULT_RETRIEVE_WORKERS
+    ):
+        self.vector_store = vector_store
+        self.embed_model = embed_model
+        self.similarity_top_k = similarity_top_k
+        self.cache_size = cache_size
+        self.embedding_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.result_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._embedding_flight = SingleFlight()
+        self._result_flight = SingleFlight()
+        self._async_embedding_flight = AsyncSingleFlight()
+        self._async_result_flight = AsyncSingleFlight()
+        self._native_aquery = has_native_aquery(vector_store)
+        # threads are only started on first use
+        self._executor = ThreadPoolExecutor(max_workers=retrieve_workers, thread_name_prefix="retrieve")
+        self.index = VectorStoreIndex.from_vector_store(
+            vector_store=vector_store, embed_model=embed_model
+        )
+        self._default_retriever = self.index.as_retriever(similarity_top_k=similarity_top_k)
+
+    def get_retriever(
+        self,
+        similarity_top_k:Optional[int]=None,
+        filters:FiltersLike=None
+    ) -> VectorIndexRetriever:
+        """
+            Returns a retriever for the given top_k and filters.
+
+            Args:
+            similarity_top_k (Optional[int]): The number of results. Defaults to the service default.
+            filters (FiltersLike): The metadata filters.
+
+            Returns:
+            VectorIndexRetriever: The retriever.
+        """
+        metadata_filters = to_metadata_filters(filters)
+        if metadata_filters is None and similarity_top_k in (None, self.similarity_top_k):
+            return self._default_retriever
+        return VectorIndexRetriever(
+            index=self.index,
+            similarity_top_k=similarity_top_k or self.similarity_top_k,
+            filters=metadata_filters,
+        )
+
+    def retrieve(
+        self,
+        query:str,
+        similarity_top_k:Optional[int]=None,
+        filters:FiltersLike=None
+    ) -> List[NodeWithScore]:
+        """
+            Retrieves the nodes most similar to a query.
+
+            Args:
+            query (str): The query.
+            similarity_top_k (Optional[int]): The number of results. Defaults to the service default.
+            filters (FiltersLike): The metadata filters.
+
+            Returns:
+            List[NodeWithScore]: The matching nodes.
+        """
+        top_k, metadata_filters, key = self._result_key(query, similarity_top_k, filters)
+        if self.cache_size:
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                metrics.incr("retrieval_cache_hits_total")
+                return copy_results(cached)
+
+        def search() -> List[NodeWithScore]:
+            query_bundle = QueryBundle(query_str=query, embedding=self.get_query_embedding(query))
+            with metrics.span("retrieval", filtered=metadata_filters is not None):
+                result = self.get_retriever(top_k, metadata_filters).retrieve(query_bundle)
+            if self.cache_size:
+                self.result_cache.set(key, result)
+            return result
+
+        return copy_results(self._result_flight.do(key, search))
+
+    async def aretrieve(
+        self,
+        query:str,
+        similarity_top_k:Optional[int]=None,
+        filters:FiltersLike=None
+    ) -> List[NodeWithScore]:
+        """
+            Asynchronously retrieves the nodes most similar to a query.
+
+            Args:
+            query (str): The query.
+            similarity_top_k (Optional[int]): The number of results. Defaults to the service default.
+            filters (FiltersLike): The metadata filters.
+
+            Returns:
+            List[NodeWithScore]: The matching nodes.
+        """
+        top_k, metadata_filters, key = self._result_key(query, similarity_top_k, filters)
+        if self.cache_size:
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                metrics.incr("retrieval_cache_hits_total")
+                return copy_results(cached)
+
+        async def search() -> List[NodeWithScore]:
+            embedding = await self.aget_query_embedding(query)
+            query_bundle = QueryBundle(query_str=query, embedding=embedding)
+            retriever = self.get_retriever(top_k, metadata_filters)
+            with metrics.span("retrieval", filtered=metadata_filters is not None):
+                if self._native_aquery:
+                    result = await retriever.aretrieve(query_bundle)
+                else:
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, retriever.retrieve, query_bundle
+                    )
+            if self.cache_size:
+                self.result_cache.set(key, result)
+            return result
+
+        return copy_results(await self._async_result_flight.do(key, search))
+
+    def _result_key(
+        self,
+        query:str,
+        similarity_top_k:Optional[int],
+        filters:FiltersLike
+    ) -> Tuple[int, Optional[MetadataFilters], Tuple[str, int, str]]:
+        top_k = similarity_top_k or self.similarity_top_k
+        metadata_filters = to_metadata_filters(filters)
+        return top_k, metadata_filters, (normalize_text(query), top_k, repr(metadata_filters))
+
+    def get_query_embedding(self, query:str) -> List[float]:
+        """
+            Embeds a query, using the cache and coalescing concurrent requests.
+
+            Args:
+            query (str): The query.
+
+            Returns:
+            List[float]: The query embedding.
+        """
+        key = normalize_text(query)
+        if self.cache_size:
+            embedding = self.embedding_cache.get(key)
+            if embedding is not None:
+                metrics.incr("query_embedding_cache_hits_total")
+                return embedding
+
+        def embed() -> List[float]:
+            with metrics.span("query_embedding"):
+                embedding = self.embed_model.get_query_embedding(query)
+            if self.cache_size:
+                self.embedding_cache.set(key, embedding)
+            return embedding
+
+        return self._embedding_flight.do(key, embed)
+
+    async def aget_query_embedding(self, query:str) -> List[float]:
+        """
+            Asynchronously embeds a query, using the cache and coalescing
+            concurrent requests.
+
+            Args:
+            query (str): The query.
+
+            Returns:
+            List[float]: The query embedding.
+        """
+        key = normalize_text(query)
+        if self.cache_size:
+            embedding = self.embedding_cache.get(key)
+            if embedding is not None:
+                metrics.incr("query_embedding_cache_hits_total")
+                return embedding
+
+        async def embed() -> List[float]:
+            with metrics.span("query_embedding"):
+                embedding = await self.embed_model.aget_query_embedding(query)
+            if self.cache_size:
+                self.embedding_cache.set(key, embedding)
+            return embedding
+
+        return await self._async_embedding_flight.do(key, embed)
+
+    def clear_caches(self) -> None:
+        """
+            Drops cached embeddings and results, e.g. after re-ingesting.
+        """
+        self.embedding_cache.clear()
+        self.result_cache.clear()
+
+    def clear_results(self) -> None:
+        """
+            Drops cached results but keeps query embeddings, which do not
+            depend on the Vector Store contents.
+        """
+        self.result_cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+            Returns cache and coalescing counters.
+
+            Returns:
+            Dict[str, Any]: Embedding and result cache stats and coalesced call counts.
+        """
+        return {
+            "embedding_cache": self.embedding_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+            "coalesced_embeddings": self._embedding_flight.coalesced + self._async_embedding_flight.coalesced,
+            "coalesced_searches": self._result_flight.coalesced + self._async_result_flight.coalesced,
+        }
+
+_services: Dict[Tuple[int, int], RetrieverService] = {}
+_services_lock = threading.Lock()
+
+def get_retriever_service(vector_store:Any, embed_model:Any) -> RetrieverService:
+    """
+        Returns the shared RetrieverService for a Vector Store and embedding
+        model, building it on first use.
+
+        Args:
+        vector_store (Any): The Vector Store.
+        embed_model (Any): The embedding model.
+
+        Returns:
+        RetrieverService: The shared service.
+    """
+    key = (id(vector_store), id(embed_model))
+    service = _services.get(key)
+    if service is None:
+        with _services_lock:
+            service = _services.get(key)
+            if service is None:
+                service = RetrieverService(vector_store, embed_model)
+                _services[key] = service
+    return service
+
+def invalidate_retriever_services(vector_store:Any=None) -> None:
+    """
+        Drops the cached results of the shared services for a Vector Store,
+        e.g. after nodes were added to or deleted from it.
+
+        Args:
+        vector_store (Any): The Vector Store. Services for every store are invalidated if None.
+    """
+    with _services_lock:
+        services = [
+            service for (store_id, _), service in _services.items()
+            if vector_store is None or store_id == id(vector_store)
+        ]
+    for service in services:
+        service.clear_results()
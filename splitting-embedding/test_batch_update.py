@@ -0,0 +1,59 @@
+from typing import List
+
+import pytest
+
+from batch_update import LocalBucket, bulk_load_records
+from bm25_index import BM25Index
+from fake_aiplatform import FakeAiplatform
+from fake_embedding import FakeEmbedding
+
+DIMENSIONS = 16
+
+class FailingEmbedding(FakeEmbedding):
+    """
+        Fails every request that contains the text "boom".
+    """
+
+    def _get_text_embeddings(self, texts:List[str]) -> List[List[float]]:
+        if "boom" in texts:
+            raise ValueError("embedding request rejected")
+        return super()._get_text_embeddings(texts)
+
+@pytest.fixture
+def fake():
+    return FakeAiplatform()
+
+@pytest.fixture
+def index(fake):
+    return fake.MatchingEngineIndex.create_tree_ah_index(display_name="my-index")
+
+def records(texts):
+    return [{"description": text, "sku": f"SKU-{i}"} for i, text in enumerate(texts)]
+
+def test_bulk_load_updates_the_index(fake, index, tmp_path):
+    lexical_index = BM25Index(str(tmp_path / "bm25"))
+
+    result = bulk_load_records(
+        index, FakeEmbedding(dimensions=DIMENSIONS), records(["denim", "linen", "wool"]), "description",
+        LocalBucket(str(tmp_path / "bucket")), lexical_index=lexical_index,
+    )
+
+    assert result["datapoints"] == 3
+    assert len(fake.indexes[index.resource_name]["datapoints"]) == 3
+    assert len(BM25Index.load(str(tmp_path / "bm25"))) == 3
+
+def test_failed_batch_leaves_the_index_unchanged(fake, index, tmp_path):
+    bucket = LocalBucket(str(tmp_path / "bucket"))
+    bulk_load_records(index, FakeEmbedding(dimensions=DIMENSIONS), records(["denim", "linen"]), "description", bucket)
+    fake.calls.clear()
+    lexical_index = BM25Index(str(tmp_path / "bm25"))
+
+    with pytest.raises(RuntimeError, match="1 embed"):
+        bulk_load_records(
+            index, FailingEmbedding(dimensions=DIMENSIONS), records(["wool", "boom", "silk"]), "description",
+            bucket, batch_size=1, is_complete_overwrite=True, lexical_index=lexical_index,
+        )
+
+    assert fake.calls["MatchingEngineIndex.update_embeddings"] == 0
+    assert len(fake.indexes[index.resource_name]["datapoints"]) == 2
+    assert len(BM25Index.load(str(tmp_path / "bm25"))) == 0
@@ -0,0 +1,86 @@
+import pytest
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+@pytest.fixture
+def index():
+    lexical_index = BM25Index()
+    lexical_index.add([
+        TextNode(id_="jeans", text="Slim denim jeans SKU-1042", metadata={"color": "blue"}),
+        TextNode(id_="jacket", text="Denim jacket with denim pockets", metadata={"color": "black"}),
+        TextNode(id_="shirt", text="Linen shirt", metadata={"color": "white"}),
+    ])
+    return lexical_index
+
+def ids(results):
+    return [result.node.node_id for result in results]
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    assert tokenize("Slim SKU-1042 v2.1") == ["slim", "sku-1042", "sku", "1042", "v2.1", "v2", "1"]
+
+def test_search_ranks_by_term_frequency(index):
+    results = index.search("denim", top_k=10)
+
+    assert ids(results) == ["jacket", "jeans"]
+    assert results[0].score > results[1].score
+    assert results[0].node.metadata == {"color": "black"}
+
+def test_search_finds_identifiers(index):
+    assert ids(index.search("sku-1042", top_k=10)) == ["jeans"]
+
+def test_search_applies_the_predicate(index):
+    results = index.search("denim", top_k=1, predicate=lambda metadata: metadata["color"] == "blue")
+
+    assert ids(results) == ["jeans"]
+
+def test_add_replaces_a_node(index):
+    index.add([TextNode(id_="shirt", text="Denim shirt", metadata={"color": "blue"})])
+
+    assert len(index) == 3
+    assert ids(index.search("linen", top_k=10)) == []
+    assert "shirt" in ids(index.search("denim", top_k=10))
+
+def test_delete_nodes(index):
+    index.delete_nodes(["jacket", "unknown"])
+
+    assert len(index) == 2
+    assert ids(index.search("denim", top_k=10)) == ["jeans"]
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "bm25.sqlite")
+    saved = BM25Index(path)
+    saved.add([TextNode(id_="jeans", text="Slim denim jeans", metadata={"color": "blue", "price": 65.0})])
+    saved.save()
+    saved.add([TextNode(id_="jacket", text="Denim jacket")])
+
+    loaded = BM25Index.load(path)
+
+    assert len(loaded) == 1
+    [result] = loaded.search("denim", top_k=10)
+    assert result.node.node_id == "jeans"
+    assert result.node.text == "Slim denim jeans"
+    assert result.node.metadata == {"color": "blue", "price": 65.0}
+
+def test_discard_drops_unsaved_changes(tmp_path):
+    lexical_index = BM25Index(str(tmp_path / "bm25.sqlite"))
+    lexical_index.add([TextNode(id_="jeans", text="Slim denim jeans")])
+    lexical_index.save()
+    lexical_index.add([TextNode(id_="jacket", text="Denim jacket")])
+    lexical_index.delete_nodes(["jeans"])
+
+    lexical_index.discard()
+
+    assert len(lexical_index) == 1
+    assert ids(lexical_index.search("denim", top_k=10)) == ["jeans"]
+
+def test_reciprocal_rank_fusion_orders_by_summed_reciprocal_rank():
+    def ranking(*node_ids):
+        return [NodeWithScore(node=TextNode(id_=node_id, text=node_id), score=1.0) for node_id in node_ids]
+
+    fused = reciprocal_rank_fusion([ranking("a", "b", "c"), ranking("b", "d", "a")], top_k=3, k=60)
+
+    # b is in the top two of both lists, a at both ends, d and c in one list only
+    assert ids(fused) == ["b", "a", "d"]
+    assert fused[0].score == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[1].score == pytest.approx(1 / 61 + 1 / 63)
@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from dedup import Deduplicator
+
+WORDS = ["denim", "linen", "wool", "silk", "cotton", "jacket", "shirt", "coat"]
+
+@pytest.fixture
+def text():
+    # 200 distinct words, so 198 distinct shingles
+    rng = random.Random(0)
+    return " ".join(f"{rng.choice(WORDS)}{i}" for i in range(200))
+
+def edit(text, every):
+    # replaces every n-th word, so about 3/every of the 3-word shingles change
+    return " ".join("changed" if i % every == 0 else word for i, word in enumerate(text.split()))
+
+def test_exact_duplicates_after_normalization(text):
+    deduplicator = Deduplicator("exact")
+
+    assert deduplicator.check(text) is None
+    assert deduplicator.check(f"  {text.replace(' ', chr(10))} ") == 0
+    assert deduplicator.check(edit(text, 100)) is None
+    assert deduplicator.report.exact_duplicates == 1
+    assert deduplicator.report.near_duplicates == 0
+
+@pytest.mark.parametrize("method", ["minhash", "simhash"])
+def test_near_duplicates_at_the_default_thresholds(method, text):
+    deduplicator = Deduplicator(method)
+
+    assert deduplicator.check(text) is None
+    # one word in 100 changed: a Jaccard similarity of about 0.94
+    assert deduplicator.check(edit(text, 100)) == 0
+    # one word in 3 changed: no shingle left in common
+    assert deduplicator.check(edit(text, 3)) is None
+    assert deduplicator.report.near_duplicates == 1
+    assert deduplicator.report.kept == 2
+
+def test_minhash_threshold(text):
+    near = edit(text, 20)
+
+    lenient = Deduplicator("minhash", threshold=0.5)
+    lenient.check(text)
+    strict = Deduplicator("minhash", threshold=0.95)
+    strict.check(text)
+
+    # one word in 20 changed: a Jaccard similarity of about 0.74
+    assert lenient.check(near) == 0
+    assert strict.check(near) is None
+
+def test_simhash_distance(text):
+    exact_only = Deduplicator("simhash", max_distance=0)
+    exact_only.check(text)
+
+    assert exact_only.check(edit(text, 3)) is None
+
+@pytest.mark.parametrize("method", ["exact", "minhash", "simhash"])
+def test_max_entries_forgets_the_oldest_texts(method, text):
+    deduplicator = Deduplicator(method, max_entries=2)
+    texts = [edit(text, every) for every in (2, 3, 5)]
+    for other in texts:
+        deduplicator.check(other)
+
+    assert len(deduplicator) == 2
+    # the first text was forgotten, the last two are still remembered
+    assert deduplicator.check(texts[0]) is None
+    assert deduplicator.check(texts[2]) == 2
+    assert all(position != 0 for bucket in deduplicator._buckets for entry in bucket.values() for position in entry)
+
+def test_reset_forgets_every_text(text):
+    deduplicator = Deduplicator("minhash")
+    deduplicator.check(text)
+
+    deduplicator.reset()
+
+    assert len(deduplicator) == 0
+    assert deduplicator.check(text) is None
+    assert deduplicator.report.texts == 2
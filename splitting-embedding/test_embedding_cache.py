@@ -0,0 +1,38 @@
+import pytest
+
+from embedding_cache import EmbeddingCache
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_entries=3, dtype="float32")
+
+def vector(value):
+    return [value, 0.0, 1.0]
+
+def test_replacing_a_key_is_not_counted_twice(cache):
+    cache.put_many({"a": vector(1.0), "b": vector(2.0)})
+    cache.put_many({"a": vector(3.0), "c": vector(4.0)})
+
+    assert len(cache) == 3
+    assert cache.evictions == 0
+    assert cache.get_many(["a"]) == {"a": vector(3.0)}
+
+def test_least_recently_used_entries_are_evicted(cache):
+    cache.put_many({"a": vector(1.0), "b": vector(2.0), "c": vector(3.0)})
+    cache.get_many(["a"])
+
+    cache.put_many({"d": vector(4.0), "e": vector(5.0)})
+
+    assert len(cache) == 3
+    assert cache.evictions == 2
+    assert set(cache.get_many(["a", "b", "c", "d", "e"])) == {"a", "d", "e"}
+
+def test_count_is_loaded_on_open(cache):
+    cache.put_many({"a": vector(1.0), "b": vector(2.0)})
+    cache.close()
+
+    reopened = EmbeddingCache(cache.path, max_entries=3, dtype="float32")
+    reopened.put_many({"b": vector(3.0), "c": vector(4.0)})
+
+    assert len(reopened) == 3
+    assert reopened.stats()["entries"] == 3
@@ -0,0 +1,13 @@
+import pytest
+
+from import_budget import check_budget
+
+@pytest.mark.parametrize("module", ["gcp_index_embed", "embedding_pipeline"])
+def test_import_is_within_budget(module):
+    assert check_budget(module) == []
+
+def test_heavy_imports_are_reported():
+    failures = check_budget("local_vector_store", budget_ms=float("inf"), runs=1)
+
+    assert any("loaded numpy" in failure for failure in failures)
+    assert any("loaded llama_index" in failure for failure in failures)
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+from llama_index.core.schema import TextNode
+
+from fake_embedding import FakeEmbedding
+from incremental_index import sync_directory
+from local_vector_store import LocalVectorStore
+
+DIMENSIONS = 16
+
+class PagesParser:
+    """
+        Returns fixed (page label, text) chunks for every file, in the given order.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get_nodes_from_documents(self, documents):
+        return [
+            TextNode(text=text, metadata={"file_path": document.metadata["file_path"], "page_label": page_label})
+            for document in documents
+            for page_label, text in self.pages
+        ]
+
+@pytest.fixture
+def data_path(tmp_path):
+    path = tmp_path / "data"
+    path.mkdir()
+    (path / "report.txt").write_text("a report")
+    return path
+
+def sync(tmp_path, data_path, pages, name):
+    manifest_path = str(tmp_path / f"{name}.json")
+    summary = sync_directory(
+        str(data_path),
+        LocalVectorStore(str(tmp_path / name), DIMENSIONS),
+        FakeEmbedding(dimensions=DIMENSIONS),
+        manifest_path,
+        node_parser=PagesParser(pages),
+    )
+    with open(manifest_path, encoding="utf-8") as f:
+        return summary, json.load(f)["files"]
+
+def test_same_text_on_two_pages_is_two_chunks(tmp_path, data_path):
+    summary, files = sync(tmp_path, data_path, [("1", "Confidential"), ("2", "Confidential")], "store")
+
+    assert summary["embedded_chunks"] == 2
+    [entry] = files.values()
+    assert len(entry["chunks"]) == 2
+
+def test_chunk_ids_do_not_depend_on_parse_order(tmp_path, data_path):
+    pages = [("1", "Confidential"), ("2", "Confidential"), ("2", "Summary")]
+
+    _, in_order = sync(tmp_path, data_path, pages, "in_order")
+    _, reversed_order = sync(tmp_path, data_path, pages[::-1], "reversed_order")
+
+    assert [entry["chunks"] for entry in in_order.values()] == [entry["chunks"] for entry in reversed_order.values()]
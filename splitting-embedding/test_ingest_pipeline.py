@@ -0,0 +1,67 @@
+import pytest
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from fake_embedding import FakeEmbedding
+from ingest_pipeline import stream_records_to_vector_store
+from local_vector_store import LocalVectorStore
+
+DIMENSIONS = 16
+
+@pytest.fixture
+def vector_store(tmp_path):
+    return LocalVectorStore(str(tmp_path / "store"), DIMENSIONS)
+
+@pytest.fixture
+def embed_model():
+    return FakeEmbedding(dimensions=DIMENSIONS)
+
+def stored_metadata(vector_store, embed_model, text):
+    result = vector_store.query(
+        VectorStoreQuery(query_embedding=embed_model.get_query_embedding(text), similarity_top_k=10)
+    )
+    return sorted((node.metadata for node in result.nodes), key=lambda metadata: metadata["sku"])
+
+def test_records_with_the_same_text_are_all_kept(vector_store, embed_model):
+    records = [
+        {"description": "Slim denim jeans", "sku": "SKU-1", "color": "blue", "price": 65.0},
+        {"description": "Slim denim jeans", "sku": "SKU-2", "color": "black", "price": 70.0},
+    ]
+
+    stats = stream_records_to_vector_store(vector_store, embed_model, records, "description")
+
+    assert stats["upsert"]["items"] == 2
+    assert stored_metadata(vector_store, embed_model, "Slim denim jeans") == [
+        {"sku": "SKU-1", "color": "blue", "price": 65.0},
+        {"sku": "SKU-2", "color": "black", "price": 70.0},
+    ]
+
+def test_reingest_is_idempotent(vector_store, embed_model):
+    records = [{"description": "Linen shirt", "sku": "SKU-1"}, {"description": "Linen shirt", "sku": "SKU-2"}]
+
+    stream_records_to_vector_store(vector_store, embed_model, records, "description")
+    stream_records_to_vector_store(vector_store, embed_model, records, "description")
+
+    assert len(stored_metadata(vector_store, embed_model, "Linen shirt")) == 2
+
+def test_id_field_upserts_changed_metadata_in_place(vector_store, embed_model):
+    record = {"description": "Wool coat", "sku": "SKU-1", "price": 120.0}
+
+    stream_records_to_vector_store(vector_store, embed_model, [record], "description", id_field="sku")
+    stream_records_to_vector_store(vector_store, embed_model, [{**record, "price": 99.0}], "description", id_field="sku")
+
+    assert stored_metadata(vector_store, embed_model, "Wool coat") == [{"sku": "SKU-1", "price": 99.0}]
+
+def test_checkpoint_replays_a_batch_whose_metadata_changed(vector_store, embed_model, tmp_path):
+    checkpoint_path = str(tmp_path / "journal.jsonl")
+    record = {"description": "Wool coat", "sku": "SKU-1", "price": 120.0}
+
+    stream_records_to_vector_store(
+        vector_store, embed_model, [record], "description", checkpoint_path=checkpoint_path, id_field="sku"
+    )
+    stats = stream_records_to_vector_store(
+        vector_store, embed_model, [{**record, "price": 99.0}], "description",
+        checkpoint_path=checkpoint_path, id_field="sku",
+    )
+
+    assert stats["upsert"]["items"] == 1
+    assert stored_metadata(vector_store, embed_model, "Wool coat") == [{"sku": "SKU-1", "price": 99.0}]
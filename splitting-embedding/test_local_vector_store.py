@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import ExactMatchFilter, MetadataFilters, VectorStoreQuery
+
+from local_vector_store import LocalVectorStore
+
+DIMENSIONS = 16
+TOP_K = 10
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+def random_vectors(rng, count):
+    vectors = rng.standard_normal((count, DIMENSIONS)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def make_nodes(rng, ids, source="doc"):
+    return [
+        TextNode(
+            id_=node_id,
+            text=f"text of {node_id}",
+            embedding=vector.tolist(),
+            metadata={"parity": int(node_id.split("-")[1]) % 2},
+            relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=source)},
+        )
+        for node_id, vector in zip(ids, random_vectors(rng, len(ids)))
+    ]
+
+def brute_force(expected, query_vector, top_k=TOP_K, predicate=None):
+    candidates = [
+        (float(np.dot(np.asarray(node.embedding, dtype=np.float32), query_vector)), node_id)
+        for node_id, node in expected.items()
+        if predicate is None or predicate(node.metadata)
+    ]
+    return [node_id for _, node_id in sorted(candidates, reverse=True)[:top_k]]
+
+def assert_matches_brute_force(store, expected, rng, queries=5):
+    for query_vector in random_vectors(rng, queries):
+        result = store.query(VectorStoreQuery(query_embedding=query_vector.tolist(), similarity_top_k=TOP_K))
+        assert result.ids == brute_force(expected, query_vector)
+        assert result.similarities == pytest.approx(
+            [float(np.dot(expected[node_id].embedding, query_vector)) for node_id in result.ids], abs=1e-5
+        )
+        assert [node.text for node in result.nodes] == [f"text of {node_id}" for node_id in result.ids]
+
+def add(store, expected, nodes):
+    store.add(nodes)
+    expected.update((node.node_id, node) for node in nodes)
+
+def test_exact_store_through_replace_delete_and_compaction(tmp_path, rng):
+    store = LocalVectorStore(str(tmp_path / "store"), DIMENSIONS, compact_threshold=0.5)
+    expected = {}
+    add(store, expected, make_nodes(rng, [f"node-{i}" for i in range(200)]))
+    assert_matches_brute_force(store, expected, rng)
+
+    # replaced nodes leave dead rows behind
+    add(store, expected, make_nodes(rng, [f"node-{i}" for i in range(0, 200, 4)]))
+    assert_matches_brute_force(store, expected, rng)
+
+    deleted = [f"node-{i}" for i in range(1, 200, 2)]
+    store.delete_nodes(deleted)
+    for node_id in deleted:
+        del expected[node_id]
+    # 50 replaced and 100 deleted of 250 rows crosses the threshold
+    assert (tmp_path / "store" / "vectors.1.f32").exists()
+    assert not (tmp_path / "store" / "vectors.f32").exists()
+    assert_matches_brute_force(store, expected, rng)
+
+def test_reopen_from_disk(tmp_path, rng):
+    store = LocalVectorStore(str(tmp_path / "store"), DIMENSIONS)
+    expected = {}
+    add(store, expected, make_nodes(rng, [f"node-{i}" for i in range(100)]))
+    store.delete_nodes([f"node-{i}" for i in range(10)])
+    for i in range(10):
+        del expected[f"node-{i}"]
+    store.compact()
+    add(store, expected, make_nodes(rng, [f"node-{i}" for i in range(90, 110)]))
+
+    reopened = LocalVectorStore(str(tmp_path / "store"), DIMENSIONS)
+
+    assert_matches_brute_force(reopened, expected, rng)
+
+def test_ivf_probing_every_cluster_matches_brute_force_across_retraining(tmp_path, rng):
+    store = LocalVectorStore(
+        str(tmp_path / "store"), DIMENSIONS, index_type="ivf", nlist=4, nprobe=4,
+        ivf_train_threshold=100, ivf_retrain_growth=2.0,
+    )
+    expected = {}
+
+    def trained_count():
+        row = store.client.execute("SELECT value FROM store_info WHERE key = 'trained_count'").fetchone()
+        return row[0] if row else None
+
+    add(store, expected, make_nodes(rng, [f"node-{i}" for i in range(100)]))
+    assert trained_count() == 100
+    assert_matches_brute_force(store, expected, rng)
+
+    # assigned to the existing clusters, below the retraining growth
+    add(store, expected, make_nodes(rng, [f"node-{i}" for i in range(100, 150)]))
+    assert trained_count() == 100
+    assert_matches_brute_force(store, expected, rng)
+
+    add(store, expected, make_nodes(rng, [f"node-{i}" for i in range(150, 200)]))
+    assert trained_count() == 200
+    assert_matches_brute_force(store, expected, rng)
+
+    store.delete_nodes([f"node-{i}" for i in range(0, 200, 3)])
+    for i in range(0, 200, 3):
+        del expected[f"node-{i}"]
+    store.compact()
+    assert_matches_brute_force(store, expected, rng)
+    reopened = LocalVectorStore(str(tmp_path / "store"), DIMENSIONS, index_type="ivf", nprobe=4)
+    assert_matches_brute_force(reopened, expected, rng)
+
+def test_filtered_query_matches_brute_force(tmp_path, rng):
+    store = LocalVectorStore(str(tmp_path / "store"), DIMENSIONS)
+    expected = {}
+    add(store, expected, make_nodes(rng, [f"node-{i}" for i in range(300)]))
+    filters = MetadataFilters(filters=[ExactMatchFilter(key="parity", value=1)])
+
+    for query_vector in random_vectors(rng, 3):
+        result = store.query(
+            VectorStoreQuery(query_embedding=query_vector.tolist(), similarity_top_k=TOP_K, filters=filters)
+        )
+        assert result.ids == brute_force(expected, query_vector, predicate=lambda metadata: metadata["parity"] == 1)
+
+def test_delete_by_source_document(tmp_path, rng):
+    store = LocalVectorStore(str(tmp_path / "store"), DIMENSIONS, compact_threshold=0)
+    expected = {}
+    add(store, expected, make_nodes(rng, [f"node-{i}" for i in range(20)], source="doc-a"))
+    store.add(make_nodes(rng, [f"node-{i}" for i in range(20, 40)], source="doc-b"))
+
+    store.delete("doc-b")
+
+    assert_matches_brute_force(store, expected, rng)
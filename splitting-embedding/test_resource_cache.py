@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+from fake_aiplatform import FakeAiplatform
+from gcp_index_embed import create_endpoint, create_index, deploy_index_at_endpoint
+from resource_cache import ResourceCache
+
+INDEX_ARGS = (768, "DOT_PRODUCT_DISTANCE", "SHARD_SIZE_SMALL", "STREAM_UPDATE", 150)
+
+@pytest.fixture
+def fake():
+    return FakeAiplatform()
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResourceCache(str(tmp_path / "resources.json"), project="fake-project", region="us-central1")
+
+def deploy(fake, cache, deployed_index_id="deployed_index"):
+    index = create_index("my-index", *INDEX_ARGS, client=fake, cache=cache)
+    endpoint = create_endpoint("my-endpoint", client=fake, cache=cache)
+    deploy_index_at_endpoint(index, endpoint, deployed_index_id, "my-deployed-index", client=fake, cache=cache)
+    return index, endpoint
+
+def test_miss_lists_and_caches(fake, cache):
+    index = create_index("my-index", *INDEX_ARGS, client=fake, cache=cache)
+
+    assert fake.calls["MatchingEngineIndex.list"] == 1
+    assert cache.get("index", "my-index") == {"resource_name": index.resource_name}
+
+def test_hit_skips_list_calls(fake, cache):
+    deploy(fake, cache)
+    fake.calls.clear()
+
+    # a new process reads the same cache file
+    warm_cache = ResourceCache(cache.path, project="fake-project", region="us-central1")
+    index, endpoint = deploy(fake, warm_cache)
+
+    assert fake.calls["MatchingEngineIndex.list"] == 0
+    assert fake.calls["MatchingEngineIndexEndpoint.list"] == 0
+    assert fake.calls["MatchingEngineIndex.deployed_indexes"] == 0
+    assert fake.calls["MatchingEngineIndexEndpoint.deploy_index"] == 0
+    assert index.display_name == "my-index"
+    assert endpoint.display_name == "my-endpoint"
+
+def test_key_is_scoped_by_project_and_region(fake, cache):
+    create_index("my-index", *INDEX_ARGS, client=fake, cache=cache)
+
+    for project, region in (("other-project", "us-central1"), ("fake-project", "europe-west4")):
+        other = ResourceCache(cache.path, project=project, region=region)
+        assert other.get("index", "my-index") is None
+
+def test_expired_entry_is_a_miss(fake, tmp_path):
+    cache = ResourceCache(str(tmp_path / "resources.json"), ttl=0.01)
+    create_index("my-index", *INDEX_ARGS, client=fake, cache=cache)
+    time.sleep(0.02)
+    fake.calls.clear()
+
+    create_index("my-index", *INDEX_ARGS, client=fake, cache=cache)
+
+    assert fake.calls["MatchingEngineIndex.list"] == 1
+
+def test_missing_index_invalidates_and_recreates(fake, cache):
+    stale = create_index("my-index", *INDEX_ARGS, client=fake, cache=cache)
+    del fake.indexes[stale.resource_name]
+    fake.calls.clear()
+
+    index = create_index("my-index", *INDEX_ARGS, client=fake, cache=cache)
+
+    assert index.resource_name != stale.resource_name
+    assert fake.calls["MatchingEngineIndex.list"] == 1
+    assert fake.calls["MatchingEngineIndex.create_tree_ah_index"] == 1
+    assert cache.get("index", "my-index") == {"resource_name": index.resource_name}
+
+def test_renamed_endpoint_invalidates(fake, cache):
+    stale = create_endpoint("my-endpoint", client=fake, cache=cache)
+    fake.endpoints[stale.resource_name]["display_name"] = "renamed"
+    fake.calls.clear()
+
+    endpoint = create_endpoint("my-endpoint", client=fake, cache=cache)
+
+    assert endpoint.resource_name != stale.resource_name
+    assert fake.calls["MatchingEngineIndexEndpoint.create"] == 1
+    assert cache.get("endpoint", "my-endpoint") == {"resource_name": endpoint.resource_name}
+
+def test_deployment_at_other_endpoint_invalidates(fake, cache):
+    index, endpoint = deploy(fake, cache)
+    cache.set("deployment", index.resource_name, {"index_endpoint": "elsewhere", "deployed_index_id": "deployed_index"})
+    fake.calls.clear()
+
+    deploy_index_at_endpoint(index, endpoint, "deployed_index", "my-deployed-index", client=fake, cache=cache)
+
+    assert fake.calls["MatchingEngineIndex.deployed_indexes"] == 1
+    assert cache.get("deployment", index.resource_name) == {
+        "index_endpoint": endpoint.resource_name,
+        "deployed_index_id": "deployed_index",
+    }
+
+def test_deployment_with_other_id_invalidates(fake, cache):
+    index, endpoint = deploy(fake, cache)
+    fake.calls.clear()
+
+    deploy_index_at_endpoint(index, endpoint, "other_id", "my-deployed-index", client=fake, cache=cache)
+
+    assert fake.calls["MatchingEngineIndex.deployed_indexes"] == 1
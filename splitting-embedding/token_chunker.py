@@ -0,0 +1,180 @@
+import re
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from embedding_pipeline import CHARS_PER_TOKEN, MAX_TOKENS_PER_INSTANCE
+from parallel_parsing import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE
+
+# Returns the start offset of every token in a text, in order
+TokenOffsets = Callable[[str], List[int]]
+
+# The gecko tokenizer is not published; word pieces of up to CHARS_PER_TOKEN
+# characters and single punctuation marks approximate its token count
+APPROXIMATE_TOKEN = re.compile(rf"\w{{1,{CHARS_PER_TOKEN}}}|[^\w\s]")
+# A blank line, or a line starting with a numbered heading such as "3.2 Attention"
+SECTION_BOUNDARY = re.compile(r"\n[ \t]*\n\s*|\n(?=[ \t]*\d+(?:\.\d+)*\.?[ \t]+[A-Z])")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+
+def approximate_token_offsets(text:str) -> List[int]:
+    """
+        Finds approximate token start offsets with one regex pass.
+
+        Args:
+        text (str): The text.
+
+        Returns:
+        List[int]: The character offset of each token.
+    """
+    return [match.start() for match in APPROXIMATE_TOKEN.finditer(text)]
+
+def tiktoken_token_offsets(encoding_name:str="cl100k_base") -> TokenOffsets:
+    """
+        Builds a token offset function from a tiktoken encoding.
+
+        Args:
+        encoding_name (str): The tiktoken encoding.
+
+        Returns:
+        TokenOffsets: A function returning the character offset of each token.
+    """
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(encoding_name)
+
+    def token_offsets(text:str) -> List[int]:
+        _, offsets = encoding.decode_with_offsets(encoding.encode(text, disallowed_special=()))
+        return offsets
+
+    return token_offsets
+
+def _boundary_offsets(pattern:re.Pattern, text:str) -> List[int]:
+    # the offset where the text after each boundary starts
+    return [match.end() for match in pattern.finditer(text)]
+
+def _last_before(offsets:Sequence[int], low:int, high:int) -> Optional[int]:
+    # the largest offset in (low, high], or None
+    i = bisect_right(offsets, high) - 1
+    return offsets[i] if i >= 0 and offsets[i] > low else None
+
+def _first_after(offsets:Sequence[int], low:int, high:int) -> Optional[int]:
+    # the smallest offset in [low, high), or None
+    i = bisect_left(offsets, low)
+    return offsets[i] if i < len(offsets) and offsets[i] < high else None
+
+class TokenBudgetChunker(NodeParser):
+    """
+        Splits documents into chunks packed close to a token budget.
+
+        Each document is tokenized once and its section and sentence
+        boundaries are found with one regex pass each; chunk ends are then
+        picked by binary search over those offsets, so the cost per document
+        is a few passes plus O(log n) per chunk rather than a Python loop over
+        sentences.
+
+        A chunk ends at the last section boundary that keeps it at least
+        min_section_fill full, else at the last sentence boundary, else at a
+        token boundary, and never exceeds chunk_size tokens. Chunks never span
+        documents, so with one Document per PDF page (as SimpleDirectoryReader
+        and parallel_parsing produce) they respect page boundaries and carry
+        the page_label and file_name metadata.
+
+        Args:
+        chunk_size (int): The token budget per chunk.
+        chunk_overlap (int): The tokens of overlap, snapped to a sentence start.
+        min_section_fill (float): The fraction of chunk_size a chunk must reach before ending at a section boundary.
+        token_offsets (Optional[TokenOffsets]): The tokenizer. Defaults to approximate_token_offsets.
+    """
+
+    chunk_size: int = Field(
+        default=DEFAULT_CHUNK_SIZE, gt=0, le=MAX_TOKENS_PER_INSTANCE, description="The token budget per chunk."
+    )
+    chunk_overlap: int = Field(
+        default=DEFAULT_CHUNK_OVERLAP, ge=0, description="The tokens of overlap between consecutive chunks."
+    )
+    min_section_fill: float = Field(
+        default=0.5, ge=0.0, le=1.0, description="The fill a chunk must reach before ending at a section boundary."
+    )
+
+    _token_offsets: TokenOffsets = PrivateAttr()
+
+    def __init__(
+        self,
+        chunk_size:int=DEFAULT_CHUNK_SIZE,
+        chunk_overlap:int=DEFAULT_CHUNK_OVERLAP,
+        min_section_fill:float=0.5,
+        token_offsets:Optional[TokenOffsets]=None,
+        **kwargs:Any
+    ):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        super().__init__(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            min_section_fill=min_section_fill,
+            **kwargs,
+        )
+        self._token_offsets = token_offsets or approximate_token_offsets
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TokenBudgetChunker"
+
+    def split_offsets(self, text:str) -> List[Tuple[int, int]]:
+        """
+            Plans the chunks of a text.
+
+            Args:
+            text (str): The text.
+
+            Returns:
+            List[Tuple[int, int]]: The (start, end) character offsets of each chunk.
+        """
+        starts = self._token_offsets(text)
+        count = len(starts)
+        if count == 0:
+            return []
+        if count <= self.chunk_size:
+            return [(starts[0], len(text))]
+        sections = _boundary_offsets(SECTION_BOUNDARY, text)
+        sentences = _boundary_offsets(SENTENCE_BOUNDARY, text)
+        min_section_tokens = int(self.chunk_size * self.min_section_fill)
+
+        chunks = []
+        first = 0
+        while first < count:
+            begin = starts[first]
+            if first + self.chunk_size >= count:
+                chunks.append((begin, len(text)))
+                break
+            # the first token that does not fit
+            limit = starts[first + self.chunk_size]
+            end = (
+                _last_before(sections, starts[first + min_section_tokens], limit)
+                or _last_before(sentences, begin, limit)
+                or limit
+            )
+            chunks.append((begin, end))
+
+            # next chunk starts up to chunk_overlap tokens back, at a sentence start
+            end_token = bisect_left(starts, end)
+            overlap_start = starts[max(first + 1, end_token - self.chunk_overlap)]
+            restart = _first_after(sentences, overlap_start, end) if self.chunk_overlap else None
+            first = bisect_left(starts, restart) if restart is not None else end_token
+        return chunks
+
+    def _parse_nodes(self, nodes:Sequence[BaseNode], show_progress:bool=False, **kwargs:Any) -> List[BaseNode]:
+        parsed = []
+        for node in nodes:
+            text = node.get_content(metadata_mode=MetadataMode.NONE)
+            offsets = [(start, end) for start, end in self.split_offsets(text) if text[start:end].strip()]
+            chunks = build_nodes_from_splits([text[start:end].rstrip() for start, end in offsets], node, id_func=self.id_func)
+            for chunk, (start, end) in zip(chunks, offsets):
+                chunk.start_char_idx = start
+                chunk.end_char_idx = start + len(chunk.text)
+            parsed.extend(chunks)
+        return parsed
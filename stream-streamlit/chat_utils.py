@@ -0,0 +1,467 @@
+import os
+import asyncio
+import logging
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, List, Optional
+
+import httpx
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+logger = logging.getLogger(__name__)
+
+# Connection pool limits shared by every session of the app process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 30.0))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60.0))
+
+# Tokens kept free in the context window for the response
+LLM_RESPONSE_TOKENS = int(os.getenv("LLM_RESPONSE_TOKENS", 1024))
+# Set to fold turns that drop out of the context window into a rolling summary, at the cost of an extra LLM call
+HISTORY_SUMMARY = os.getenv("HISTORY_SUMMARY", "").lower() in ("1", "true", "yes")
+
+# Roughly 4 characters per token for English text, plus a few tokens of role and formatting overhead per message
+CHARS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 4
+
+SUMMARY_PROMPT = """Update the summary of an ongoing conversation with the messages below.
+Keep the facts, names, numbers, decisions and open questions the assistant may need later, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+
+Updated summary:"""
+
+class RenderScheduler:
+    """
+    This class coalesces streamed tokens and renders them into a single chat message on a time and size budget.
+
+    Re-rendering the whole response on every token sends one websocket frame per token and makes each frame
+    as large as the response so far, which is quadratic in the response length.
+    The scheduler instead buffers tokens and flushes them when `interval` seconds have passed since the last frame
+    or `max_chars` characters are pending, so the number of frames is bounded by time rather than by tokens.
+
+    Completed paragraphs (text before a blank line, outside of code fences) are settled into their own markdown element
+    and never sent again; only the paragraph being written is re-rendered, so the total size of the frames
+    grows linearly with the response.
+
+    Args:
+        container: The Streamlit container to render into, e.g. st.chat_message("assistant"). It is created once by the caller.
+        interval (float): The minimum number of seconds between frames.
+        max_chars (int): The number of pending characters that triggers a frame before the interval has passed.
+        clock (Callable[[], float]): The clock used for the interval.
+
+    Attributes:
+        frames (int): The number of frames sent.
+        tokens (int): The number of tokens written.
+    """
+
+    def __init__(self, container: Any, interval: float = 0.05, max_chars: int = 200, clock: Callable[[], float] = time.monotonic):
+        self.container = container
+        self.interval = interval
+        self.max_chars = max_chars
+        self.clock = clock
+        self.frames = 0
+        self.tokens = 0
+        self._settled = []
+        self._tail = ""
+        self._pending = 0
+        self._last_flush = None
+        self._placeholder = container.empty()
+
+    @property
+    def text(self) -> str:
+        """
+        The full text written so far.
+        """
+        return "".join(self._settled) + self._tail
+
+    def write(self, token: str) -> None:
+        """
+        Adds a token, and renders a frame if the time or size budget is reached.
+
+        Args:
+            token (str): The token.
+        """
+        if not token:
+            return
+        self.tokens += 1
+        self._tail += token
+        self._pending += len(token)
+
+        # The first token is rendered at once so the response starts appearing without delay
+        now = self.clock()
+        if self._last_flush is None or now - self._last_flush >= self.interval or self._pending >= self.max_chars:
+            self.flush(now)
+
+    def flush(self, now: float = None) -> None:
+        """
+        Renders the pending text, settling any completed paragraphs.
+
+        Args:
+            now (float): The current clock time, if already known.
+        """
+        if not self._pending:
+            return
+
+        split = self._settle_point()
+        if split:
+            # Render the completed paragraphs one last time in the current element, then start a new one for the rest
+            self._placeholder.markdown(self._tail[:split])
+            self.frames += 1
+            self._settled.append(self._tail[:split])
+            self._tail = self._tail[split:]
+            self._placeholder = self.container.empty()
+
+        if self._tail:
+            self._placeholder.markdown(self._tail)
+            self.frames += 1
+        self._pending = 0
+        self._last_flush = self.clock() if now is None else now
+
+    def close(self) -> str:
+        """
+        Renders any remaining text and logs the number of frames sent.
+
+        Returns:
+            str: The full text.
+        """
+        self.flush()
+        text = self.text
+        logger.info(f"Rendered {len(text)} characters from {self.tokens} tokens in {self.frames} frames")
+        return text
+
+    def _settle_point(self) -> int:
+        """
+        Finds the end of the last completed paragraph in the unsettled text.
+
+        Returns:
+            int: The offset after the last blank line outside a code fence, or 0 if there is none.
+        """
+        split = 0
+        in_fence = False
+        has_text = False
+        offset = 0
+        for line in self._tail.splitlines(keepends=True):
+            offset += len(line)
+            if line.lstrip().startswith("```"):
+                in_fence = not in_fence
+            if line.strip():
+                has_text = True
+            elif has_text and not in_fence and line.endswith("\n") and offset < len(self._tail):
+                split = offset
+        return split
+
+class ClientRegistry:
+    """
+    This class holds the LLM clients of the app process, so messages reuse warm HTTP connections
+    instead of paying TCP and TLS setup on every turn.
+
+    It is meant to be created once per process with st.cache_resource and shared by all sessions and reruns.
+    One httpx.Client with a keep-alive connection pool is shared by every synchronous call.
+    An httpx.AsyncClient can only be used from the event loop it first ran on, so asynchronous clients
+    and the models built on them are kept per event loop, in a WeakKeyDictionary that drops them when their loop goes away.
+
+    Callbacks must not be set on the models, since they are shared; pass them per call with config={"callbacks": [...]}.
+
+    Args:
+        factory (Callable[[httpx.Client, httpx.AsyncClient], Any]): Builds a model, e.g. ChatOpenAI, from the HTTP clients.
+        max_connections (int): The maximum number of connections per pool.
+        max_keepalive_connections (int): The maximum number of idle connections kept open per pool.
+        keepalive_expiry (float): The number of seconds an idle connection is kept open.
+        timeout (float): The request timeout in seconds.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[httpx.Client, httpx.AsyncClient], Any],
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        max_keepalive_connections: int = LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY,
+        timeout: float = LLM_TIMEOUT,
+    ):
+        self.factory = factory
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout)
+        self.http_client = httpx.Client(limits=self.limits, timeout=self.timeout)
+        self._models = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        """
+        Returns the model for the running event loop, building it on first use.
+
+        Returns:
+            Any: The model.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            model = self._models.get(loop)
+            if model is None:
+                http_async_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+                model = self.factory(self.http_client, http_async_client)
+                self._models[loop] = model
+                logger.info(f"Created an LLM client for event loop {id(loop):#x}")
+            return model
+
+class BackgroundLoop:
+    """
+    This class runs one long-lived asyncio event loop in a daemon thread, for the whole app process.
+
+    Streamlit script runs submit coroutines to it instead of calling asyncio.run, which creates and tears down
+    an event loop per prompt. Async HTTP clients and their connection pools are bound to the loop they run on,
+    so with one loop they survive across turns and sessions, and later prompts start on warm connections.
+
+    It is meant to be created once per process with st.cache_resource.
+
+    Attributes:
+        loop (asyncio.AbstractEventLoop): The event loop.
+        thread (threading.Thread): The thread running it.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name="background-event-loop", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine: Awaitable[Any]) -> Future:
+        """
+        Schedules a coroutine on the loop from any thread.
+
+        Args:
+            coroutine (Awaitable[Any]): The coroutine.
+
+        Returns:
+            Future: A concurrent.futures.Future for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine: Awaitable[Any], timeout: float = None) -> Any:
+        """
+        Runs a coroutine on the loop and waits for its result in the calling thread.
+
+        Args:
+            coroutine (Awaitable[Any]): The coroutine.
+            timeout (float): The number of seconds to wait, or None to wait until it finishes.
+
+        Returns:
+            Any: The result of the coroutine.
+        """
+        return self.submit(coroutine).result(timeout)
+
+    def iterate(self, async_iterator: AsyncIterator[Any]) -> Iterator[Any]:
+        """
+        Consumes an async iterator on the loop and yields its items in the calling thread.
+
+        Items are passed through a queue.Queue, so the caller, e.g. the Streamlit script thread, can render them
+        with Streamlit calls, which only work from the script thread. If the caller stops early, for example
+        because the user pressed Stop, the consumer on the loop is cancelled.
+
+        Args:
+            async_iterator (AsyncIterator[Any]): The async iterator, e.g. an async generator.
+
+        Yields:
+            Any: The items, in order.
+        """
+        items = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in async_iterator:
+                    items.put((item, None))
+            except Exception as e:
+                items.put((None, e))
+            finally:
+                items.put((done, None))
+                aclose = getattr(async_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+
+        future = self.submit(pump())
+        try:
+            while True:
+                item, error = items.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+def approximate_token_count(text: str) -> int:
+    """
+    Estimates the number of tokens in a text without a tokenizer.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def make_llm_summarizer(get_llm: Callable[[], Any], max_words: int = 150) -> Callable[[str, List[BaseMessage]], Awaitable[str]]:
+    """
+    Builds a summarizer for ChatHistoryManager that asks the chat model to update the rolling summary.
+
+    Args:
+        get_llm (Callable[[], Any]): Returns the chat model, e.g. the get method of a ClientRegistry.
+        max_words (int): The maximum length of the summary in words.
+
+    Returns:
+        Callable[[str, List[BaseMessage]], Awaitable[str]]: An async function from the current summary and the
+        messages to fold in, to the updated summary.
+    """
+    async def summarize(summary: str, messages: List[BaseMessage]) -> str:
+        transcript = "\n".join(f"{message.type}: {message.content}" for message in messages)
+        prompt = SUMMARY_PROMPT.format(max_words=max_words, summary=summary or "(none)", transcript=transcript)
+        result = await get_llm().ainvoke([HumanMessage(content=prompt)])
+        return result.content.strip()
+
+    return summarize
+
+class ChatHistoryManager:
+    """
+    This class turns the chat history into the messages sent to the model, within a token budget.
+
+    Each chat message is converted to a LangChain message and counted once, when it is first seen, and the
+    converted messages are kept, so a turn only processes the messages added since the previous one. If an
+    earlier message was edited or removed, the messages and the summary are rebuilt from the whole history.
+    System messages are always sent. The other messages are sent newest first for as long as they fit in
+    `context_tokens - response_tokens`, so the prompt stops growing once the conversation fills the window.
+
+    With a summarizer, the turns that drop out of the window are folded into a rolling summary, which is sent
+    as a system message in their place. Each turn is summarized once, when it first drops out.
+
+    It is meant to be kept per session in st.session_state.
+
+    Args:
+        context_tokens (int): The context window of the model.
+        response_tokens (int): The tokens kept free for the response.
+        count_tokens (Callable[[str], int]): Counts the tokens of a text, e.g. llm.get_num_tokens.
+        summarize (Callable[[str, List[BaseMessage]], Awaitable[str]]): Updates the rolling summary, e.g. from
+            make_llm_summarizer. Older turns are dropped without a summary if None.
+
+    Attributes:
+        summary (str): The rolling summary of the turns outside the window.
+    """
+
+    MESSAGE_TYPES = {"user": HumanMessage, "assistant": AIMessage, "system": SystemMessage}
+
+    def __init__(
+        self,
+        context_tokens: int,
+        response_tokens: int = LLM_RESPONSE_TOKENS,
+        count_tokens: Callable[[str], int] = approximate_token_count,
+        summarize: Optional[Callable[[str, List[BaseMessage]], Awaitable[str]]] = None,
+    ):
+        self.budget = context_tokens - response_tokens
+        self.count_tokens = count_tokens
+        self.summarize = summarize
+        self.summary = ""
+        self._summary_tokens = 0
+        self._summarized = 0
+        self._entries = []
+        self._consumed = []
+
+    def _sync(self, chat_history: list) -> None:
+        """
+        Converts and counts the chat messages added since the last call.
+
+        Args:
+            chat_history (list): The chat history, as dictionaries with 'role' and 'content' keys.
+        """
+        # Every history item seen so far, including the roles that are not sent, so edits anywhere are detected
+        consumed = len(self._consumed)
+        if consumed > len(chat_history) or any(
+            (message["role"], message["content"]) != seen
+            for message, seen in zip(chat_history[:consumed], self._consumed)
+        ):
+            # The history was edited or cleared rather than appended to, so start over
+            logger.info("Chat history changed, rebuilding the converted messages")
+            self._entries = []
+            self._consumed = []
+            self.summary = ""
+            self._summary_tokens = 0
+            self._summarized = 0
+            consumed = 0
+
+        for message in chat_history[consumed:]:
+            self._consumed.append((message["role"], message["content"]))
+            message_type = self.MESSAGE_TYPES.get(message["role"])
+            if message_type is None:
+                continue
+            content = message["content"]
+            self._entries.append((message_type(content=content), self.count_tokens(content) + TOKENS_PER_MESSAGE))
+
+    async def build(self, chat_history: list) -> List[BaseMessage]:
+        """
+        Returns the messages to send for the next turn.
+
+        Args:
+            chat_history (list): The chat history, ending with the user's new message.
+
+        Returns:
+            List[BaseMessage]: The system messages, the summary if any, and the newest messages that fit the budget.
+        """
+        self._sync(chat_history)
+        system = [entry for entry in self._entries if isinstance(entry[0], SystemMessage)]
+        turns = [entry for entry in self._entries if not isinstance(entry[0], SystemMessage)]
+
+        system_tokens = sum(tokens for _, tokens in system)
+        start, used = self._window(turns, system_tokens)
+
+        if self.summarize is not None and start > self._summarized:
+            self.summary = await self.summarize(self.summary, [message for message, _ in turns[self._summarized:start]])
+            self._summary_tokens = self.count_tokens(self.summary) + TOKENS_PER_MESSAGE
+            self._summarized = start
+            logger.info(f"Folded {start} messages into a {self._summary_tokens}-token summary")
+            # The summary may have grown, so fit the window again; messages it pushes out are folded in next turn
+            start, used = self._window(turns, system_tokens)
+
+        messages = [message for message, _ in system]
+        if self.summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation: {self.summary}"))
+        messages.extend(message for message, _ in turns[start:])
+        logger.info(f"Sending {len(turns) - start} of {len(turns)} messages, about {used} of {self.budget} tokens")
+        return messages
+
+    def _window(self, turns: list, system_tokens: int) -> tuple:
+        """
+        Finds the newest messages that fit the budget next to the system messages and the summary.
+
+        Args:
+            turns (list): The converted user and assistant messages.
+            system_tokens (int): The tokens of the system messages.
+
+        Returns:
+            tuple: The index of the first message to send, and the tokens used in total.
+        """
+        # Fill the budget from the newest message backwards; the newest message is always sent
+        used = system_tokens + self._summary_tokens
+        start = len(turns)
+        while start > 0 and (start == len(turns) or used + turns[start - 1][1] <= self.budget):
+            used += turns[start - 1][1]
+            start -= 1
+        # Start the window on a user message, so it does not open with an answer to a dropped question
+        while start < len(turns) - 1 and not isinstance(turns[start][0], HumanMessage):
+            used -= turns[start][1]
+            start += 1
+        return start, used
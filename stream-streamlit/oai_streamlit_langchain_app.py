@@ -1,11 +1,23 @@
+import io
 import os
+import re
+import time
 import logging
-import asyncio
+from typing import AsyncGenerator, Callable
 import streamlit as st
 from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage, AIMessage
+from langchain.schema import HumanMessage
 from langchain.callbacks.base import BaseCallbackHandler
 
+from chat_utils import (
+    HISTORY_SUMMARY,
+    BackgroundLoop,
+    ChatHistoryManager,
+    ClientRegistry,
+    RenderScheduler,
+    make_llm_summarizer,
+)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -13,31 +25,53 @@ openai_api_key = os.getenv('OPENAI_API_KEY')
 if not openai_api_key:
     logger.error("OpenAI API Key is not set. Please set the API key in the environment variables.")
 
+# The context window of gpt-3.5-turbo, in tokens
+CONTEXT_TOKENS = 16385
+
 class StreamHandler(BaseCallbackHandler):
     """
     This class is designed to handle streaming responses from an AI model and buffer the tokens that are generated.
-    The class provides methods to add tokens to the buffer, process the tokens in the buffer, and check if the buffer is full. 
-    These methods can be overridden in a subclass to customize the behavior of the class.
+    Tokens arrive through the on_llm_new_token callback and are appended to a StringIO buffer, which grows in place
+    instead of re-allocating a list of tokens and joining it on every flush.
 
-    The purpose of this class is to manage the flow of data in a streaming context, where the AI model generates tokens one at a time instead of all at once. 
-    This is particularly useful for applications that need to process or display the tokens as they are generated, such as a chatbot or a real-time text generation tool.
+    The buffer is flushed adaptively rather than per token:
+    - at once for the first token, so time-to-first-token is not delayed by buffering,
+    - when it holds `max_bytes` bytes of UTF-8 text,
+    - when `max_delay` seconds have passed since the first token in it arrived,
+    - when a token ends a sentence or a line, so the text shown to the user breaks at natural points.
 
-    The class provides a buffer to store the tokens that are generated. 
-    The size of the buffer can be specified when the class is instantiated. 
-    When the buffer is full, the class processes the tokens in the buffer and then clears the buffer to make room for new tokens.
+    The class also measures time-to-first-token (from the start of the request) and the latency between
+    the chunks it yields, and logs a summary once the response ends.
 
     Args:
-        buffer_size (int): The maximum size of the buffer.
+        max_bytes (int): The buffered size in bytes that triggers a flush.
+        max_delay (float): The number of seconds a token may wait in the buffer before a flush.
+        flush_on_sentence (bool): Whether to flush when a token ends a sentence or a line.
+        clock (Callable[[], float]): The clock used for the delay and the latency metrics.
 
     Attributes:
-        buffer (list): A list to store the tokens.
-        buffer_size (int): The maximum size of the buffer.
-
+        buffer (io.StringIO): The buffered text.
+        time_to_first_token (float): The seconds from the start of the request to the first token, or None.
+        chunk_latencies (list): The seconds between consecutive yielded chunks.
     """
 
-    def __init__(self, buffer_size=5):
-        self.buffer = []
-        self.buffer_size = buffer_size
+    # A sentence end, optionally followed by closing quotes or brackets and whitespace, or a newline
+    SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s*$|\n$")
+
+    def __init__(self, max_bytes: int = 128, max_delay: float = 0.05, flush_on_sentence: bool = True, clock: Callable[[], float] = time.perf_counter):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.flush_on_sentence = flush_on_sentence
+        self.clock = clock
+        self.buffer = io.StringIO()
+        self.time_to_first_token = None
+        self.chunk_latencies = []
+        self._buffered_bytes = 0
+        self._buffered_since = None
+        self._sentence_ended = False
+        self._started_at = None
+        self._last_chunk_at = None
+        self._chunks = 0
 
     async def handle_response(self, response):
             """
@@ -47,19 +81,16 @@ class StreamHandler(BaseCallbackHandler):
                 response: The response received from the stream.
 
             Yields:
-                str: The text yielded from the buffer when it reaches the buffer size or when the response ends.
+                str: The buffered text, each time a flush condition is met and when the response ends.
             """
-            async for token in response:
-                self.on_llm_new_token(token)
-                if len(self.buffer) >= self.buffer_size:
-                    text = ''.join(self.buffer)
-                    self.buffer = []
-                    logger.info(f"Buffer full, yielding text: {text}")
-                    yield text
-            if self.buffer:
-                text = ''.join(self.buffer)
-                self.buffer = []
-                yield text
+            self._started_at = self.clock()
+            async for _ in response:
+                # The tokens themselves are buffered by the on_llm_new_token callback while the stream is consumed
+                if self.should_flush():
+                    yield self.flush()
+            if self._buffered_bytes:
+                yield self.flush()
+            self.log_metrics()
 
     def on_llm_new_token(self, token: str, **kwargs):
         """
@@ -69,55 +100,127 @@ class StreamHandler(BaseCallbackHandler):
             token (str): The new token.
 
         """
-        if isinstance(token, str):
-            self.buffer.append(token)
+        if not isinstance(token, str) or not token:
+            return
+        now = self.clock()
+        if self.time_to_first_token is None and self._started_at is not None:
+            self.time_to_first_token = now - self._started_at
+        if self._buffered_since is None:
+            self._buffered_since = now
+        self.buffer.write(token)
+        self._buffered_bytes += len(token.encode("utf-8"))
+        self._sentence_ended = self.flush_on_sentence and self.SENTENCE_END.search(token) is not None
+
+    def should_flush(self) -> bool:
+        """
+        Checks whether the buffered text should be yielded now.
+
+        Returns:
+            bool: True if the buffer is not empty and a flush condition is met.
+        """
+        if not self._buffered_bytes:
+            return False
+        return (
+            self._chunks == 0
+            or self._buffered_bytes >= self.max_bytes
+            or self.clock() - self._buffered_since >= self.max_delay
+            or self._sentence_ended
+        )
+
+    def flush(self) -> str:
+        """
+        Empties the buffer and records the latency since the previous chunk.
+
+        Returns:
+            str: The buffered text.
+        """
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self._buffered_bytes = 0
+        self._buffered_since = None
+        self._sentence_ended = False
+
+        now = self.clock()
+        if self._last_chunk_at is not None:
+            self.chunk_latencies.append(now - self._last_chunk_at)
+        self._last_chunk_at = now
+        self._chunks += 1
+        logger.debug(f"Flushing {len(text)} characters")
+        return text
+
+    def log_metrics(self) -> None:
+        """
+        Logs time-to-first-token and the inter-chunk latency of the response.
+        """
+        if self.time_to_first_token is None:
+            logger.info("Stream ended without tokens")
+            return
+        latencies = sorted(self.chunk_latencies) or [0.0]
+        logger.info(
+            f"Streamed {self._chunks} chunks, time to first token {self.time_to_first_token * 1000:.0f} ms, "
+            f"inter-chunk latency p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+            f"max {latencies[-1] * 1000:.0f} ms"
+        )
+
+
+@st.cache_resource
+def get_background_loop() -> BackgroundLoop:
+    """
+    Starts the event loop thread once per process; st.cache_resource shares it across reruns and sessions.
 
-async def generate_response(input_text: str, chat_history: list) -> Generator[str, None, None]:
+    Returns:
+        BackgroundLoop: The background event loop.
+    """
+    return BackgroundLoop()
+
+@st.cache_resource
+def get_llm_clients() -> ClientRegistry:
+    """
+    Creates the ChatOpenAI clients once per process; st.cache_resource shares them across reruns and sessions.
+
+    Returns:
+        ClientRegistry: The registry, which builds one ChatOpenAI per event loop on pooled HTTP clients.
+    """
+    return ClientRegistry(
+        lambda http_client, http_async_client: ChatOpenAI(
+            model_name="gpt-3.5-turbo",
+            temperature=0.5,
+            openai_api_key=openai_api_key,
+            streaming=True,
+            http_client=http_client,
+            http_async_client=http_async_client,
+        )
+    )
+
+async def generate_response(input_text: str, chat_history: list, history: ChatHistoryManager) -> AsyncGenerator[str, None]:
     """
     Generates a response using the ChatOpenAI model.
 
     Args:
         input_text (str): The user's input text.
         chat_history (list): The chat history containing previous messages.
+        history (ChatHistoryManager): The session's history manager, which selects the messages to send.
 
     Yields:
         str: The generated response tokens.
 
     Returns:
-        Generator[str, None, None]: A generator that yields the response tokens.
+        AsyncGenerator: An asynchronous generator that yields the response tokens.
     """
-    handler = StreamHandler(buffer_size=1)
-    llm = ChatOpenAI(
-        model_name="gpt-3.5-turbo",
-        temperature=0.5,
-        openai_api_key=openai_api_key,
-        streaming=True,
-        callbacks=[handler]
-    )
+    handler = StreamHandler()
+    # The model is shared across messages and sessions, so the handler is passed per call rather than set on it
+    llm = get_llm_clients().get()
 
-    messages = []
-
-    # Iterate over each message in the chat history and create a corresponding message object
-    for message in chat_history:
-        # HumanMessage is a class that represents a message sent by the user in the chat.
-        # It takes the content of the message as an argument.
-        if message["role"] == "user":
-            messages.append(HumanMessage(content=message["content"]))
-        # AIMessage is a class that represents a message generated by the AI assistant in the chat.
-        # It takes the content of the message as an argument.
-        elif message["role"] == "assistant":
-            messages.append(AIMessage(content=message["content"]))
-        # SystemMessage is a class that represents a system-generated message in the chat.
-        # These messages are typically used for instructions or notifications.
-        # It takes the content of the message as an argument.
-        elif message["role"] == "system":
-            messages.append(SystemMessage(content=message["content"]))
-    
-    # After processing all messages in the chat history, append a new HumanMessage with the input text
-    messages.append(HumanMessage(content=input_text))
+    # Convert only the messages added since the last turn, and keep the newest ones that fit the context window
+    messages = await history.build(chat_history)
+
+    # The chat history normally ends with the user's input text already; append it only if it does not
+    if not chat_history or chat_history[-1] != {"role": "user", "content": input_text}:
+        messages.append(HumanMessage(content=input_text))
 
     try:
-        response = llm.astream(messages)
+        response = llm.astream(messages, config={"callbacks": [handler]})
     except Exception as e:
         logger.error("Error during response generation: %s", e, exc_info=True)
         yield "Error generating response."
@@ -125,9 +228,10 @@ async def generate_response(input_text: str, chat_history: list) -> Generator[st
     async for token in handler.handle_response(response):
         yield token
 
-async def generate_and_display_response(prompt: str, messages: list) -> str:
+def generate_and_display_response(prompt: str, messages: list) -> str:
     """
-    Generates and displays a response based on the given prompt and messages.
+    Streamlit function that generates and displays a response based on the given prompt and messages.
+    The response is generated on the background event loop, and its tokens are rendered here in the script thread.
 
     Args:
         prompt (str): The prompt for generating the response.
@@ -138,39 +242,36 @@ async def generate_and_display_response(prompt: str, messages: list) -> str:
 
     """
 
-    # Create an empty Streamlit container to display the assistant's message
-    assistant_message_container = st.empty()
+    # Create the assistant's chat message once; the render scheduler updates it in place as tokens arrive
+    renderer = RenderScheduler(st.chat_message("assistant"))
+
+    # Call the generate_response function with the user's prompt and the chat history
+    # This function returns an asynchronous generator that yields the assistant's response one token at a time
+    async_gen = generate_response(prompt, messages, st.session_state.history)
+
+    # Run the async generator on the background event loop and iterate over its tokens in this thread
+    for token in get_background_loop().iterate(async_gen):
+        # Buffer the token; a frame is rendered every 50 ms or 200 characters rather than on every token
+        renderer.write(token)
+
+    # Render the rest of the response and log the number of frames sent
+    assistant_message = renderer.close()
 
-    response = ""
-    assistant_message = ""
-    
-    # Create a new container within the assistant_message_container
-    with assistant_message_container.container():
-        
-        # Call the generate_response function with the user's prompt and the chat history
-        # This function returns an asynchronous generator that yields the assistant's response one token at a time
-        async_gen = generate_response(prompt, messages)
-        
-        # Iterate over the tokens generated by the async generator
-        async for token in async_gen:
-            # Add the current token to the full response
-            response += token
-            
-            # Add the current token to the assistant's message
-            assistant_message += token
-            
-            # Display the assistant's message in the Streamlit container
-            # The message is updated with each new token, creating a typing effect
-            assistant_message_container.chat_message("assistant").markdown(assistant_message)
-    
     st.session_state.messages.append({"role": "assistant", "content": assistant_message})
-    return response
+    return assistant_message
 
 st.title("Simple Chat")
 
 if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "system", "content": "You are a helpful assistant."}]
 
+# Keep a history manager per session, so converted messages and token counts are reused across turns
+if "history" not in st.session_state:
+    st.session_state.history = ChatHistoryManager(
+        CONTEXT_TOKENS,
+        summarize=make_llm_summarizer(get_llm_clients().get) if HISTORY_SUMMARY else None,
+    )
+
 # Iterate over each message in the session state's messages
 for message in st.session_state.messages:
     # Check if the role of the message is not 'system'
@@ -204,6 +305,7 @@ if prompt := st.chat_input(st.session_state.current_prompt):
         st.markdown(prompt)
 
     # Run the 'generate_and_display_response' function to generate a response from the AI assistant and display it in the chat.
-    # The 'asyncio.run' function is used to run the 'generate_and_display_response' function, which is an asynchronous function.
+    # The response is generated on the process-wide background event loop rather than a new loop per prompt,
+    # so the async HTTP clients and their connection pools are reused across turns.
     # The 'generate_and_display_response' function takes the user's prompt and the chat history as arguments.
-    asyncio.run(generate_and_display_response(prompt, st.session_state.messages))
+    generate_and_display_response(prompt, st.session_state.messages)
@@ -1,10 +1,18 @@
 import os
 import logging
-import asyncio
 from typing import AsyncGenerator
 import streamlit as st
 from langchain_groq import ChatGroq
-from langchain.schema import HumanMessage, SystemMessage, AIMessage
+from langchain.schema import HumanMessage
+
+from chat_utils import (
+    HISTORY_SUMMARY,
+    BackgroundLoop,
+    ChatHistoryManager,
+    ClientRegistry,
+    RenderScheduler,
+    make_llm_summarizer,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,13 +21,46 @@ groq_api_key = os.getenv('GROQ_API_KEY')
 if not groq_api_key:
     logger.error("Groq API Key is not set. Please set the API key in the environment variables.")
 
-async def generate_response(input_text: str, chat_history: list) -> AsyncGenerator[str, None]:
+# The context window of llama3-70b-8192, in tokens
+CONTEXT_TOKENS = 8192
+
+@st.cache_resource
+def get_background_loop() -> BackgroundLoop:
+    """
+    Starts the event loop thread once per process; st.cache_resource shares it across reruns and sessions.
+
+    Returns:
+        BackgroundLoop: The background event loop.
+    """
+    return BackgroundLoop()
+
+@st.cache_resource
+def get_llm_clients() -> ClientRegistry:
+    """
+    Creates the ChatGroq clients once per process; st.cache_resource shares them across reruns and sessions.
+
+    Returns:
+        ClientRegistry: The registry, which builds one ChatGroq per event loop on pooled HTTP clients.
+    """
+    return ClientRegistry(
+        lambda http_client, http_async_client: ChatGroq(
+            model_name="llama3-70b-8192",
+            temperature=0.2,
+            groq_api_key=groq_api_key,
+            streaming=True,
+            http_client=http_client,
+            http_async_client=http_async_client,
+        )
+    )
+
+async def generate_response(input_text: str, chat_history: list, history: ChatHistoryManager) -> AsyncGenerator[str, None]:
     """
     Generates a response using the ChatGroq model.
 
     Args:
         input_text (str): The user's input text.
         chat_history (list): The chat history containing previous messages.
+        history (ChatHistoryManager): The session's history manager, which selects the messages to send.
 
     Yields:
         str: The generated response tokens.
@@ -27,42 +68,15 @@ async def generate_response(input_text: str, chat_history: list) -> AsyncGenerat
     Returns:
         AsyncGenerator: An asynchronous generator that yields the response tokens.
     """
-    llm = ChatGroq(
-        model_name="llama3-70b-8192",
-        temperature=0.2,
-        groq_api_key=groq_api_key,
-        streaming=True,
-    )
+    # The model is shared across messages and sessions, and reuses their warm connections
+    llm = get_llm_clients().get()
 
-    messages = []
-
-    # Iterate over each message in the chat history and create a corresponding message object
-    for message in chat_history:
-        if message["role"] == "user":
-            # Create a HumanMessage object for the user's message.
-            # The HumanMessage class represents a message sent by the user in the chat.
-            # It takes the content of the message as an argument.
-            human_message = HumanMessage(content=message["content"])
-            messages.append(human_message)
-            logger.info(f"Appended HumanMessage: {human_message}")
-        elif message["role"] == "assistant":
-            # Create an AIMessage object for the assistant's message.
-            # The AIMessage class represents a message generated by the AI assistant in the chat.
-            # It takes the content of the message as an argument.
-            ai_message = AIMessage(content=message["content"])
-            messages.append(ai_message)
-            logger.info(f"Appended AIMessage: {ai_message}")
-        elif message["role"] == "system":
-            # Create a SystemMessage object for the system message.
-            # The SystemMessage class represents a system-generated message in the chat.
-            # These messages are typically used for instructions or notifications.
-            # It takes the content of the message as an argument.
-            system_message = SystemMessage(content=message["content"])
-            messages.append(system_message)
-            logger.info(f"Appended SystemMessage: {system_message}")
-    
-    # After processing all messages in the chat history, append a new HumanMessage with the input text
-    messages.append(HumanMessage(content=input_text))
+    # Convert only the messages added since the last turn, and keep the newest ones that fit the context window
+    messages = await history.build(chat_history)
+
+    # The chat history normally ends with the user's input text already; append it only if it does not
+    if not chat_history or chat_history[-1] != {"role": "user", "content": input_text}:
+        messages.append(HumanMessage(content=input_text))
 
     try:
         # Call the astream method of the ChatGroq model to generate a response based on the input text and chat history
@@ -76,9 +90,10 @@ async def generate_response(input_text: str, chat_history: list) -> AsyncGenerat
     async for token in response:
         yield token.content
 
-async def generate_and_display_response(prompt: str, messages: list) -> str:
+def generate_and_display_response(prompt: str, messages: list) -> str:
     """
-    Async Streamlit function that generates and displays a response based on the given prompt and messages.
+    Streamlit function that generates and displays a response based on the given prompt and messages.
+    The response is generated on the background event loop, and its tokens are rendered here in the script thread.
 
     Args:
         prompt (str): The prompt for generating the response.
@@ -89,40 +104,37 @@ async def generate_and_display_response(prompt: str, messages: list) -> str:
 
     """
 
-    # Create an empty Streamlit container to display the assistant's message
-    assistant_message_container = st.empty()
+    # Create the assistant's chat message once; the render scheduler updates it in place as tokens arrive
+    renderer = RenderScheduler(st.chat_message("assistant"))
+
+    # Call the generate_response function with the user's prompt and the chat history
+    # This function returns an asynchronous generator that yields the assistant's response
+    async_gen = generate_response(prompt, messages, st.session_state.history)
+
+    # Run the async generator on the background event loop and iterate over its tokens in this thread
+    for token in get_background_loop().iterate(async_gen):
+        # Buffer the token; a frame is rendered every 50 ms or 200 characters rather than on every token
+        renderer.write(token)
+
+    # Render the rest of the response and log the number of frames sent
+    assistant_message = renderer.close()
 
-    response = ""
-    assistant_message = ""
-    
-    # Create a new container within the assistant_message_container
-    with assistant_message_container.container():
-        
-        # Call the generate_response function with the user's prompt and the chat history
-        # This function returns an asynchronous generator that yields the assistant's response
-        async_gen = generate_response(prompt, messages)
-        
-        # Iterate over the tokens generated by the async generator
-        async for token in async_gen:
-            # Add the current token to the full response
-            response += token
-            
-            # Add the current token to the assistant's message
-            assistant_message += token
-            
-            # Display the assistant's message in the Streamlit container
-            # The message is updated with each new token, creating a typing effect
-            assistant_message_container.chat_message("assistant").markdown(assistant_message)
-    
     st.session_state.messages.append({"role": "assistant", "content": assistant_message})
     
-    return response
+    return assistant_message
 
 st.title("Groq Chat")
 
 if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "system", "content": "You are a helpful assistant."}]
 
+# Keep a history manager per session, so converted messages and token counts are reused across turns
+if "history" not in st.session_state:
+    st.session_state.history = ChatHistoryManager(
+        CONTEXT_TOKENS,
+        summarize=make_llm_summarizer(get_llm_clients().get) if HISTORY_SUMMARY else None,
+    )
+
 # Iterate over each message in the session state's messages
 for message in st.session_state.messages:
     # Check if the role of the message is not 'system'
@@ -156,9 +168,10 @@ if prompt := st.chat_input(st.session_state.current_prompt):
         st.markdown(prompt)
 
     # Run the 'generate_and_display_response' function to generate a response from the AI assistant and display it in the chat.
-    # The 'asyncio.run' function is used to run the 'generate_and_display_response' function, which is an asynchronous function.
+    # The response is generated on the process-wide background event loop rather than a new loop per prompt,
+    # so the async HTTP clients and their connection pools are reused across turns.
     # The 'generate_and_display_response' function takes the user's prompt and the chat history as arguments.
-    asyncio.run(generate_and_display_response(prompt, st.session_state.messages))
+    generate_and_display_response(prompt, st.session_state.messages)
 
     # Update the current prompt in the session state to prompt the user to ask a follow-up question.
     if st.session_state.current_prompt == "Ask me anything...":
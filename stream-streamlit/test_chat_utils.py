@@ -0,0 +1,93 @@
+import asyncio
+
+from chat_utils import ChatHistoryManager
+
+def count_words(text):
+    return len(text.split())
+
+def conversation(*contents):
+    # alternating user and assistant messages, starting with the user
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": content} for i, content in enumerate(contents)]
+
+def sent(messages):
+    return [(message.type, message.content) for message in messages]
+
+class Summarizer:
+    """
+        Records the messages it folds in and returns a one-word summary.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, summary, messages):
+        self.calls.append([message.content for message in messages])
+        return f"summary{len(self.calls)}"
+
+def manager(context_tokens, summarize=None):
+    # every one-word message costs 5 tokens, with the per-message overhead
+    return ChatHistoryManager(context_tokens, response_tokens=0, count_tokens=count_words, summarize=summarize)
+
+def test_window_keeps_the_newest_messages_within_budget():
+    history = manager(20)
+    chat_history = [{"role": "system", "content": "brief"}] + conversation("u1", "a1", "u2", "a2", "u3")
+
+    messages = asyncio.run(history.build(chat_history))
+
+    assert sent(messages) == [("system", "brief"), ("human", "u2"), ("ai", "a2"), ("human", "u3")]
+
+def test_window_starts_on_a_user_message():
+    history = manager(20)
+
+    messages = asyncio.run(history.build(conversation("u1", "a1", "u2", "a2", "u3")))
+
+    # a1 would fit, but would answer a question that is not sent
+    assert sent(messages) == [("human", "u2"), ("ai", "a2"), ("human", "u3")]
+
+def test_dropped_turns_are_folded_into_the_summary_once():
+    summarize = Summarizer()
+    history = manager(20, summarize)
+    chat_history = conversation("u1", "a1", "u2", "a2", "u3")
+
+    messages = asyncio.run(history.build(chat_history))
+    assert summarize.calls == [["u1", "a1"]]
+    assert sent(messages) == [
+        ("system", "Summary of the earlier conversation: summary1"), ("human", "u2"), ("ai", "a2"), ("human", "u3")
+    ]
+
+    chat_history += [{"role": "assistant", "content": "a3"}, {"role": "user", "content": "u4"}]
+    messages = asyncio.run(history.build(chat_history))
+    assert summarize.calls == [["u1", "a1"], ["u2", "a2"]]
+    assert sent(messages) == [
+        ("system", "Summary of the earlier conversation: summary2"), ("human", "u3"), ("ai", "a3"), ("human", "u4")
+    ]
+
+def test_edited_history_is_rebuilt():
+    history = manager(1000)
+    asyncio.run(history.build(conversation("hi", "ok")))
+
+    messages = asyncio.run(history.build(conversation("other", "ok", "x")))
+
+    assert sent(messages) == [("human", "other"), ("ai", "ok"), ("human", "x")]
+
+def test_edit_resets_the_summary():
+    summarize = Summarizer()
+    history = manager(20, summarize)
+    asyncio.run(history.build(conversation("u1", "a1", "u2", "a2", "u3")))
+
+    messages = asyncio.run(history.build(conversation("u1", "a1")))
+
+    assert history.summary == ""
+    assert sent(messages) == [("human", "u1"), ("ai", "a1")]
+
+def test_unsent_roles_do_not_force_a_rebuild():
+    summarize = Summarizer()
+    history = manager(20, summarize)
+    chat_history = [{"role": "tool", "content": "lookup"}] + conversation("u1", "a1", "u2", "a2", "u3")
+    asyncio.run(history.build(chat_history))
+
+    chat_history += [{"role": "assistant", "content": "a3"}, {"role": "user", "content": "u4"}]
+    asyncio.run(history.build(chat_history))
+
+    # a rebuild would fold u1 and a1 again
+    assert summarize.calls == [["u1", "a1"], ["u2", "a2"]]